@@ -0,0 +1,176 @@
+import asyncio
+import datetime
+import email.utils
+import math
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+def get_status_code(error: Exception) -> Optional[int]:
+    """Best-effort HTTP status code of an SDK exception."""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        response = getattr(error, "response", None) or getattr(error, "raw_response", None)
+        status = getattr(response, "status_code", None)
+    return status
+
+
+def get_retry_after(error: Exception) -> Optional[float]:
+    """Seconds requested by a Retry-After header on the error's response (delta-seconds or HTTP date), if any."""
+    headers = getattr(error, "headers", None)
+    if headers is None:
+        response = getattr(error, "response", None) or getattr(error, "raw_response", None)
+        headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after") or headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    # A malformed header must not hide the provider error it came with
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if date is None:
+        return None
+    if date.tzinfo is None:
+        # HTTP dates are in GMT
+        date = date.replace(tzinfo=datetime.timezone.utc)
+    return max(0.0, date.timestamp() - time.time())
+
+
+def is_timeout(error: Exception) -> bool:
+    """True for timeouts of any HTTP stack (TimeoutError, httpx.TimeoutException, ...)."""
+    return isinstance(error, TimeoutError) or "Timeout" in type(error).__name__
+
+
+def is_throttled(error: Exception) -> bool:
+    """True for errors that mean the provider is overloaded: 429/5xx responses and timeouts."""
+    return get_status_code(error) in RETRYABLE_STATUS_CODES or is_timeout(error)
+
+
+class AdaptiveLimiter:
+    """
+    AIMD limit on the number of in-flight requests to one provider/model.
+
+    Every success adds 1/window to the window (about +1 per round of requests) as long as
+    latency stays within `latency_tolerance` times the best latency seen; a throttling error
+    (429, 5xx or timeout) halves it, at most once per round trip so one burst of errors counts
+    once. A Retry-After on the error pauses every new request until it has passed.
+    """
+
+    def __init__(self, initial: float = 4, min_window: float = 1, max_window: float = 64,
+                 decrease: float = 0.5, latency_tolerance: float = 3.0):
+        self.window = float(initial)
+        self.min_window = float(min_window)
+        self.max_window = float(max_window)
+        self.decrease = decrease
+        self.latency_tolerance = latency_tolerance
+        self.in_flight = 0
+        self.peak_window = self.window
+        self.decreases = 0
+        self.throttled = 0
+        self.latency_ewma: Optional[float] = None
+        self.latency_floor: Optional[float] = None
+        self.paused_until = 0.0
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+
+    def acquire(self) -> float:
+        """Wait for a free slot in the window; returns the seconds spent waiting."""
+        start = time.monotonic()
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    self._condition.wait(self.paused_until - now)
+                elif self.in_flight >= math.floor(self.window):
+                    self._condition.wait()
+                else:
+                    break
+            self.in_flight += 1
+        return time.monotonic() - start
+
+    def try_acquire(self) -> bool:
+        """Take a free slot if there is one, without waiting."""
+        with self._condition:
+            if time.monotonic() < self.paused_until or self.in_flight >= math.floor(self.window):
+                return False
+            self.in_flight += 1
+            return True
+
+    async def acquire_async(self, poll_interval: float = 0.01) -> float:
+        """Asyncio version of `acquire`: polls for a free slot without blocking the event loop."""
+        start = time.monotonic()
+        while not self.try_acquire():
+            await asyncio.sleep(max(poll_interval, self.paused_until - time.monotonic()))
+        return time.monotonic() - start
+
+    def release(self, latency: float, throttled: bool = False, retry_after: Optional[float] = None,
+                failed: bool = False) -> None:
+        """
+        Return a slot and adapt the window to the outcome of the request.
+
+        A request that `failed` for another reason (e.g. a 400 or 401) only returns its slot: it
+        says nothing about the provider's capacity, so it neither grows the window nor counts as
+        a latency sample.
+        """
+        with self._condition:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if throttled:
+                self.throttled += 1
+                if retry_after:
+                    self.paused_until = max(self.paused_until, now + retry_after)
+                # One decrease per round trip: the other errors of the same burst were already in flight
+                if now - self._last_decrease > (self.latency_ewma or latency):
+                    self.window = max(self.min_window, self.window * self.decrease)
+                    self.decreases += 1
+                    self._last_decrease = now
+            elif not failed:
+                self.latency_ewma = latency if self.latency_ewma is None else 0.8 * self.latency_ewma + 0.2 * latency
+                self.latency_floor = self.latency_ewma if self.latency_floor is None else min(self.latency_floor, self.latency_ewma)
+                if self.latency_ewma <= self.latency_tolerance * self.latency_floor:
+                    self.window = min(self.max_window, self.window + 1 / self.window)
+                    self.peak_window = max(self.peak_window, self.window)
+            self._condition.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._condition:
+            return {
+                "window": round(self.window, 2),
+                "peak_window": round(self.peak_window, 2),
+                "in_flight": self.in_flight,
+                "decreases": self.decreases,
+                "throttled": self.throttled,
+            }
+
+
+_limiters: Dict[Tuple[str, str], AdaptiveLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(provider: str, model_name: str, **kwargs) -> AdaptiveLimiter:
+    """
+    Return the process-wide limiter of a provider/model, creating it on first use, so every
+    stage in the process shares (and learns) the same window.
+    """
+    with _limiters_lock:
+        key = (provider, model_name)
+        if key not in _limiters:
+            _limiters[key] = AdaptiveLimiter(**kwargs)
+        return _limiters[key]
+
+
+def limiter_stats() -> Dict[str, Dict[str, Any]]:
+    """Current state of every limiter, keyed by "provider:model"."""
+    with _limiters_lock:
+        limiters = dict(_limiters)
+    return {f"{provider}:{model}": limiter.stats() for (provider, model), limiter in sorted(limiters.items())}
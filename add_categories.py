@@ -1,6 +1,8 @@
 import json
 from llm import LLM
-from typing import Dict, List
+from checkpoint import JsonlCheckpoint, default_checkpoint_path, question_key
+from dedup import duplicate_keys, load_year_questions
+from typing import Dict, List, Optional
 import argparse
 from tqdm import tqdm
 
@@ -17,60 +19,287 @@ CATEGORIES = [
     "Otros"
 ]
 
-def add_category_to_json(input_file: str, output_file: str, provider: str = "mistral", model_name: str = "mistral-medium") -> None:
+BATCH_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "results": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "index": {"type": "integer"},
+                    "category": {"type": "string", "enum": CATEGORIES}
+                },
+                "required": ["index", "category"],
+                "additionalProperties": False
+            }
+        }
+    },
+    "required": ["results"],
+    "additionalProperties": False
+}
+
+def normalize_category(category: str) -> str:
+    """
+    Map an LLM answer to the stored category name, defaulting to "otros".
+
+    Args:
+        category (str): Raw category returned by the LLM
+
+    Returns:
+        str: Lowercased category name
+    """
+    category = category.strip()
+    if category not in CATEGORIES:
+        category = "Otros"  # Default to "Otros" if category is not recognized
+    return category.strip(',. ').lower()
+
+def build_category_prompt(item: Dict) -> str:
+    """Prompt asking for the category of a single question."""
+    return f"""Dada la siguiente pregunta, asígnala a una de estas categorías:
+            {', '.join(CATEGORIES)}
+            
+            Pregunta: {item['question']}
+            
+            Devuelve únicamente el nombre de la categoría, nada más."""
+
+def categorize_question(item: Dict, llm: LLM) -> str:
+    """
+    Ask the LLM for the category of a single question.
+
+    Args:
+        item (Dict): Question with a 'question' field
+        llm (LLM): The LLM instance to use
+
+    Returns:
+        str: Normalized category name
+    """
+    # Create prompt for the LLM
+    prompt = build_category_prompt(item)
+
+    # Get category from LLM
+    category = llm.query_llm(prompt, max_tokens=50, temperature=0.0)
+    return normalize_category(category)
+
+def build_batch_prompt(items: List[Dict]) -> str:
+    """Prompt asking for the categories of several numbered questions as JSON."""
+    questions_text = "\n\n".join(f"[{index}] {item['question']}" for index, item in enumerate(items))
+    return f"""Dadas las siguientes preguntas numeradas, asigna cada una a una de estas categorías:
+{', '.join(CATEGORIES)}
+
+Preguntas:
+{questions_text}
+
+Devuelve un objeto JSON con la lista "results", con un elemento {{"index": <número de la pregunta>, "category": <categoría>}} por pregunta."""
+
+def categorize_batch(items: List[Dict], llm: LLM) -> Dict[int, str]:
+    """
+    Classify several questions with a single structured LLM call.
+
+    Args:
+        items (List[Dict]): Questions with a 'question' field
+        llm (LLM): The LLM instance to use
+
+    Returns:
+        Dict[int, str]: Normalized category for each position in `items` that got a valid answer
+    """
+    response = llm.query_structured_llm(
+        build_batch_prompt(items),
+        max_tokens=30 * len(items) + 50,
+        temperature=0.0,
+        response_format=llm.json_schema_format("categories", BATCH_SCHEMA)
+    )
+    return parse_batch_response(response, len(items))
+
+def parse_batch_response(response: Optional[str], n_items: int) -> Dict[int, str]:
+    """
+    Read the categories out of a structured batch response.
+
+    Args:
+        response (str, optional): JSON returned by the LLM (None when a batch-job request failed)
+        n_items (int): Number of questions in the prompt
+
+    Returns:
+        Dict[int, str]: Normalized category for each question index that got a valid answer
+    """
+    # Keep only well-formed entries; anything missing is retried one by one
+    categories = {}
+    try:
+        results = json.loads(response)["results"]
+    except (json.JSONDecodeError, KeyError, TypeError):
+        print("batch response parsing error: ", response)
+        return categories
+    for result in results:
+        if not isinstance(result, dict):
+            continue
+        index = result.get("index")
+        category = result.get("category")
+        if isinstance(index, int) and 0 <= index < n_items and category in CATEGORIES and index not in categories:
+            categories[index] = normalize_category(category)
+    return categories
+
+def categorize_with_batch_job(pending: List[Dict], llm: LLM, batch_size: int, record) -> None:
+    """
+    Categorize every pending question through a single provider batch job.
+
+    Questions are grouped `batch_size` per prompt as in the synchronous path; questions the
+    job did not answer fall back to synchronous single-question calls.
+
+    Args:
+        pending (List[Dict]): Questions without a category
+        llm (LLM): The LLM instance to use
+        batch_size (int): Questions classified per prompt
+        record (Callable): Stores the category of a question
+    """
+    if batch_size <= 1:
+        responses = llm.query_llm_many([build_category_prompt(item) for item in pending], max_tokens=50, temperature=0.0, batch=True)
+        answered = {index: normalize_category(response) for index, response in enumerate(responses) if response is not None}
+    else:
+        groups = [pending[start:start + batch_size] for start in range(0, len(pending), batch_size)]
+        responses = llm.query_llm_many(
+            [build_batch_prompt(group) for group in groups],
+            max_tokens=30 * batch_size + 50,
+            temperature=0.0,
+            response_format=llm.json_schema_format("categories", BATCH_SCHEMA),
+            batch=True
+        )
+        answered = {}
+        for group_index, response in enumerate(responses):
+            for index, category in parse_batch_response(response, len(groups[group_index])).items():
+                answered[group_index * batch_size + index] = category
+
+    for index, item in enumerate(tqdm(pending)):
+        record(item, answered[index] if index in answered else categorize_question(item, llm))
+
+def add_category_to_json(input_file: str, output_file: str, provider: str = "mistral", model_name: str = "mistral-medium", batch_size: int = 1, checkpoint_path: str = None, batch_job: bool = False,
+                         duplicates: Dict[str, str] = None, shared_categories: Dict[str, str] = None) -> None:
     """
     Adds a category to each question in a JSON file using an LLM.
-    
+
+    Categories are appended to a JSONL checkpoint as they are assigned, so an
+    interrupted run resumes where it stopped instead of starting over.
+
     Args:
         input_file (str): Path to the input JSON file
         output_file (str): Path to save the output JSON file
         provider (str): LLM provider to use (default: "mistral")
         model_name (str): Model name to use (default: "mistral-medium")
+        batch_size (int): Questions classified per LLM call; 1 sends one call per question (default: 1)
+        checkpoint_path (str, optional): JSONL checkpoint (default: next to the output file)
+        batch_job (bool): Send all prompts as one provider batch job instead of synchronous calls (default: False)
+        duplicates (Dict[str, str], optional): question_key -> near-duplicate cluster id (see dedup.duplicate_keys);
+            only one question per cluster is sent to the LLM
+        shared_categories (Dict[str, str], optional): cluster id -> category, shared across calls so clusters
+            spanning several files are only categorized once; updated in place
     """
     # Initialize LLM
-    llm = LLM(provider=provider, model_name=model_name)
-    
+    llm = LLM(provider=provider, model_name=model_name, stage="categorize")
+
     # Read input JSON file
     with open(input_file, 'r', encoding='utf-8') as f:
         data = json.load(f)
-    
-    # Process each question
-    for item in tqdm(data):
-        if 'question' in item and 'category' not in item:
-            # Create prompt for the LLM
-            prompt = f"""Dada la siguiente pregunta, asígnala a una de estas categorías:
-            {', '.join(CATEGORIES)}
-            
-            Pregunta: {item['question']}
-            
-            Devuelve únicamente el nombre de la categoría, nada más."""
-            
-            # Get category from LLM
-            category = llm.query_llm(prompt, max_tokens=50, temperature=0.0)
-            
-            # Clean up the response and ensure it's a valid category
-            category = category.strip()
-            if category not in CATEGORIES:
-                category = "Otros"  # Default to "Otros" if category is not recognized
-            
-            # Add category to the item
-            item['category'] = category.strip(',. ').lower()
-    
+
+    # Restore categories assigned by a previous, interrupted run
+    checkpoint = JsonlCheckpoint(checkpoint_path or default_checkpoint_path(output_file))
+    completed = checkpoint.load()
+    for item in data:
+        if 'question' in item and 'category' not in item and question_key(item) in completed:
+            item['category'] = completed[question_key(item)]['category']
+
+    pending = [item for item in data if 'question' in item and 'category' not in item]
+
+    # Near-duplicates share one category: reuse a known one, otherwise send the first member only
+    duplicates = duplicates or {}
+    shared = shared_categories if shared_categories is not None else {}
+    members: Dict[str, List[Dict]] = {}
+    reused = []
+    unique = []
+    for item in pending:
+        cluster = duplicates.get(question_key(item))
+        if cluster is None:
+            unique.append(item)
+        elif cluster in shared:
+            reused.append(item)
+        else:
+            if cluster not in members:
+                unique.append(item)
+            members.setdefault(cluster, []).append(item)
+    if duplicates:
+        print(f"Near-duplicates: {len(reused)} categories reused, {len(pending) - len(unique) - len(reused)} "
+              f"more shared within this file, {len(unique)} questions sent to the LLM")
+    pending = unique
+
+    def record(item: Dict, category: str) -> None:
+        item['category'] = category
+        checkpoint.append(question_key(item), {'category': category})
+        cluster = duplicates.get(question_key(item))
+        if cluster is not None:
+            shared[cluster] = category
+            for member in members.get(cluster, []):
+                if member is not item:
+                    member['category'] = category
+                    checkpoint.append(question_key(member), {'category': category})
+
+    with checkpoint:
+        for item in reused:
+            record(item, shared[duplicates[question_key(item)]])
+        if batch_job:
+            categorize_with_batch_job(pending, llm, batch_size, record)
+        elif batch_size <= 1:
+            # Process each question
+            for item in tqdm(pending):
+                record(item, categorize_question(item, llm))
+        else:
+            with tqdm(total=len(pending)) as progress:
+                for start in range(0, len(pending), batch_size):
+                    batch = pending[start:start + batch_size]
+                    categories = categorize_batch(batch, llm)
+                    for index, item in enumerate(batch):
+                        if index in categories:
+                            record(item, categories[index])
+                        else:
+                            # Fall back to a single-question call for items the batch did not answer
+                            record(item, categorize_question(item, llm))
+                    progress.update(len(batch))
+
     # Write output JSON file
     with open(output_file, 'w', encoding='utf-8') as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
+    checkpoint.remove()
 
 def main():
+    parser = argparse.ArgumentParser(description='Add legal categories to parsed questions')
+    parser.add_argument('--years', type=int, nargs='+', default=[2004, 2005, 2006, 2023, 2024],
+                        help='Exam years to process from data/parsing/{year}/questions.json')
+    parser.add_argument('--batch-size', type=int, default=20,
+                        help='Questions classified per LLM call; 1 sends one call per question (default: 20)')
+    parser.add_argument('--batch-job', action='store_true',
+                        help='Send all prompts as a provider batch job (cheaper, slower) instead of synchronous calls')
+    parser.add_argument('--dedup', action='store_true',
+                        help='Categorize near-duplicate questions across all years once (see dedup.py)')
+    parser.add_argument('--dedup-threshold', type=float, default=0.7,
+                        help='Minimum similarity for --dedup (default: 0.7)')
+    parser.add_argument('--provider', default='mistral', help='LLM provider to use (default: mistral)')
+    parser.add_argument('--model', default='mistral-small-latest', help='Model to use (default: mistral-small-latest)')
+
+    args = parser.parse_args()
     print("Adding categories to questions...")
-    years = [2004, 2005, 2006, 2023, 2024]
-    for year in years:
+    duplicates, shared = None, {}
+    if args.dedup:
+        _, questions, _ = load_year_questions(args.years, "questions.json")
+        duplicates = duplicate_keys(questions, threshold=args.dedup_threshold)
+    for year in args.years:
         input_file = f"data/parsing/{year}/questions.json"
         output_file = f"data/parsing/{year}/categorized_questions.json"
         add_category_to_json(
             input_file=input_file,
             output_file=output_file,
-            provider="mistral",
-            model_name="mistral-small-latest"
+            provider=args.provider,
+            model_name=args.model,
+            batch_size=args.batch_size,
+            batch_job=args.batch_job,
+            duplicates=duplicates,
+            shared_categories=shared
         )
 
 if __name__ == '__main__':
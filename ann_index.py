@@ -0,0 +1,252 @@
+import json
+import os
+import time
+from typing import List, Optional, Tuple
+import numpy as np
+from embedding_store import normalize_rows, top_k_search
+
+
+class IVFIndex:
+    """
+    Pure-NumPy inverted-file (IVF) approximate nearest-neighbour index for inner-product
+    search over normalized embeddings.
+
+    A spherical k-means coarse quantizer splits the corpus into `n_lists` clusters and
+    vectors are stored grouped by cluster, so a query only scores the vectors of the
+    `nprobe` closest clusters. Vectors can optionally be stored as int8 with a per-vector
+    scale, which cuts memory per vector to about a quarter.
+    """
+
+    def __init__(self, n_lists: Optional[int] = None, nprobe: int = 8, quantize: str = "none"):
+        """
+        Args:
+            n_lists (int, optional): Number of clusters (default: about 4 * sqrt(n_vectors))
+            nprobe (int): Clusters scanned per query; higher is slower but more accurate
+            quantize (str): "none" keeps float32 vectors, "int8" stores 8-bit codes
+        """
+        if quantize not in ("none", "int8"):
+            raise ValueError(f"Quantization {quantize} not supported")
+        self.n_lists = n_lists
+        self.nprobe = nprobe
+        self.quantize = quantize
+        self.fingerprint = None
+        self.centroids = None
+        self.offsets = None
+        self.ids = None
+        self.codes = None
+        self.scales = None
+
+    def build(self, vectors: np.ndarray, n_iter: int = 20, sample_size: int = 100000,
+              block_size: int = 65536, seed: int = 0) -> "IVFIndex":
+        """
+        Train the coarse quantizer on a sample and assign every vector to its cluster.
+
+        Args:
+            vectors (np.ndarray): Vectors to index, shape (n, dim); normalized internally
+            n_iter (int): k-means iterations
+            sample_size (int): Vectors used to train k-means
+            block_size (int): Vectors assigned at a time (bounds memory)
+            seed (int): Random seed
+
+        Returns:
+            IVFIndex: self
+        """
+        rng = np.random.default_rng(seed)
+        n_vectors = vectors.shape[0]
+        n_lists = self.n_lists or max(1, int(4 * np.sqrt(n_vectors)))
+        n_lists = min(n_lists, n_vectors)
+        self.n_lists = n_lists
+
+        sample_ids = rng.choice(n_vectors, size=min(sample_size, n_vectors), replace=False)
+        sample = normalize_rows(vectors[np.sort(sample_ids)])
+        centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)].copy()
+        for _ in range(n_iter):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            counts = np.bincount(assignment, minlength=n_lists)
+            # Re-seed empty clusters with random sample points
+            empty = counts == 0
+            sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()))]
+            centroids = normalize_rows(sums)
+        self.centroids = centroids
+
+        assignment = np.empty(n_vectors, dtype=np.int32)
+        for start in range(0, n_vectors, block_size):
+            block = normalize_rows(vectors[start:start + block_size])
+            assignment[start:start + block_size] = np.argmax(block @ centroids.T, axis=1)
+
+        order = np.argsort(assignment, kind="stable")
+        self.ids = order.astype(np.int64)
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(assignment, minlength=n_lists))]).astype(np.int64)
+
+        dim = vectors.shape[1]
+        if self.quantize == "int8":
+            self.codes = np.empty((n_vectors, dim), dtype=np.int8)
+            self.scales = np.empty(n_vectors, dtype=np.float32)
+        else:
+            self.codes = np.empty((n_vectors, dim), dtype=np.float32)
+        for start in range(0, n_vectors, block_size):
+            block = normalize_rows(vectors[order[start:start + block_size]])
+            if self.quantize == "int8":
+                scales = np.abs(block).max(axis=1) / 127.0
+                scales[scales == 0] = 1.0
+                self.codes[start:start + len(block)] = np.round(block / scales[:, None]).astype(np.int8)
+                self.scales[start:start + len(block)] = scales
+            else:
+                self.codes[start:start + len(block)] = block
+        return self
+
+    def search(self, queries: np.ndarray, top_k: int, nprobe: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Approximate top-k by inner product.
+
+        Args:
+            queries (np.ndarray): Query vectors, shape (n_queries, dim)
+            top_k (int): Number of results per query
+            nprobe (int, optional): Clusters scanned per query (default: self.nprobe)
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: (indices, scores), each (n_queries, top_k), best first;
+            missing results are padded with index -1 and score -inf
+        """
+        nprobe = min(nprobe or self.nprobe, self.n_lists)
+        queries = normalize_rows(queries)
+        all_indices = np.full((len(queries), top_k), -1, dtype=np.int64)
+        all_scores = np.full((len(queries), top_k), -np.inf, dtype=np.float32)
+
+        probes = np.argpartition(-(queries @ self.centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+        for q, (query, lists) in enumerate(zip(queries, probes)):
+            scores = []
+            rows = []
+            for list_id in lists:
+                start, end = self.offsets[list_id], self.offsets[list_id + 1]
+                if start == end:
+                    continue
+                list_scores = np.asarray(self.codes[start:end], dtype=np.float32) @ query
+                if self.scales is not None:
+                    list_scores *= self.scales[start:end]
+                scores.append(list_scores)
+                rows.append(np.arange(start, end))
+            if not scores:
+                continue
+            scores = np.concatenate(scores)
+            rows = np.concatenate(rows)
+            k = min(top_k, len(scores))
+            best = np.argpartition(-scores, k - 1)[:k]
+            best = best[np.argsort(-scores[best])]
+            all_indices[q, :k] = self.ids[rows[best]]
+            all_scores[q, :k] = scores[best]
+        return all_indices, all_scores
+
+    def memory_per_vector(self) -> float:
+        """Bytes stored per indexed vector (codes, scale and id)."""
+        per_vector = self.codes.shape[1] * self.codes.dtype.itemsize + self.ids.dtype.itemsize
+        if self.scales is not None:
+            per_vector += self.scales.dtype.itemsize
+        return per_vector
+
+    def save(self, directory: str) -> None:
+        """Save the index as .npy files (loadable memory-mapped) plus a JSON header."""
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, "centroids.npy"), self.centroids)
+        np.save(os.path.join(directory, "offsets.npy"), self.offsets)
+        np.save(os.path.join(directory, "ids.npy"), self.ids)
+        np.save(os.path.join(directory, "codes.npy"), self.codes)
+        if self.scales is not None:
+            np.save(os.path.join(directory, "scales.npy"), self.scales)
+        # Written last: an index directory without a header is incomplete
+        with open(os.path.join(directory, "index.json"), 'w', encoding='utf-8') as f:
+            json.dump({"n_lists": self.n_lists, "nprobe": self.nprobe, "quantize": self.quantize,
+                       "fingerprint": self.fingerprint}, f)
+
+    @classmethod
+    def load(cls, directory: str) -> "IVFIndex":
+        """Load an index saved with save(); the vector codes are memory-mapped."""
+        with open(os.path.join(directory, "index.json"), 'r', encoding='utf-8') as f:
+            header = json.load(f)
+        index = cls(n_lists=header["n_lists"], nprobe=header["nprobe"], quantize=header["quantize"])
+        index.fingerprint = header["fingerprint"]
+        index.centroids = np.load(os.path.join(directory, "centroids.npy"))
+        index.offsets = np.load(os.path.join(directory, "offsets.npy"))
+        index.ids = np.load(os.path.join(directory, "ids.npy"), mmap_mode='r')
+        index.codes = np.load(os.path.join(directory, "codes.npy"), mmap_mode='r')
+        if index.quantize == "int8":
+            index.scales = np.load(os.path.join(directory, "scales.npy"), mmap_mode='r')
+        return index
+
+    @classmethod
+    def load_or_build(cls, vectors: np.ndarray, directory: str, fingerprint: str, **kwargs) -> "IVFIndex":
+        """
+        Load the index in `directory` if it was built for the same vectors (same fingerprint)
+        and settings, otherwise build and save it.
+        """
+        header_path = os.path.join(directory, "index.json")
+        if os.path.exists(header_path):
+            index = cls.load(directory)
+            if index.fingerprint == fingerprint and index.quantize == kwargs.get("quantize", "none"):
+                if kwargs.get("nprobe"):
+                    index.nprobe = kwargs["nprobe"]
+                return index
+            os.remove(header_path)
+        index = cls(**kwargs)
+        index.fingerprint = fingerprint
+        index.build(vectors)
+        index.save(directory)
+        return index
+
+
+def recall_report(index: IVFIndex, queries: np.ndarray, vectors: np.ndarray, top_k: int = 10,
+                  nprobes: List[int] = (1, 2, 4, 8, 16, 32)) -> List[dict]:
+    """
+    Compare the index against exact search: recall@k and per-query latency for each nprobe.
+
+    Args:
+        index (IVFIndex): Built index
+        queries (np.ndarray): Query vectors
+        vectors (np.ndarray): The indexed vectors (for exact search); normalized block by block like build() does
+        top_k (int): k for recall@k
+        nprobes (List[int]): nprobe values to measure
+
+    Returns:
+        List[dict]: One row per setting, starting with exact search
+    """
+    start = time.perf_counter()
+    exact, _ = top_k_search(normalize_rows(queries), vectors, top_k, normalize=True)
+    exact_latency = (time.perf_counter() - start) / len(queries)
+    rows = [{"nprobe": "exact", "recall": 1.0, "latency_ms": exact_latency * 1000}]
+
+    for nprobe in nprobes:
+        if nprobe > index.n_lists:
+            break
+        start = time.perf_counter()
+        approximate, _ = index.search(queries, top_k, nprobe=nprobe)
+        latency = (time.perf_counter() - start) / len(queries)
+        hits = sum(len(set(a) & set(e)) for a, e in zip(approximate.tolist(), exact.tolist()))
+        rows.append({"nprobe": nprobe, "recall": hits / exact.size, "latency_ms": latency * 1000})
+    return rows
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Build an IVF index over an embedding matrix and report recall@k vs latency')
+    parser.add_argument('matrix', help='Path to a float32 .npy embedding matrix (e.g. from embedding_store.py)')
+    parser.add_argument('--n_lists', type=int, default=None, help='Number of clusters (default: 4 * sqrt(n))')
+    parser.add_argument('--quantize', choices=['none', 'int8'], default='none', help='Vector compression (default: none)')
+    parser.add_argument('--queries', type=int, default=200, help='Number of perturbed corpus vectors used as queries (default: 200)')
+    parser.add_argument('--top_k', type=int, default=10, help='k for recall@k (default: 10)')
+
+    args = parser.parse_args()
+    vectors = np.load(args.matrix, mmap_mode='r')
+    rng = np.random.default_rng(0)
+    sample = np.asarray(vectors[rng.choice(len(vectors), size=min(args.queries, len(vectors)), replace=False)])
+    queries = sample + rng.normal(scale=0.05, size=sample.shape).astype(np.float32)
+
+    start = time.perf_counter()
+    index = IVFIndex(n_lists=args.n_lists, quantize=args.quantize).build(vectors)
+    print(f"Built {index.n_lists} lists over {len(vectors)} vectors in {time.perf_counter() - start:.1f}s "
+          f"({index.memory_per_vector():.0f} bytes/vector)")
+    print(f"{'nprobe':>8} {'recall@' + str(args.top_k):>10} {'ms/query':>10}")
+    for row in recall_report(index, queries, vectors, top_k=args.top_k):
+        print(f"{row['nprobe']:>8} {row['recall']:>10.3f} {row['latency_ms']:>10.3f}")
@@ -0,0 +1,225 @@
+import asyncio
+import os
+import random
+import time
+from typing import Any, List, Optional, Tuple
+from tqdm import tqdm
+from adaptive_concurrency import get_limiter, get_retry_after, get_status_code, is_throttled
+from llm_cache import ResponseCache, get_default_cache
+from llm_providers import get_adapter, get_async_client
+from llm_telemetry import Telemetry, get_default_telemetry
+
+# Conservative per-provider defaults; override through the AsyncLLM constructor
+DEFAULT_LIMITS = {
+    "mistral": {"requests_per_minute": 300, "tokens_per_minute": 500000},
+    "cohere": {"requests_per_minute": 500, "tokens_per_minute": 1000000},
+}
+
+
+class TokenBucket:
+    """
+    Asyncio token bucket that refills continuously at `rate_per_minute`.
+
+    The bucket may go into debt (negative balance) when actual usage is charged after
+    the fact, which delays the following acquisitions accordingly.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float = 1.0) -> None:
+        # Never ask for more than the bucket can ever hold, or we would wait forever
+        amount = min(amount, self.capacity)
+        while True:
+            self._refill()
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return
+            await asyncio.sleep((amount - self.tokens) / self.rate)
+
+    def charge(self, amount: float) -> None:
+        """Consume tokens without waiting (used to account for completion tokens)."""
+        self._refill()
+        self.tokens -= amount
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count used for rate limiting (about 4 characters per token)."""
+    return max(1, len(text) // 4)
+
+
+class AsyncLLM:
+    """
+    Asyncio counterpart of `llm.LLM` with bounded concurrency, per-minute request and
+    token limits, and jittered exponential backoff on 429/5xx responses and timeouts.
+
+    In-flight requests also count against the AIMD window that `LLM` uses for the same
+    provider/model, so sync and async callers in one process share (and adapt) one limit.
+    """
+
+    def __init__(
+        self,
+        provider: str,
+        model_name: str,
+        max_concurrency: int = 8,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        max_retries: int = 5,
+        backoff_base: float = 1.0,
+        backoff_max: float = 60.0,
+        cache: Optional[ResponseCache] = None,
+        client: Any = None,
+        stage: str = "default",
+        telemetry: Optional[Telemetry] = None,
+        server_url: Optional[str] = None,
+    ):
+        """
+        Args:
+            provider (str): Registered provider name (see llm_providers.py)
+            model_name (str): Model to query
+            max_concurrency (int): Maximum number of in-flight requests (the shared AIMD window may allow fewer)
+            requests_per_minute (float, optional): Request budget (default: provider default)
+            tokens_per_minute (float, optional): Token budget (default: provider default)
+            max_retries (int): Retries for 429/5xx errors and timeouts before giving up
+            backoff_base (float): Base delay in seconds for exponential backoff
+            backoff_max (float): Maximum backoff delay in seconds
+            cache (ResponseCache, optional): Response cache shared with `llm.LLM`
+            client (Any, optional): Pre-built client for the provider's adapter (default: the pooled one)
+            stage (str): Label under which calls are recorded in the telemetry
+            telemetry (Telemetry, optional): Call recorder (default: the process-wide one)
+            server_url (str, optional): Alternative API endpoint, also read from <PROVIDER>_SERVER_URL
+        """
+        self.provider = provider
+        self.model_name = model_name
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.cache = cache if cache is not None else get_default_cache()
+        self.stage = stage
+        self.telemetry = telemetry if telemetry is not None else get_default_telemetry()
+        # Provider adapter from the llm_providers registry; raises ValueError for unknown providers
+        self.adapter = get_adapter(provider)
+        self.server_url = server_url or os.getenv(f"{provider.upper()}_SERVER_URL")
+        # Without a pre-built client, the pooled one of the running event loop is used
+        self._client = client
+
+        limits = DEFAULT_LIMITS.get(self.provider, {})
+        self.request_bucket = TokenBucket(requests_per_minute or limits.get("requests_per_minute", 60))
+        self.token_bucket = TokenBucket(tokens_per_minute or limits.get("tokens_per_minute", 100000))
+        self._semaphore = None
+        # AIMD window shared with every LLM/AsyncLLM of this provider/model in the process
+        self.limiter = get_limiter(provider, model_name)
+
+    async def aquery_llm(self, prompt: str, max_tokens: int = 1000, temperature: float = 0.0) -> str:
+        return await self._cached_complete(prompt, max_tokens, temperature)
+
+    async def aquery_structured_llm(self, prompt: str, max_tokens: int = 1000, temperature: float = 0.0, response_format: dict = None) -> str:
+        return await self._cached_complete(prompt, max_tokens, temperature, response_format)
+
+    async def amap(
+        self,
+        prompts: List[str],
+        max_tokens: int = 1000,
+        temperature: float = 0.0,
+        response_format: dict = None,
+        progress: bool = False,
+    ) -> List[str]:
+        """
+        Run many prompts concurrently within the configured limits.
+
+        Args:
+            prompts (List[str]): Prompts to send
+            max_tokens (int): Completion budget per prompt
+            temperature (float): Sampling temperature
+            response_format (dict, optional): Structured output format for every prompt
+            progress (bool): Show a tqdm progress bar
+
+        Returns:
+            List[str]: Responses in the same order as `prompts`
+        """
+        bar = tqdm(total=len(prompts)) if progress else None
+
+        async def run(prompt: str) -> str:
+            response = await self._cached_complete(prompt, max_tokens, temperature, response_format)
+            if bar is not None:
+                bar.update(1)
+            return response
+
+        try:
+            return await asyncio.gather(*(run(prompt) for prompt in prompts))
+        finally:
+            if bar is not None:
+                bar.close()
+
+    async def _cached_complete(self, prompt: str, max_tokens: int, temperature: float, response_format: dict = None) -> str:
+        key = None
+        if self.cache is not None:
+            key = ResponseCache.make_key(self.provider, self.model_name, prompt, max_tokens, temperature, response_format)
+            start = time.perf_counter()
+            cached = self.cache.get(key)
+            if cached is not None:
+                self.telemetry.record(self.stage, self.provider, self.model_name, "cache", latency=time.perf_counter() - start)
+                return cached
+
+        response = await self._complete_with_retries(prompt, max_tokens, temperature, response_format)
+        if self.cache is not None and response is not None:
+            self.cache.set(key, response)
+        return response
+
+    async def _complete_with_retries(self, prompt: str, max_tokens: int, temperature: float, response_format: dict = None) -> str:
+        # The semaphore has to be created inside the running event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        attempt = 0
+        queue_wait = 0.0
+        while True:
+            queued = time.perf_counter()
+            await self.request_bucket.acquire(1)
+            await self.token_bucket.acquire(estimate_tokens(prompt))
+            async with self._semaphore:
+                await self.limiter.acquire_async()
+                start = time.perf_counter()
+                queue_wait += start - queued
+                error = None
+                succeeded = False
+                try:
+                    text, (prompt_tokens, completion_tokens) = await self._complete(prompt, max_tokens, temperature, response_format)
+                    succeeded = True
+                except Exception as e:
+                    error = e
+                finally:
+                    # Also reached on cancellation, which must return the slot without counting as a success
+                    latency = time.perf_counter() - start
+                    throttled = error is not None and is_throttled(error)
+                    retry_after = get_retry_after(error) if throttled else None
+                    self.limiter.release(latency, throttled=throttled, retry_after=retry_after, failed=not succeeded and not throttled)
+            if error is not None:
+                if not throttled or attempt >= self.max_retries:
+                    self._record(latency, queue_wait=queue_wait, retries=attempt, error=str(get_status_code(error) or type(error).__name__))
+                    raise error
+                # Full jitter keeps concurrent retries from synchronizing; never earlier than Retry-After
+                delay = max(retry_after or 0.0, random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt)))
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            self._record(latency, queue_wait=queue_wait, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, retries=attempt)
+            self.token_bucket.charge(completion_tokens if completion_tokens is not None else estimate_tokens(text or ""))
+            return text
+
+    def _record(self, latency: float, **fields) -> None:
+        self.telemetry.record(self.stage, self.provider, self.model_name, "sync", latency=latency, window=self.limiter.window, **fields)
+
+    async def _complete(self, prompt: str, max_tokens: int, temperature: float, response_format: dict = None) -> Tuple[str, Tuple[Optional[int], Optional[int]]]:
+        """Returns the response text and its (prompt, completion) token usage, None where the provider omits it."""
+        client = self._client if self._client is not None else get_async_client(self.provider, self.server_url)
+        return await self.adapter.acomplete(client, self.model_name, prompt, max_tokens, temperature, response_format)
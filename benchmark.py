@@ -0,0 +1,286 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+# Offline runs only: no cached responses, every call goes to the mock provider
+os.environ.pop("LLM_CACHE_PATH", None)
+
+from llm import LLM
+from llm_telemetry import get_default_telemetry, percentile
+
+BASELINE_PATH = "benchmarks/baseline.json"
+
+# Direction in which each metric gets worse
+HIGHER_IS_WORSE = ("latency_p50", "latency_p95", "peak_memory_mb", "seconds", "completion_tokens")
+LOWER_IS_WORSE = ("items_per_s",)
+# Stages faster than this are too noisy for their timings to be compared
+MIN_COMPARED_SECONDS = 0.1
+# Dense score gap (rank k vs k+1) above which evaluate_rag_skip keeps the dense order without reranking
+RERANK_SKIP_MARGIN = 0.01
+
+
+def rss_mb() -> float:
+    """Resident set size of this process in MB (peak so far where /proc is not available)."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except OSError:
+        import resource
+        # ru_maxrss is in KB on Linux and bytes on macOS
+        scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+class MemorySampler:
+    """Samples the process RSS in a background thread and keeps the peak, without slowing the stage down."""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.peak = rss_mb()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, rss_mb())
+
+    def __enter__(self) -> "MemorySampler":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, rss_mb())
+
+
+def measure(run: Callable[[], int], verbose: bool = False) -> Dict[str, Any]:
+    """
+    Run one stage and measure wall time, throughput, LLM latency and peak memory (process RSS).
+
+    Args:
+        run (Callable[[], int]): Runs the stage and returns the number of items it processed
+        verbose (bool): Keep the stage's own output instead of discarding it
+
+    Returns:
+        Dict[str, Any]: Metrics of the stage
+    """
+    telemetry = get_default_telemetry()
+    first_record = len(telemetry.records)
+    start = time.perf_counter()
+    error = None
+    with MemorySampler() as memory, contextlib.redirect_stdout(sys.stdout if verbose else io.StringIO()):
+        try:
+            items = run()
+        except Exception as e:
+            # e.g. non-retryable errors injected through the mock config, or 429s that outlast the retries
+            items = 0
+            error = f"{type(e).__name__}: {e}"
+    seconds = time.perf_counter() - start
+
+    calls = [entry for entry in telemetry.records[first_record:] if entry["mode"] == "sync"]
+    latencies = [entry["latency"] for entry in calls if entry["error"] is None]
+    return {
+        "items": items,
+        "seconds": round(seconds, 3),
+        "items_per_s": round(items / seconds, 2) if seconds else None,
+        "llm_calls": len(calls),
+        "llm_errors": sum(entry["error"] is not None for entry in calls),
+        "latency_p50": round(percentile(latencies, 50), 4) if latencies else None,
+        "latency_p95": round(percentile(latencies, 95), 4) if latencies else None,
+        "completion_tokens": sum(entry["completion_tokens"] or 0 for entry in calls),
+        "peak_memory_mb": round(memory.peak, 1),
+        "error": error,
+    }
+
+
+def build_context(questions: List[Dict[str, Any]], path: str) -> None:
+    """Synthetic RAG context: one document per question option, in the articles.json layout."""
+    documents = [
+        {"data": {"text": f"Artículo {index + 1}. {text}"}}
+        for index, text in enumerate(text for question in questions for text in question["options"].values() if text)
+    ]
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(documents, f, ensure_ascii=False)
+
+
+def run_benchmark(pdfs: List[Path], dataset: str, workdir: str, concurrency: int = 4, verbose: bool = False) -> Dict[str, Dict[str, Any]]:
+    """
+    Run parse -> format -> categorize on the PDFs and both evaluators on the dataset with the mock provider.
+    The plain evaluator also runs in answer-only fast mode, and the RAG evaluator runs twice, always
+    reranking and with the rerank-skip margin policy.
+
+    Formatting reads the text.txt parse_pdf writes for each PDF and runs twice: with the local fast
+    path, and with every chunk sent to the LLM.
+
+    Returns:
+        Dict[str, Dict[str, Any]]: Metrics per stage
+    """
+    from parse_pdf import parse_pdf
+    from format_text import clean_text
+    from add_categories import add_category_to_json
+    import evaluate
+    from evaluate_rag import RAGEvaluator
+
+    years = [pdf.stem for pdf in pdfs]
+    year_dirs = {year: os.path.join(workdir, year) for year in years}
+    results = {}
+
+    def parse():
+        for pdf, year in zip(pdfs, years):
+            parse_pdf(str(pdf), year_dirs[year], workers=1)
+        return len(pdfs)
+
+    def count_questions(filename: str) -> int:
+        total = 0
+        for year_dir in year_dirs.values():
+            with open(os.path.join(year_dir, filename), "r", encoding="utf-8") as f:
+                total += len(json.load(f))
+        return total
+
+    def format_questions(fast_path: bool, filename: str) -> Callable[[], int]:
+        def run():
+            for year, year_dir in year_dirs.items():
+                clean_text(os.path.join(year_dir, "text.txt"), os.path.join(year_dir, filename), workers=concurrency,
+                           provider="mock", model_name="mock-large", desc=year, fast_path=fast_path)
+            return count_questions(filename)
+        return run
+
+    def categorize():
+        for year_dir in year_dirs.values():
+            add_category_to_json(os.path.join(year_dir, "questions.json"), os.path.join(year_dir, "categorized_questions.json"),
+                                 provider="mock", model_name="mock-small", batch_size=20)
+        return count_questions("categorized_questions.json")
+
+    with open(dataset, "r", encoding="utf-8") as f:
+        questions = json.load(f)
+
+    def evaluate_stage(name: str, fast: bool = False) -> Callable[[], int]:
+        def run():
+            llm = LLM(provider="mock", model_name="mock-small", stage="evaluate")
+            evaluate.evaluate_models(dataset, [llm], output_file=os.path.join(workdir, f"{name}.json"), concurrency=concurrency, fast=fast)
+            return len(questions)
+        return run
+
+    context_file = os.path.join(workdir, "context.json")
+    build_context(questions, context_file)
+    rag_metrics = {}
+
+    def evaluate_rag_stage(name: str, skip_margin: float = None) -> Callable[[], int]:
+        def run():
+            evaluator = RAGEvaluator(LLM(provider="mock", model_name="mock-small", stage="evaluate_rag"))
+            evaluator.rerank_skip_margin = skip_margin
+            summary = evaluator.evaluate_models(dataset, context_file, records_path=os.path.join(workdir, f"{name}.jsonl"),
+                                                concurrency=concurrency)
+            rag_metrics[name] = {"rerank_calls": evaluator.rerank_stats["calls"], "rerank_skipped": evaluator.rerank_stats["skipped"],
+                                 "rerank_cached": evaluator.rerank_stats["cached"],
+                                 "accuracy": round(next(iter(summary.values()))["accuracy"], 2)}
+            return len(questions)
+        return run
+
+    for name, stage in (("parse", parse), ("format", format_questions(True, "questions.json")),
+                        ("format_llm", format_questions(False, "questions_llm.json")), ("categorize", categorize),
+                        ("evaluate", evaluate_stage("evaluate")), ("evaluate_fast", evaluate_stage("evaluate_fast", fast=True)),
+                        ("evaluate_rag", evaluate_rag_stage("evaluate_rag")),
+                        ("evaluate_rag_skip", evaluate_rag_stage("evaluate_rag_skip", skip_margin=RERANK_SKIP_MARGIN))):
+        print(f"Running {name}...", flush=True)
+        results[name] = measure(stage, verbose=verbose)
+        results[name].update(rag_metrics.get(name, {}))
+    if "accuracy" in results["evaluate_rag_skip"] and "accuracy" in results["evaluate_rag"]:
+        results["evaluate_rag_skip"]["accuracy_delta"] = round(results["evaluate_rag_skip"]["accuracy"] - results["evaluate_rag"]["accuracy"], 2)
+    return results
+
+
+def compare(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]], tolerance: float) -> List[str]:
+    """Print each metric next to the baseline and return the regressions beyond `tolerance` (e.g. 0.25 = 25%)."""
+    regressions = []
+    print(f"\n{'stage':<17} {'metric':<15} {'baseline':>10} {'current':>10} {'change':>8}")
+    for stage, metrics in results.items():
+        if metrics.get("error") and not baseline.get(stage, {}).get("error"):
+            regressions.append(f"{stage} failed: {metrics['error']}")
+        for metric in HIGHER_IS_WORSE + LOWER_IS_WORSE:
+            current = metrics.get(metric)
+            reference = baseline.get(stage, {}).get(metric)
+            if current is None or not reference:
+                continue
+            if metric in ("seconds", "items_per_s") and baseline[stage]["seconds"] < MIN_COMPARED_SECONDS:
+                continue
+            change = current / reference - 1
+            worse = change > tolerance if metric in HIGHER_IS_WORSE else change < -tolerance
+            if worse:
+                regressions.append(f"{stage} {metric}: {reference} -> {current} ({change * 100:+.0f}%)")
+            print(f"{stage:<17} {metric:<15} {reference:>10} {current:>10} {change * 100:>+7.0f}%{'  REGRESSION' if worse else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline end-to-end benchmark of the pipeline stages with the mock LLM provider')
+    parser.add_argument('--pdfs', nargs='+', default=None,
+                        help='Exam PDFs to parse, format and categorize (default: every PDF in data/raw_small)')
+    parser.add_argument('--dataset', default='dataset/constitucional.json',
+                        help='Questions for both evaluators (default: dataset/constitucional.json)')
+    parser.add_argument('--mock-config', default=None,
+                        help='Mock provider settings as a JSON file or string (latency, sigma, error_rate per operation, see mock_provider.py)')
+    parser.add_argument('--concurrency', type=int, default=4, help='Concurrent LLM calls in each stage (default: 4)')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help=f'Stored baseline to compare with (default: {BASELINE_PATH})')
+    parser.add_argument('--save-baseline', action='store_true', help='Store this run as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Relative change counted as a regression (default: 0.25)')
+    parser.add_argument('--output', default=None, help='Also write the metrics of this run to a JSON file')
+    parser.add_argument('--verbose', action='store_true', help='Show the output of each stage')
+
+    args = parser.parse_args()
+    if args.mock_config:
+        os.environ["MOCK_LLM_CONFIG"] = args.mock_config
+    pdfs = [Path(p) for p in args.pdfs] if args.pdfs else sorted(Path("data/raw_small").glob("*.pdf"))
+
+    workdir = tempfile.mkdtemp(prefix="benchmark_")
+    try:
+        results = run_benchmark(pdfs, args.dataset, workdir, concurrency=args.concurrency, verbose=args.verbose)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"\n{'stage':<17} {'items':>6} {'seconds':>8} {'items/s':>8} {'calls':>6} {'p50 (s)':>8} {'p95 (s)':>8} {'tokens':>7} {'peak MB':>8}")
+    for stage, metrics in results.items():
+        print(f"{stage:<17} {metrics['items']:>6} {metrics['seconds']:>8} {metrics['items_per_s']:>8} {metrics['llm_calls']:>6} "
+              f"{metrics['latency_p50'] or '-':>8} {metrics['latency_p95'] or '-':>8} {metrics['completion_tokens']:>7} {metrics['peak_memory_mb']:>8}"
+              + (f"  failed: {metrics['error']}" if metrics['error'] else ""))
+
+    skip = results["evaluate_rag_skip"]
+    if "rerank_calls" in skip:
+        print(f"\nRerank skip (margin {RERANK_SKIP_MARGIN}): {skip['rerank_skipped'] + skip['rerank_cached']} of "
+              f"{skip['rerank_skipped'] + skip['rerank_cached'] + skip['rerank_calls']} rerank calls avoided "
+              f"({skip['rerank_skipped']} by the margin, {skip['rerank_cached']} cached), "
+              f"accuracy {skip['accuracy']}% ({skip.get('accuracy_delta', 0):+} points vs always reranking)")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline) or ".", exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print("\nRegressions:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+        print("\nNo regressions")
+    else:
+        print(f"\nNo baseline at {args.baseline}; run with --save-baseline to store one")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import argparse
+import tempfile
+from pathlib import Path
+from typing import Dict, List
+from format_text import (
+    QUESTION_START_PATTERN,
+    build_parse_prompt,
+    count_tokens,
+    split_inline_questions,
+    split_text_at_questions,
+    split_text_into_chunks,
+)
+from parse_pdf import parse_pdf
+
+def load_text(path: Path) -> str:
+    """
+    Load the exam text the format stage reads: a PDF is run through parse_pdf and its text.txt
+    is used, a text file is read as is. The answers line is dropped the same way clean_text does.
+    """
+    if path.suffix.lower() == ".pdf":
+        with tempfile.TemporaryDirectory() as output_dir:
+            text = Path(parse_pdf(str(path), output_dir, workers=1)["text_file"]).read_text(encoding="utf-8")
+    else:
+        text = path.read_text(encoding="utf-8")
+    return "\n".join(text.split("\n")[:-1])
+
+def chunk_stats(chunks: List[str]) -> Dict[str, int]:
+    """
+    Measure what a list of chunks costs as parse_question_chunk prompts.
+
+    Returns:
+        Dict[str, int]: Number of chunks, prompt tokens, tokens of the largest chunk and questions sent more than once
+    """
+    question_ids = [
+        int(match.group(1))
+        for chunk in chunks
+        for match in (QUESTION_START_PATTERN.match(line) for line in split_inline_questions(chunk).split("\n"))
+        if match
+    ]
+    return {
+        "chunks": len(chunks),
+        "prompt_tokens": sum(count_tokens(build_parse_prompt(chunk)) for chunk in chunks),
+        "largest_chunk": max((count_tokens(chunk) for chunk in chunks), default=0),
+        "duplicate_questions": len(question_ids) - len(set(question_ids)),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare fixed-window and question-boundary chunking token costs')
+    parser.add_argument('inputs', nargs='*', default=None,
+                        help='PDFs (measured on their parse_pdf text.txt) or text files to measure (default: every PDF in data/raw_small)')
+    parser.add_argument('--chunk-tokens', type=int, default=1000,
+                        help='Token budget of the question-boundary chunker (default: 1000)')
+
+    args = parser.parse_args()
+    inputs = [Path(p) for p in args.inputs] if args.inputs else sorted(Path("data/raw_small").glob("*.pdf"))
+
+    totals = {"fixed": 0, "questions": 0}
+    print(f"{'file':<12} {'chunker':<10} {'chunks':>7} {'prompt tokens':>14} {'largest chunk':>14} {'dup. questions':>15}")
+    for path in inputs:
+        text = load_text(path)
+        fixed = chunk_stats(split_text_into_chunks(text))
+        by_question = chunk_stats(split_text_at_questions(text, max_tokens=args.chunk_tokens))
+        totals["fixed"] += fixed["prompt_tokens"]
+        totals["questions"] += by_question["prompt_tokens"]
+        for name, stats in (("fixed", fixed), ("questions", by_question)):
+            print(f"{path.name:<12} {name:<10} {stats['chunks']:>7} {stats['prompt_tokens']:>14} {stats['largest_chunk']:>14} "
+                  f"{stats['duplicate_questions']:>15}")
+
+    if totals["fixed"]:
+        saved = totals["fixed"] - totals["questions"]
+        print(f"\nPrompt tokens: {totals['fixed']} -> {totals['questions']} "
+              f"({saved / totals['fixed'] * 100:.1f}% saved)")
+
+if __name__ == "__main__":
+    main()
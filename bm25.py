@@ -0,0 +1,231 @@
+import gzip
+import hashlib
+import json
+import math
+import os
+import re
+import unicodedata
+from collections import Counter
+from typing import Dict, List, Tuple
+import numpy as np
+
+SPANISH_STOPWORDS = set("""
+a al algo algun alguna algunas alguno algunos ante antes aquel aquella aquellas aquello aquellos aqui asi
+cada como con contra cual cuales cualquier cuando de del desde donde dos el ella ellas ello ellos en entre
+era eran es esa esas ese eso esos esta estan estas este esto estos fue fueron ha han hasta hay la las le
+les lo los mas me mi mis mucho muy nada ni no nos o otra otras otro otros para pero poco por porque que
+quien quienes se segun ser si sin sobre solo su sus tal tambien tan tanto te tiene tienen todo todos tu
+un una unas uno unos y ya
+""".split())
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def fold_accents(text: str) -> str:
+    """Lowercase and strip diacritics (e.g. "Constitución" -> "constitucion")."""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def light_stem(token: str) -> str:
+    """
+    Light Spanish stemmer: removes plural and gender endings and a few common
+    derivational suffixes, which is enough to match "leyes"/"ley", "orgánicas"/"orgánico" or
+    "constitución"/"constitucional".
+    """
+    if len(token) <= 4 or token.isdigit():
+        return token
+    for suffix in ("amientos", "imientos", "amiento", "imiento", "mente"):
+        if token.endswith(suffix) and len(token) - len(suffix) >= 4:
+            return token[:-len(suffix)]
+    if token.endswith("ces"):
+        token = token[:-3] + "z"
+    elif token.endswith("es") and token[-3] not in "aeiou":
+        token = token[:-2]
+    elif token.endswith("s"):
+        token = token[:-1]
+    if token.endswith("al") and len(token) >= 7:
+        token = token[:-2]
+    elif token[-1] in "aeo" and len(token) > 4:
+        token = token[:-1]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    """Spanish-aware tokenization: accent folding, stopword removal and light stemming."""
+    return [light_stem(token) for token in TOKEN_PATTERN.findall(fold_accents(text)) if token not in SPANISH_STOPWORDS]
+
+
+def corpus_hash(texts: List[str]) -> str:
+    digest = hashlib.sha256()
+    for text in texts:
+        digest.update(hashlib.sha256(text.encode("utf-8")).digest())
+    return digest.hexdigest()
+
+
+class BM25Index:
+    """
+    Local inverted-index BM25 retriever over a list of documents.
+
+    Postings are kept as numpy arrays per term, so scoring a query is a handful of
+    vectorized updates over the documents that contain its terms.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.corpus_hash = None
+        self.doc_lengths = np.zeros(0, dtype=np.float32)
+        self.postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self.idf: Dict[str, float] = {}
+
+    def build(self, texts: List[str]) -> "BM25Index":
+        """
+        Index the documents.
+
+        Args:
+            texts (List[str]): Document texts; results refer to their positions
+
+        Returns:
+            BM25Index: self
+        """
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+        lengths = []
+        for doc_id, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                postings.setdefault(term, []).append((doc_id, tf))
+
+        self.corpus_hash = corpus_hash(texts)
+        self.doc_lengths = np.array(lengths, dtype=np.float32)
+        self.postings = {
+            term: (np.array([d for d, _ in entries], dtype=np.int32), np.array([tf for _, tf in entries], dtype=np.float32))
+            for term, entries in postings.items()
+        }
+        self._compute_idf()
+        return self
+
+    def _compute_idf(self) -> None:
+        n_docs = len(self.doc_lengths)
+        self.idf = {
+            term: math.log(1 + (n_docs - len(doc_ids) + 0.5) / (len(doc_ids) + 0.5))
+            for term, (doc_ids, _) in self.postings.items()
+        }
+        self._avg_length = float(self.doc_lengths.mean()) if n_docs else 0.0
+
+    def scores(self, query: str) -> np.ndarray:
+        """BM25 score of every document for a query."""
+        scores = np.zeros(len(self.doc_lengths), dtype=np.float32)
+        if not len(scores):
+            return scores
+        norm = self.k1 * (1 - self.b + self.b * self.doc_lengths / max(self._avg_length, 1e-9))
+        for term in set(tokenize(query)):
+            if term not in self.postings:
+                continue
+            doc_ids, tfs = self.postings[term]
+            scores[doc_ids] += self.idf[term] * tfs * (self.k1 + 1) / (tfs + norm[doc_ids])
+        return scores
+
+    def search(self, query: str, top_k: int = 3) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Args:
+            query (str): Query text
+            top_k (int): Number of results
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: (document indices, scores), best first
+        """
+        scores = self.scores(query)
+        top_k = min(top_k, len(scores))
+        if top_k == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+        order = np.argsort(-scores[candidates])
+        return candidates[order], scores[candidates[order]]
+
+    def save(self, path: str) -> None:
+        """Serialize the index to gzipped JSON."""
+        data = {
+            "k1": self.k1,
+            "b": self.b,
+            "corpus_hash": self.corpus_hash,
+            "doc_lengths": self.doc_lengths.tolist(),
+            "postings": {term: [doc_ids.tolist(), tfs.astype(int).tolist()] for term, (doc_ids, tfs) in self.postings.items()},
+        }
+        tmp_path = path + ".tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+        index = cls(k1=data["k1"], b=data["b"])
+        index.corpus_hash = data["corpus_hash"]
+        index.doc_lengths = np.array(data["doc_lengths"], dtype=np.float32)
+        index.postings = {
+            term: (np.array(doc_ids, dtype=np.int32), np.array(tfs, dtype=np.float32))
+            for term, (doc_ids, tfs) in data["postings"].items()
+        }
+        index._compute_idf()
+        return index
+
+    @classmethod
+    def load_or_build(cls, texts: List[str], path: str) -> "BM25Index":
+        """
+        Load the index stored at `path` if it was built from the same texts, otherwise build and save it.
+        """
+        if os.path.exists(path):
+            index = cls.load(path)
+            if index.corpus_hash == corpus_hash(texts):
+                return index
+        index = cls().build(texts)
+        index.save(path)
+        return index
+
+
+def reciprocal_rank_fusion(rankings: List[List[int]], top_k: int, k: int = 60) -> List[int]:
+    """
+    Fuse several ranked lists of document indices with reciprocal-rank fusion.
+
+    Args:
+        rankings (List[List[int]]): Ranked document indices from each retriever, best first
+        top_k (int): Number of fused results
+        k (int): RRF damping constant
+
+    Returns:
+        List[int]: Fused document indices, best first
+    """
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            fused[int(doc_id)] = fused.get(int(doc_id), 0.0) + 1.0 / (k + rank + 1)
+    return sorted(fused, key=lambda doc_id: -fused[doc_id])[:top_k]
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description='Build a BM25 index over a context file and time queries against it')
+    parser.add_argument('context_file', help='Path to the context JSON file ([{"data": {"text": ...}}])')
+    parser.add_argument('questions_file', help='Path to a questions JSON file used as queries')
+    parser.add_argument('--top_k', type=int, default=3, help='Number of documents per query (default: 3)')
+
+    args = parser.parse_args()
+    with open(args.context_file, 'r', encoding='utf-8') as f:
+        texts = [doc["data"]["text"] for doc in json.load(f)]
+    with open(args.questions_file, 'r', encoding='utf-8') as f:
+        queries = [question["question"] for question in json.load(f)]
+
+    start = time.perf_counter()
+    index = BM25Index.load_or_build(texts, os.path.splitext(args.context_file)[0] + "_bm25.json.gz")
+    print(f"Index ready in {(time.perf_counter() - start) * 1000:.1f} ms ({len(texts)} documents, {len(index.postings)} terms)")
+
+    start = time.perf_counter()
+    for query in queries:
+        index.search(query, args.top_k)
+    elapsed = time.perf_counter() - start
+    print(f"{len(queries)} queries in {elapsed * 1000:.1f} ms ({elapsed / max(len(queries), 1) * 1e6:.0f} µs/query)")
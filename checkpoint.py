@@ -0,0 +1,119 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict
+
+
+def question_key(question: Dict[str, Any], *extra: str) -> str:
+    """
+    Stable identifier of a question, based on its text and options.
+
+    Args:
+        question (Dict[str, Any]): Question with 'question' and optionally 'options'
+        *extra (str): Additional values that scope the key (e.g. the model name)
+
+    Returns:
+        str: Hex SHA-1 digest
+    """
+    payload = json.dumps(
+        [question.get("question"), question.get("options"), *extra],
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+class JsonlCheckpoint:
+    """
+    Append-only JSONL log of completed work items, used to resume long runs.
+
+    Each line is {"key": ..., "record": ...}. Lines are flushed on every append and
+    fsync'ed in batches, so a crash loses at most the last unsynced batch.
+    """
+
+    def __init__(self, path: str, fsync_every: int = 20, fsync_interval: float = 5.0):
+        """
+        Args:
+            path (str): Path to the JSONL checkpoint file
+            fsync_every (int): Fsync after this many appended records
+            fsync_interval (float): Fsync at least this often (seconds) while appending
+        """
+        self.path = path
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self._lock = threading.Lock()
+        self._file = None
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def load(self) -> Dict[str, Any]:
+        """
+        Read the records completed by previous runs.
+
+        Returns:
+            Dict[str, Any]: Record for each key (the last one wins if a key was written twice)
+        """
+        records = {}
+        if not os.path.exists(self.path):
+            return records
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # A crash can leave a partially written last line
+                    continue
+                records[entry["key"]] = entry["record"]
+        return records
+
+    def append(self, key: str, record: Any) -> None:
+        """
+        Append a completed record.
+
+        Args:
+            key (str): Identifier of the work item
+            record (Any): JSON-serializable result
+        """
+        line = json.dumps({"key": key, "record": record}, ensure_ascii=False) + "\n"
+        with self._lock:
+            if self._file is None:
+                checkpoint_dir = os.path.dirname(self.path)
+                if checkpoint_dir:
+                    os.makedirs(checkpoint_dir, exist_ok=True)
+                self._file = open(self.path, 'a', encoding='utf-8')
+            self._file.write(line)
+            self._file.flush()
+            self._unsynced += 1
+            if self._unsynced >= self.fsync_every or time.monotonic() - self._last_sync >= self.fsync_interval:
+                self._sync()
+
+    def _sync(self) -> None:
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._sync()
+                self._file.close()
+                self._file = None
+
+    def remove(self) -> None:
+        """Close and delete the checkpoint once its records are merged into the final output."""
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def default_checkpoint_path(output_file: str) -> str:
+    """Checkpoint file that sits next to `output_file`."""
+    return f"{output_file}.checkpoint.jsonl"
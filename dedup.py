@@ -0,0 +1,286 @@
+import json
+import os
+import zlib
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from bm25 import TOKEN_PATTERN, fold_accents
+from checkpoint import question_key
+
+# Mersenne-style prime just below 2**32 for the (a * x + b) mod p permutations
+MINHASH_PRIME = (1 << 32) - 5
+
+
+def normalize_tokens(text: str) -> List[str]:
+    """Lowercase, accent-folded word tokens, ignoring punctuation and layout."""
+    return TOKEN_PATTERN.findall(fold_accents(text))
+
+
+def shingles(text: str, size: int = 3) -> set:
+    """Set of word `size`-grams of the normalized text (the whole text if it is shorter)."""
+    tokens = normalize_tokens(text)
+    if len(tokens) <= size:
+        return {" ".join(tokens)}
+    return {" ".join(tokens[i:i + size]) for i in range(len(tokens) - size + 1)}
+
+
+def question_shingles(question: Dict[str, Any], size: int = 3) -> set:
+    """
+    Shingles of the question stem and of each option taken separately, so reordering the
+    options between exams does not change the set.
+    """
+    result = shingles(question.get('question', ''), size)
+    for text in (question.get('options') or {}).values():
+        result |= shingles(text or '', size)
+    return result
+
+
+class MinHasher:
+    """MinHash signatures: `num_perm` random hash permutations, min-reduced over a text's shingles."""
+
+    def __init__(self, num_perm: int = 128, shingle_size: int = 3, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.a = rng.integers(1, MINHASH_PRIME, size=num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, MINHASH_PRIME, size=num_perm, dtype=np.uint64)
+
+    def signature(self, question: Dict[str, Any]) -> np.ndarray:
+        hashes = np.array([zlib.crc32(shingle.encode('utf-8')) for shingle in question_shingles(question, self.shingle_size)], dtype=np.uint64)
+        permuted = (self.a[:, None] * hashes[None, :] + self.b[:, None]) % MINHASH_PRIME
+        return permuted.min(axis=1).astype(np.uint32)
+
+
+def estimated_similarity(signature_a: np.ndarray, signature_b: np.ndarray) -> float:
+    """Estimated Jaccard similarity: share of matching MinHash values."""
+    return float(np.mean(signature_a == signature_b))
+
+
+class LSHIndex:
+    """
+    Incremental LSH banding over MinHash signatures.
+
+    Each signature is cut into `bands` bands of equal size and each band is hashed to a
+    bucket; two items become candidates if they share a bucket in any band, so finding
+    the duplicates of an item costs a few dictionary lookups instead of a full scan.
+    """
+
+    def __init__(self, num_perm: int = 128, bands: int = 32):
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be a multiple of bands ({bands})")
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.buckets: Dict[Tuple[int, bytes], List[int]] = {}
+        self.signatures: List[np.ndarray] = []
+
+    def _band_keys(self, signature: np.ndarray):
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def query(self, signature: np.ndarray, threshold: float) -> List[Tuple[int, float]]:
+        """Indexed items whose estimated similarity to `signature` is at least `threshold`, best first."""
+        candidates = set()
+        for key in self._band_keys(signature):
+            candidates.update(self.buckets.get(key, ()))
+        matches = [(item, estimated_similarity(signature, self.signatures[item])) for item in candidates]
+        return sorted([match for match in matches if match[1] >= threshold], key=lambda match: -match[1])
+
+    def add(self, signature: np.ndarray) -> int:
+        """Index a signature and return its item id (ids are assigned in insertion order)."""
+        item = len(self.signatures)
+        self.signatures.append(signature)
+        for key in self._band_keys(signature):
+            self.buckets.setdefault(key, []).append(item)
+        return item
+
+
+def find_clusters(questions: List[Dict[str, Any]], threshold: float = 0.7, num_perm: int = 128, bands: int = 32) -> List[List[Tuple[int, float]]]:
+    """
+    Group near-duplicate questions.
+
+    Args:
+        questions (List[Dict[str, Any]]): Questions with 'question' and 'options'
+        threshold (float): Minimum estimated Jaccard similarity of word 3-grams (stem and options)
+        num_perm (int): MinHash signature length
+        bands (int): LSH bands; more bands find lower-similarity candidates
+
+    Returns:
+        List[List[Tuple[int, float]]]: Clusters of two or more questions as (index, similarity to the
+        cluster's first member), each sorted by index
+    """
+    hasher = MinHasher(num_perm=num_perm)
+    index = LSHIndex(num_perm=num_perm, bands=bands)
+    parent = list(range(len(questions)))
+
+    def find(item: int) -> int:
+        while parent[item] != item:
+            parent[item] = parent[parent[item]]
+            item = parent[item]
+        return item
+
+    signatures = []
+    for question in questions:
+        signature = hasher.signature(question)
+        for match, _ in index.query(signature, threshold):
+            root_a, root_b = find(match), find(len(signatures))
+            parent[max(root_a, root_b)] = min(root_a, root_b)
+        signatures.append(signature)
+        index.add(signature)
+
+    groups: Dict[int, List[int]] = {}
+    for item in range(len(questions)):
+        groups.setdefault(find(item), []).append(item)
+    return [
+        [(item, estimated_similarity(signatures[members[0]], signatures[item])) for item in members]
+        for members in groups.values() if len(members) > 1
+    ]
+
+
+class NearDuplicateFilter:
+    """
+    Streaming near-duplicate check: each question is compared with the ones seen before it
+    through the LSH index, keeping only MinHash signatures in memory.
+    """
+
+    def __init__(self, threshold: float = 0.7, num_perm: int = 128, bands: int = 32):
+        self.threshold = threshold
+        self.hasher = MinHasher(num_perm=num_perm)
+        self.index = LSHIndex(num_perm=num_perm, bands=bands)
+
+    def is_duplicate(self, question: Dict[str, Any]) -> bool:
+        """True if a near-duplicate of the question was seen before; otherwise remember it."""
+        signature = self.hasher.signature(question)
+        if self.index.query(signature, self.threshold):
+            return True
+        self.index.add(signature)
+        return False
+
+
+def propagate_results(questions: List[Dict[str, Any]], clusters: List[List[Tuple[int, float]]]) -> Dict[str, int]:
+    """
+    Copy one LLM result to every member of a cluster that lacks it.
+
+    The category is the most common one in the cluster. A missing correct_answer is taken from
+    a member with an answer key and mapped by option text, since options can be reordered
+    between years; it is left empty if the correct option's text is not found.
+
+    Returns:
+        Dict[str, int]: Number of questions that received a category / correct_answer
+    """
+    filled = {"category": 0, "correct_answer": 0}
+    for cluster in clusters:
+        members = [questions[item] for item, _ in cluster]
+
+        categories = Counter(member['category'] for member in members if member.get('category'))
+        if categories:
+            category = categories.most_common(1)[0][0]
+            for member in members:
+                if not member.get('category'):
+                    member['category'] = category
+                    filled["category"] += 1
+
+        donors = [member for member in members if member.get('correct_answer') in (member.get('options') or {})]
+        if not donors:
+            continue
+        answer_tokens = normalize_tokens(donors[0]['options'][donors[0]['correct_answer']] or '')
+        for member in members:
+            if member.get('correct_answer'):
+                continue
+            for letter, text in (member.get('options') or {}).items():
+                if normalize_tokens(text or '') == answer_tokens:
+                    member['correct_answer'] = letter
+                    filled["correct_answer"] += 1
+                    break
+    return filled
+
+
+def cluster_report(questions: List[Dict[str, Any]], sources: List[str], clusters: List[List[Tuple[int, float]]]) -> Dict[str, Any]:
+    """Summary and member list of each cluster, largest first."""
+    clusters = sorted(clusters, key=lambda cluster: (-len(cluster), cluster[0][0]))
+    redundant = sum(len(cluster) - 1 for cluster in clusters)
+    return {
+        "total_questions": len(questions),
+        "clusters": len(clusters),
+        "redundant_questions": redundant,
+        "redundant_share": redundant / len(questions) if questions else 0.0,
+        "members": [
+            [
+                {
+                    "source": sources[item],
+                    "question_id": questions[item].get('question_id'),
+                    "similarity": round(similarity, 3),
+                    "category": questions[item].get('category'),
+                    "correct_answer": questions[item].get('correct_answer'),
+                    "question": questions[item].get('question'),
+                }
+                for item, similarity in cluster
+            ]
+            for cluster in clusters
+        ],
+    }
+
+
+def duplicate_keys(questions: List[Dict[str, Any]], threshold: float = 0.7) -> Dict[str, str]:
+    """
+    Map the question_key of every clustered question to the key of its cluster's first member,
+    so pipeline stages can run the LLM once per cluster.
+    """
+    keys = [question_key(question) for question in questions]
+    mapping = {}
+    for cluster in find_clusters(questions, threshold=threshold):
+        for item, _ in cluster:
+            mapping[keys[item]] = keys[cluster[0][0]]
+    return mapping
+
+
+def load_year_questions(years: List[int], filename: str) -> Tuple[Dict[str, List[Dict[str, Any]]], List[Dict[str, Any]], List[str]]:
+    """Read data/parsing/{year}/{filename} for each year that has it."""
+    files, questions, sources = {}, [], []
+    for year in years:
+        path = f"data/parsing/{year}/{filename}"
+        if not os.path.exists(path):
+            print(f"Skipping {path} (not found)")
+            continue
+        with open(path, 'r', encoding='utf-8') as f:
+            files[path] = json.load(f)
+        questions.extend(files[path])
+        sources.extend([path] * len(files[path]))
+    return files, questions, sources
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Find near-duplicate questions across exam years and share LLM results within each cluster')
+    parser.add_argument('--years', type=int, nargs='+', default=[2004, 2005, 2006, 2023, 2024],
+                        help='Exam years to process from data/parsing/{year}/')
+    parser.add_argument('--filename', default='categorized_questions.json',
+                        help='Question file in each year folder (default: categorized_questions.json)')
+    parser.add_argument('--threshold', type=float, default=0.7,
+                        help='Minimum estimated Jaccard similarity of word 3-grams (default: 0.7)')
+    parser.add_argument('--report', default='data/parsing/dedup_report.json',
+                        help='Where to write the cluster report (default: data/parsing/dedup_report.json)')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='Only write the report, do not update the question files')
+
+    args = parser.parse_args()
+    files, questions, sources = load_year_questions(args.years, args.filename)
+    clusters = find_clusters(questions, threshold=args.threshold)
+    report = cluster_report(questions, sources, clusters)
+    print(f"{report['total_questions']} questions, {report['clusters']} clusters, "
+          f"{report['redundant_questions']} redundant ({report['redundant_share'] * 100:.1f}%)")
+
+    if not args.dry_run:
+        filled = propagate_results(questions, clusters)
+        print(f"Propagated {filled['category']} categories and {filled['correct_answer']} answers")
+        for path, data in files.items():
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+
+    with open(args.report, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Cluster report saved to {args.report}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+import hashlib
+import json
+import os
+import re
+from typing import Callable, List, Tuple
+import numpy as np
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """L2-normalize each row of a matrix (zero rows are left as zeros)."""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return np.ascontiguousarray(matrix / norms, dtype=np.float32)
+
+
+def top_k_search(queries: np.ndarray, matrix: np.ndarray, top_k: int, block_size: int = 65536,
+                 normalize: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Exact top-k by dot product of every query against every row of `matrix`.
+
+    The matrix is scanned in blocks of `block_size` rows, each block is scored with a
+    single matmul and reduced with np.argpartition, so memory stays bounded at
+    len(queries) x block_size scores regardless of corpus size.
+
+    Args:
+        queries (np.ndarray): Query vectors, shape (n_queries, dim)
+        matrix (np.ndarray): Document vectors, shape (n_docs, dim)
+        top_k (int): Number of results per query
+        block_size (int): Rows of `matrix` scored at a time
+        normalize (bool): L2-normalize each block of `matrix` before scoring (cosine search over raw vectors)
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: (indices, scores), each (n_queries, k), best first
+    """
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    n_queries, n_docs = queries.shape[0], matrix.shape[0]
+    top_k = min(top_k, n_docs)
+    best_scores = np.full((n_queries, 0), -np.inf, dtype=np.float32)
+    best_indices = np.empty((n_queries, 0), dtype=np.int64)
+
+    for start in range(0, n_docs, block_size):
+        block = np.asarray(matrix[start:start + block_size], dtype=np.float32)
+        if normalize:
+            block = normalize_rows(block)
+        scores = queries @ block.T
+        k = min(top_k, scores.shape[1])
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        # Merge the block's candidates with the running best
+        merged_scores = np.concatenate([best_scores, np.take_along_axis(scores, candidates, axis=1)], axis=1)
+        merged_indices = np.concatenate([best_indices, candidates + start], axis=1)
+        if merged_scores.shape[1] > top_k:
+            keep = np.argpartition(-merged_scores, top_k - 1, axis=1)[:, :top_k]
+            merged_scores = np.take_along_axis(merged_scores, keep, axis=1)
+            merged_indices = np.take_along_axis(merged_indices, keep, axis=1)
+        best_scores, best_indices = merged_scores, merged_indices
+
+    order = np.argsort(-best_scores, axis=1)
+    return np.take_along_axis(best_indices, order, axis=1), np.take_along_axis(best_scores, order, axis=1)
+
+
+class EmbeddingStore:
+    """
+    Persistent document embeddings: a float32 .npy matrix plus a JSON manifest that maps
+    each row to the hash of the text it embeds and records the embedding model.
+
+    The matrix is loaded memory-mapped, and only new or changed documents are embedded.
+    """
+
+    def __init__(self, directory: str, model_name: str, normalize: bool = False):
+        """
+        Args:
+            directory (str): Directory holding the matrix and manifest
+            model_name (str): Embedding model; each model gets its own files
+            normalize (bool): Store L2-normalized rows, so dot products are cosine similarities
+        """
+        self.directory = directory
+        self.model_name = model_name
+        self.normalize = normalize
+        safe_name = re.sub(r"[^A-Za-z0-9_.-]", "_", model_name)
+        self.matrix_path = os.path.join(directory, f"{safe_name}.npy")
+        self.manifest_path = os.path.join(directory, f"{safe_name}.manifest.json")
+
+    def _load_manifest(self) -> dict:
+        if not (os.path.exists(self.manifest_path) and os.path.exists(self.matrix_path)):
+            return {"model": self.model_name, "hashes": []}
+        with open(self.manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get("model") != self.model_name or manifest.get("normalized", False) != self.normalize:
+            return {"model": self.model_name, "hashes": []}
+        return manifest
+
+    def get_embeddings(self, texts: List[str], embed_fn: Callable[[List[str]], List[List[float]]]) -> np.ndarray:
+        """
+        Return the embedding matrix for `texts`, embedding only what is not stored yet.
+
+        Args:
+            texts (List[str]): Documents, in the order the rows should have
+            embed_fn (Callable): Embeds a list of texts and returns one vector per text
+
+        Returns:
+            np.ndarray: Read-only memory-mapped float32 matrix of shape (len(texts), dim)
+        """
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+
+        hashes = [text_hash(text) for text in texts]
+        manifest = self._load_manifest()
+        if manifest["hashes"] == hashes:
+            return np.load(self.matrix_path, mmap_mode='r')
+
+        stored = np.load(self.matrix_path, mmap_mode='r') if manifest["hashes"] else None
+        stored_rows = {h: row for row, h in enumerate(manifest["hashes"])}
+
+        missing = list(dict.fromkeys(h for h in hashes if h not in stored_rows))
+        texts_by_hash = {h: text for h, text in zip(hashes, texts)}
+        print(f"Embedding {len(missing)} new or changed documents ({len(texts) - len(missing)} reused)")
+        new_vectors = {}
+        if missing:
+            embeddings = np.asarray(embed_fn([texts_by_hash[h] for h in missing]), dtype=np.float32)
+            if self.normalize:
+                embeddings = normalize_rows(embeddings)
+            new_vectors = {h: embeddings[i] for i, h in enumerate(missing)}
+
+        dim = stored.shape[1] if stored is not None else next(iter(new_vectors.values())).shape[0]
+        matrix = np.empty((len(texts), dim), dtype=np.float32)
+        for row, h in enumerate(hashes):
+            matrix[row] = stored[stored_rows[h]] if h in stored_rows else new_vectors[h]
+        del stored
+
+        # Drop the manifest before replacing the matrix so an interrupted write can
+        # never pair an old manifest with a new matrix
+        os.makedirs(self.directory, exist_ok=True)
+        if os.path.exists(self.manifest_path):
+            os.remove(self.manifest_path)
+        tmp_matrix = self.matrix_path + ".tmp.npy"
+        np.save(tmp_matrix, matrix)
+        os.replace(tmp_matrix, self.matrix_path)
+        tmp_manifest = self.manifest_path + ".tmp"
+        with open(tmp_manifest, 'w', encoding='utf-8') as f:
+            json.dump({"model": self.model_name, "dim": dim, "normalized": self.normalize, "hashes": hashes}, f)
+        os.replace(tmp_manifest, self.manifest_path)
+
+        return np.load(self.matrix_path, mmap_mode='r')
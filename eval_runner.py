@@ -0,0 +1,258 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from tqdm import tqdm
+from checkpoint import JsonlCheckpoint, question_key
+from llm_telemetry import percentile
+
+# Answer-only ("fast") mode: structured output holding just the chosen letter
+ANSWER_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "answer": {"type": "string", "enum": ["a", "b", "c", "d"]}
+    },
+    "required": ["answer"],
+    "additionalProperties": False
+}
+# Enough for {"answer": "x"} in any tokenizer
+FAST_MAX_TOKENS = 16
+
+
+def extract_answer(response: str) -> Optional[str]:
+    """Extract the letter after "Respuesta:" from a free-form LLM response."""
+    for line in response.split('\n'):
+        if line.lower().startswith('respuesta:'):
+            return line.split(':')[1].strip().lower()
+    return None
+
+
+def extract_structured_answer(response: Optional[str]) -> Optional[str]:
+    """Extract the letter from an answer-only JSON response, falling back to a "Respuesta:" line."""
+    if response is None:
+        return None
+    try:
+        answer = json.loads(response).get("answer")
+    except (json.JSONDecodeError, AttributeError):
+        return extract_answer(response)
+    return answer.strip().lower() if isinstance(answer, str) else None
+
+
+def samples_reasoning(question: Dict[str, Any], reasoning_sample: float) -> bool:
+    """Deterministically pick about `reasoning_sample` of the questions to keep full reasoning in fast mode."""
+    return int(question_key(question)[:8], 16) / 0x100000000 < reasoning_sample
+
+
+def model_label(llm) -> str:
+    return f"{llm.provider}:{llm.model_name}"
+
+
+def record_key(question: Dict[str, Any], llm, key_extra: Tuple[str, ...] = (), fast: bool = False,
+               reasoning_sample: float = 0.0) -> str:
+    """
+    Key of a model's record for a question in the records JSONL. Keyed on the provider as well as the model
+    name; fast-mode records are kept apart from full ones and, with a reasoning sample, per sample rate.
+    """
+    mode = ()
+    if fast:
+        mode = ("fast", f"reasoning_sample:{reasoning_sample}") if reasoning_sample > 0 else ("fast",)
+    return question_key(question, model_label(llm), *key_extra, *mode)
+
+
+def pending_questions(questions: List[Dict[str, Any]], llms: List[Any], completed: Dict[str, Any],
+                      key_extra: Tuple[str, ...] = (), fast: bool = False, reasoning_sample: float = 0.0) -> List[int]:
+    """Indices of the questions that some model has no record for in `completed` yet."""
+    return [index for index, question in enumerate(questions)
+            if any(record_key(question, llm, key_extra, fast, reasoning_sample) not in completed for llm in llms)]
+
+
+class EvalStats:
+    """Running accuracy, per-category breakdown and latency percentiles for one model."""
+
+    def __init__(self):
+        self.total = 0
+        self.correct = 0
+        self.categories: Dict[str, List[int]] = {}
+        self.latencies: List[float] = []
+
+    def add(self, record: Dict[str, Any]) -> None:
+        correct = record.get("correct", record["predicted_answer"] == record["correct_answer"])
+        self.total += 1
+        self.correct += int(correct)
+        counts = self.categories.setdefault(record.get("category") or "sin categoría", [0, 0])
+        counts[0] += int(correct)
+        counts[1] += 1
+        if record.get("latency_s") is not None:
+            self.latencies.append(record["latency_s"])
+
+    @property
+    def accuracy(self) -> float:
+        return self.correct / self.total * 100 if self.total else 0.0
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "accuracy": self.accuracy,
+            "total_questions": self.total,
+            "correct_answers": self.correct,
+            "per_category": {
+                category: {"correct": correct, "total": total, "accuracy": correct / total * 100}
+                for category, (correct, total) in sorted(self.categories.items())
+            },
+            # Batch runs have no per-question latency
+            "latency_s": {
+                "p50": percentile(self.latencies, 50) if self.latencies else None,
+                "p90": percentile(self.latencies, 90) if self.latencies else None,
+                "p99": percentile(self.latencies, 99) if self.latencies else None,
+            },
+        }
+
+
+def run_evaluation(
+    questions: List[Dict[str, Any]],
+    llms: List[Any],
+    build_prompt: Callable[[int, Dict[str, Any], bool], Tuple[str, Dict[str, Any]]],
+    records_path: Optional[str] = None,
+    concurrency: int = 4,
+    key_extra: Tuple[str, ...] = (),
+    batch: bool = False,
+    fast: bool = False,
+    reasoning_sample: float = 0.0,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Evaluate questions against one or more models with a thread pool.
+
+    Each question's prompt is built once and sent to every model. Per-question records are
+    streamed to a JSONL file as they complete, questions already recorded there are skipped
+    (so interrupted runs resume), and accuracy is updated incrementally.
+
+    In fast mode the models only return {"answer": <letter>} through structured output with
+    FAST_MAX_TOKENS completion tokens, except for a deterministic `reasoning_sample` share of
+    the questions, which keep the free-form reasoning prompt for spot checks.
+
+    Args:
+        questions (List[Dict[str, Any]]): Questions with 'question', 'options' and 'correct_answer'
+        llms (List[Any]): LLM instances to evaluate
+        build_prompt (Callable): Maps (index, question, answer_only) to (prompt, extra record fields)
+        records_path (str, optional): JSONL file for per-question records
+        concurrency (int): Questions processed at the same time
+        key_extra (Tuple[str, ...]): Extra values scoping the record keys (e.g. retriever settings)
+        batch (bool): Send each model's pending prompts as one provider batch job instead of
+            concurrent synchronous calls (no per-question latency is recorded)
+        fast (bool): Answer-only structured evaluation (records are kept apart from full-mode ones)
+        reasoning_sample (float): Share of questions that keep full reasoning in fast mode (0-1); records
+            of another sample rate are not reused
+
+    Returns:
+        Dict[str, Dict[str, Any]]: Summary and ordered results for each model, keyed by "provider:model"
+    """
+    records = JsonlCheckpoint(records_path) if records_path else None
+    completed = records.load() if records else {}
+    labels = [model_label(llm) for llm in llms]
+    stats = {label: EvalStats() for label in labels}
+    results: Dict[str, List[Optional[Dict[str, Any]]]] = {label: [None] * len(questions) for label in labels}
+    lock = threading.Lock()
+
+    def answer_only(question: Dict[str, Any]) -> bool:
+        return fast and not samples_reasoning(question, reasoning_sample)
+
+    def query(llm, prompt: str, structured: bool, batch_job: bool = False) -> Any:
+        if not structured:
+            return llm.query_llm_many(prompt, batch=True) if batch_job else llm.query_llm(prompt)
+        response_format = llm.json_schema_format("answer", ANSWER_SCHEMA)
+        if batch_job:
+            return llm.query_llm_many(prompt, max_tokens=FAST_MAX_TOKENS, response_format=response_format, batch=True)
+        return llm.query_structured_llm(prompt, max_tokens=FAST_MAX_TOKENS, response_format=response_format)
+
+    def key_for(question: Dict[str, Any], llm) -> str:
+        return record_key(question, llm, key_extra, fast, reasoning_sample)
+
+    def record_result(index: int, label: str, record: Dict[str, Any]) -> None:
+        with lock:
+            results[label][index] = record
+            stats[label].add(record)
+
+    # Results from previous runs
+    for index, question in enumerate(questions):
+        for llm, label in zip(llms, labels):
+            key = key_for(question, llm)
+            if key in completed:
+                record_result(index, label, completed[key])
+    pending = pending_questions(questions, llms, completed, key_extra, fast, reasoning_sample)
+
+    def make_record(question: Dict[str, Any], label: str, response: str, latency: Optional[float], extra: Dict[str, Any]) -> Dict[str, Any]:
+        structured = answer_only(question)
+        answer = extract_structured_answer(response) if structured else extract_answer(response)
+        return {
+            "model": label,
+            "question_id": question.get("question_id"),
+            "category": question.get("category"),
+            "question": question["question"],
+            "correct_answer": question["correct_answer"],
+            "predicted_answer": answer,
+            "correct": answer == question["correct_answer"],
+            "latency_s": latency,
+            **({"mode": "answer_only" if structured else "reasoning"} if fast else {}),
+            **extra,
+            "llm_response": response,
+        }
+
+    def save(index: int, llm, label: str, record: Dict[str, Any]) -> None:
+        if records:
+            records.append(key_for(questions[index], llm), record)
+        record_result(index, label, record)
+
+    def evaluate(index: int) -> None:
+        question = questions[index]
+        prompt, extra = build_prompt(index, question, answer_only(question))
+        for llm, label in zip(llms, labels):
+            if key_for(question, llm) in completed:
+                continue
+            start = time.perf_counter()
+            response = query(llm, prompt, answer_only(question))
+            latency = time.perf_counter() - start
+            save(index, llm, label, make_record(question, label, response, latency, extra))
+
+    try:
+        if batch:
+            # Prompts are still built once per question and shared by every model's job
+            prompts = {index: build_prompt(index, questions[index], answer_only(questions[index])) for index in pending}
+            for llm, label in zip(llms, labels):
+                indices = [index for index in pending if key_for(questions[index], llm) not in completed]
+                # Answer-only and full-reasoning prompts need different settings, so they go out as separate jobs
+                for structured in (False, True):
+                    group = [index for index in indices if answer_only(questions[index]) == structured]
+                    if not group:
+                        continue
+                    responses = query(llm, [prompts[index][0] for index in group], structured, batch_job=True)
+                    for index, response in zip(group, responses):
+                        # Failed batch requests are left unrecorded so a rerun retries them
+                        if response is not None:
+                            save(index, llm, label, make_record(questions[index], label, response, None, prompts[index][1]))
+        else:
+            with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+                futures = [executor.submit(evaluate, index) for index in pending]
+                with tqdm(total=len(futures)) as progress:
+                    for future in as_completed(futures):
+                        future.result()
+                        progress.update(1)
+                        progress.set_postfix({label: f"{stats[label].accuracy:.1f}%" for label in labels})
+    finally:
+        if records:
+            records.close()
+
+    # Questions whose batch request failed have no result
+    results = {label: [record for record in label_results if record is not None] for label, label_results in results.items()}
+    return {label: {**stats[label].summary(), "results": results[label]} for label in labels}
+
+
+def print_summary(summaries: Dict[str, Dict[str, Any]]) -> None:
+    """Print accuracy, per-category breakdown and latency percentiles for each model."""
+    for label, summary in summaries.items():
+        print(f"\n{label}")
+        print(f"Accuracy: {summary['accuracy']:.2f}% ({summary['correct_answers']}/{summary['total_questions']})")
+        latency = summary["latency_s"]
+        print("Latency: " + ", ".join(f"{name} {latency[name]:.2f}s" if latency[name] is not None else f"{name} n/a"
+                                      for name in ("p50", "p90", "p99")))
+        for category, counts in summary["per_category"].items():
+            print(f"  {category}: {counts['accuracy']:.1f}% ({counts['correct']}/{counts['total']})")
@@ -1,29 +1,37 @@
 import json
 import os
 import sys
+import argparse
 from llm import LLM
+from llm_providers import model_spec
+from checkpoint import JsonlCheckpoint
+from eval_runner import run_evaluation, print_summary, model_label
 
 def load_questions(file_path):
     with open(file_path, 'r', encoding='utf-8') as f:
         return json.load(f)
 
-def evaluate_questions(file_path, llm):
-    questions = load_questions(file_path)
-    total_questions = len(questions)
-    correct_answers = 0
+ANSWER_ONLY_INSTRUCTIONS = """Responda la siguiente pregunta de opción múltiple. Devuelva únicamente un objeto JSON con la letra de la respuesta correcta: {"answer": "a"}, {"answer": "b"}, {"answer": "c"} o {"answer": "d"}."""
+
+def build_prompt(question, answer_only=False):
+    # Build options text
+    options_text = ""
+    for option, text in question['options'].items():
+        if text:  # Only include non-empty options
+            options_text += f"{option}) {text}\n"
     
-    for question in questions:
-        print("Pregunta:")
-        print(f"{question['question']}\n")
-        
-        # Print options
-        options_text = ""
-        for option, text in question['options'].items():
-            if text:  # Only include non-empty options
-                options_text += f"{option}) {text}\n"
-        
-        # Create prompt for LLM
-        prompt = f"""Por favor responda la siguiente pregunta de opción múltiple. Primero proporcione su razonamiento, luego escribe la respuesta final (a, b, c, o d).
+    if answer_only:
+        # Fast mode: no reasoning, no worked example; the answer comes back as structured output
+        return f"""{ANSWER_ONLY_INSTRUCTIONS}
+
+Pregunta: {question['question']}
+
+Opciones:
+{options_text}
+"""
+
+    # Create prompt for LLM
+    return f"""Por favor responda la siguiente pregunta de opción múltiple. Primero proporcione su razonamiento, luego escribe la respuesta final (a, b, c, o d).
 Proporcione su razonamiento y respuesta en el siguiente formato:
 Razonamiento: [su razonamiento aquí]
 Respuesta: [a, b, c, o d]
@@ -48,39 +56,70 @@ Opciones:
 
 """
 
-        # Get LLM response
-        response = llm.query_llm(prompt)
-        print("\nLLM Response:")
-        print(response)
-        
-        # Extract answer from response
-        answer = None
-        for line in response.split('\n'):
-            if line.lower().startswith('respuesta:'):
-                answer = line.split(':')[1].strip().lower()
-                break
-        
-        # Check if answer is correct
-        if answer == question['correct_answer']:
-            correct_answers += 1
-            print("\n✅ Correct!")
-        else:
-            print(f"\n❌ Incorrect. The correct answer was {question['correct_answer']}")
-        
-        print("\n----------------------------------------")
-    
-    # Calculate and return accuracy
-    accuracy = (correct_answers/total_questions)*100
-    return accuracy
+def evaluate_models(file_path, llms, output_file=None, concurrency=4, batch=False, fast=False, reasoning_sample=0.0):
+    """
+    Evaluate one or more LLMs on every question of a file with the shared evaluation runner.
+
+    Each prompt is built once and sent to every model. When output_file is given,
+    per-question records are streamed to a .jsonl file next to it (a rerun resumes from
+    it) and the summaries are written to output_file at the end, after which the .jsonl is removed. With batch=True each model's
+    prompts go out as one provider batch job instead of concurrent synchronous calls. With fast=True
+    models only return the answer letter as structured output, except for a reasoning_sample share
+    of the questions (see eval_runner.run_evaluation).
+
+    Returns:
+        Dict[str, Dict]: Summary (accuracy, per-category breakdown, latency percentiles, results) per model
+    """
+    questions = load_questions(file_path)
+    records_path = os.path.splitext(output_file)[0] + ".jsonl" if output_file else None
+    summaries = run_evaluation(
+        questions,
+        llms,
+        lambda index, question, answer_only: (build_prompt(question, answer_only), {}),
+        records_path=records_path,
+        concurrency=concurrency,
+        batch=batch,
+        fast=fast,
+        reasoning_sample=reasoning_sample
+    )
+
+    if output_file:
+        # A single model keeps the original {accuracy, ..., results} shape
+        output = next(iter(summaries.values())) if len(summaries) == 1 else summaries
+        with open(output_file, 'w', encoding='utf-8') as f:
+            json.dump(output, f, ensure_ascii=False, indent=2)
+        # Records are merged now; they are kept only while failed batch requests are left to retry
+        if all(summary["total_questions"] == len(questions) for summary in summaries.values()):
+            JsonlCheckpoint(records_path).remove()
+    return summaries
+
+def evaluate_questions(file_path, llm, output_file=None, concurrency=4, batch=False, fast=False, reasoning_sample=0.0):
+    """Evaluate a single LLM and return its accuracy (see evaluate_models)."""
+    summaries = evaluate_models(file_path, [llm], output_file=output_file, concurrency=concurrency, batch=batch,
+                                fast=fast, reasoning_sample=reasoning_sample)
+    return summaries[model_label(llm)]["accuracy"]
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python evaluate_questions.py <questions_file_path>")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description='Evaluate LLMs on multiple-choice questions')
+    parser.add_argument('questions_file', help='Path to the questions JSON file')
+    parser.add_argument('--models', nargs='+', type=model_spec, default=['cohere:command-r-08-2024'],
+                        help='Models to evaluate as provider:model (default: cohere:command-r-08-2024)')
+    parser.add_argument('--concurrency', type=int, default=4,
+                        help='Questions evaluated at the same time (default: 4)')
+    parser.add_argument('--batch', action='store_true',
+                        help='Send each model\'s prompts as a provider batch job (cheaper, slower) instead of synchronous calls')
+    parser.add_argument('--fast', action='store_true',
+                        help='Answer-only mode: structured {"answer": letter} output with a few completion tokens, no reasoning')
+    parser.add_argument('--reasoning-sample', type=float, default=0.0,
+                        help='With --fast, share of questions (0-1) that still get full reasoning for spot checks (default: 0)')
+    parser.add_argument('--output', default='evaluation_results.json',
+                        help='Where to save the summaries; per-question records are streamed to a .jsonl next to it (default: evaluation_results.json)')
+    
+    args = parser.parse_args()
     
-    # Initialize LLM
-    llm = LLM(provider="cohere", model_name="command-r-08-2024")
+    # Initialize LLMs
+    llms = [LLM(provider=spec.split(':', 1)[0], model_name=spec.split(':', 1)[1], stage="evaluate") for spec in args.models]
     
-    file_path = sys.argv[1]
-    accuracy = evaluate_questions(file_path, llm)
-    print(f"\nAccuracy: {accuracy:.2f}%") 
\ No newline at end of file
+    summaries = evaluate_models(args.questions_file, llms, output_file=args.output, concurrency=args.concurrency,
+                                batch=args.batch, fast=args.fast, reasoning_sample=args.reasoning_sample)
+    print_summary(summaries)
@@ -2,9 +2,18 @@ import json
 import os
 import sys
 import argparse
-from llm import LLM
+import threading
+from llm import EMBEDDING_PROVIDERS, LLM
+from llm_providers import model_spec
+from checkpoint import JsonlCheckpoint
+from eval_runner import (ANSWER_SCHEMA, FAST_MAX_TOKENS, extract_answer, extract_structured_answer, model_label,
+                         pending_questions, print_summary, run_evaluation)
+from evaluate import ANSWER_ONLY_INSTRUCTIONS, load_questions
+from embedding_store import EmbeddingStore, normalize_rows, text_hash, top_k_search
+from ann_index import IVFIndex
+from bm25 import BM25Index, reciprocal_rank_fusion
 import numpy as np
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 from tqdm import tqdm
 class RAGEvaluator:
     def __init__(self, llm: LLM):
@@ -13,71 +22,228 @@ class RAGEvaluator:
         self.context_documents = None
         self.embed_model = "embed-english-v3.0"
         self.rerank_model = "rerank-v3.5"
+        # Directory for persisted document embeddings (default: next to the context file)
+        self.embedding_cache_dir = None
+        # "dense" (Cohere embed + rerank), "bm25" (local, no network) or "hybrid" (RRF of both, then rerank)
+        self.retriever = "dense"
+        self.bm25_index = None
+        # Approximate nearest-neighbour search for large corpora (None = exact brute force)
+        self.ann = None  # None, "ivf" or "ivf-int8"
+        self.ann_nprobe = 8
+        self.ann_index = None
+        # Skip the rerank call when dense retrieval is already decisive (None = always rerank):
+        # dense score gap between rank k and k+1 of at least rerank_skip_margin, or rank k standing
+        # rerank_skip_zscore standard deviations above the mean of the rest of the candidate pool
+        self.rerank_skip_margin = None
+        self.rerank_skip_zscore = None
+        # Dense candidates considered per query when a skip policy is set (default: top_k + 1)
+        self.rerank_pool = None
+        # Rerank results by (query hash, candidate set), persisted next to the context embeddings
+        self.rerank_cache = {}
+        self.rerank_cache_file = None
+        self.rerank_stats = {"calls": 0, "skipped": 0, "cached": 0}
+        self._rerank_lock = threading.Lock()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed documents with the Cohere embed endpoint"""
+        # Process in batches of 96 (Cohere's limit)
+        batch_size = 96
+        all_embeddings = []
+        
+        for i in range(0, len(texts), batch_size):
+            batch_texts = texts[i:i + batch_size]
+            response = self.llm.client.embed(
+                model=self.embed_model,
+                input_type="search_document",
+                texts=batch_texts,
+                embedding_types=["float"]
+            )
+            all_embeddings.extend(response.embeddings.float)
+        
+        return all_embeddings
 
     def load_context(self, context_file: str):
-        """Load and embed the context documents"""
+        """Load the context documents and their (persisted) embeddings and/or BM25 index"""
         with open(context_file, 'r', encoding='utf-8') as f:
             self.context_documents = json.load(f)
         
+        if self.retriever in ("bm25", "hybrid"):
+            texts = [doc["data"]["text"] for doc in self.context_documents]
+            self.bm25_index = BM25Index.load_or_build(texts, os.path.splitext(context_file)[0] + "_bm25.json.gz")
+        if self.retriever == "bm25":
+            return
+        
         # Embed the documents
-        if self.llm.provider == "cohere":
-            # For Cohere, we can use their embed endpoint
+        if self.llm.provider in EMBEDDING_PROVIDERS:
+            # For Cohere, we can use their embed endpoint; only new or changed
+            # documents are embedded, the rest is memory-mapped from disk
             texts = [doc["data"]["text"] for doc in self.context_documents]
-            
-            # Process in batches of 96 (Cohere's limit)
-            batch_size = 96
-            all_embeddings = []
-            
-            for i in range(0, len(texts), batch_size):
-                batch_texts = texts[i:i + batch_size]
-                response = self.llm.client.embed(
-                    model=self.embed_model,
-                    input_type="search_document",
-                    texts=batch_texts,
-                    embedding_types=["float"]
+            cache_dir = self.embedding_cache_dir or os.path.splitext(context_file)[0] + "_embeddings"
+            store = EmbeddingStore(cache_dir, self.embed_model, normalize=True)
+            # Pre-normalized, contiguous float32 rows: dot products are cosine similarities
+            self.context_embeddings = store.get_embeddings(texts, self.embed_documents)
+            if self.ann:
+                fingerprint = text_hash(self.embed_model + "".join(text_hash(text) for text in texts))
+                self.ann_index = IVFIndex.load_or_build(
+                    self.context_embeddings,
+                    os.path.join(cache_dir, f"{os.path.basename(store.matrix_path)[:-4]}_{self.ann}"),
+                    fingerprint,
+                    nprobe=self.ann_nprobe,
+                    quantize="int8" if self.ann == "ivf-int8" else "none"
                 )
-                all_embeddings.extend(response.embeddings.float)
-            
-            self.context_embeddings = all_embeddings
+            if self.rerank_cache_file is None:
+                self.rerank_cache_file = JsonlCheckpoint(os.path.join(cache_dir, f"rerank_{self.rerank_model.replace('/', '_')}.jsonl"))
+                self.rerank_cache.update(self.rerank_cache_file.load())
         else:
             # For other providers, we'll need to implement embedding
             raise NotImplementedError("Embedding not implemented for this provider")
 
-    def retrieve_relevant_documents(self, query: str, top_k: int = 3) -> List[Dict[str, Any]]:
-        """Retrieve the most relevant documents for a query"""
-        if self.llm.provider == "cohere":
-            # Embed the query
-            query_embedding = self.llm.client.embed(
+    def embed_queries(self, queries: List[str]) -> np.ndarray:
+        """Embed queries in batches of 96 and return them as normalized float32 rows"""
+        batch_size = 96
+        all_embeddings = []
+        for i in range(0, len(queries), batch_size):
+            response = self.llm.client.embed(
                 model=self.embed_model,
                 input_type="search_query",
-                texts=[query],
+                texts=queries[i:i + batch_size],
                 embedding_types=["float"]
-            ).embeddings.float[0]
+            )
+            all_embeddings.extend(response.embeddings.float)
+        return normalize_rows(np.array(all_embeddings, dtype=np.float32))
+
+    def dense_search(self, query_embeddings: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k context (indices, scores) for embedded queries, using the ANN index if one is loaded (-1 pads missing results)"""
+        if self.ann_index is not None:
+            return self.ann_index.search(query_embeddings, top_k)
+        return top_k_search(query_embeddings, self.context_embeddings, top_k)
+
+    def skips_rerank(self) -> bool:
+        return self.retriever == "dense" and (self.rerank_skip_margin is not None or self.rerank_skip_zscore is not None)
+
+    def candidate_pool(self, top_k: int) -> int:
+        """Candidates retrieved per query: top_k, or the larger pool the rerank-skip policy needs"""
+        return max(self.rerank_pool or 0, top_k + 1) if self.skips_rerank() else top_k
+
+    def retrieve_candidates(self, queries: List[str], top_k: int = 3, fusion_pool: int = 20,
+                            return_scores: bool = False) -> Any:
+        """
+        Top-k document indices for many queries with the configured retriever.
+        Dense retrieval uses batched embedding plus one blocked matmul; hybrid fuses the
+        dense and BM25 top `fusion_pool` lists with reciprocal-rank fusion. With a rerank-skip
+        policy, dense retrieval returns the larger candidate pool and, with return_scores=True,
+        (indices, scores) so the policy can be applied per query.
+        """
+        if self.retriever == "bm25":
+            indices = np.array([self.bm25_index.search(query, top_k)[0] for query in queries])
+            return (indices, None) if return_scores else indices
+        
+        if self.llm.provider in EMBEDDING_PROVIDERS:
+            query_embeddings = self.embed_queries(queries)
+            if self.retriever == "dense":
+                indices, scores = self.dense_search(query_embeddings, self.candidate_pool(top_k))
+                return (indices, scores) if return_scores else indices
+            dense_indices, _ = self.dense_search(query_embeddings, fusion_pool)
+            indices = np.array([
+                reciprocal_rank_fusion([dense[dense >= 0].tolist(), self.bm25_index.search(query, fusion_pool)[0].tolist()], top_k)
+                for query, dense in zip(queries, dense_indices)
+            ])
+            return (indices, None) if return_scores else indices
+        else:
+            raise NotImplementedError("Retrieval not implemented for this provider")
+
+    def dense_is_decisive(self, scores: np.ndarray, top_k: int) -> bool:
+        """Whether the rerank-skip policy trusts the dense top-k as is, given the pool's scores (best first)"""
+        scores = scores[np.isfinite(scores)]
+        if len(scores) <= top_k:
+            # Nothing outside the top-k could be reranked into it
+            return True
+        if self.rerank_skip_margin is not None and scores[top_k - 1] - scores[top_k] >= self.rerank_skip_margin:
+            return True
+        if self.rerank_skip_zscore is not None:
+            rest = scores[top_k:]
+            spread = float(np.std(scores))
+            if spread > 0 and (scores[top_k - 1] - float(np.mean(rest))) / spread >= self.rerank_skip_zscore:
+                return True
+        return False
+
+    def rerank(self, query: str, indices: List[int], top_k: int) -> List[int]:
+        """Rerank candidate documents, reusing the cached order for the same query and candidate set"""
+        hashes = [text_hash(self.context_documents[idx]["data"]["text"]) for idx in indices]
+        key = f"{text_hash(query)}:{text_hash(','.join(sorted(hashes)))}:{top_k}"
+        with self._rerank_lock:
+            cached = self.rerank_cache.get(key)
+            self.rerank_stats["cached" if cached is not None else "calls"] += 1
+        if cached is not None:
+            position = dict(zip(hashes, indices))
+            return [position[digest] for digest in cached]
+
+        rerank_response = self.llm.client.rerank(
+            model=self.rerank_model,
+            query=query,
+            documents=[self.context_documents[idx]["data"]["text"] for idx in indices],
+            top_n=top_k
+        )
+        order = [result.index for result in rerank_response.results]
+        with self._rerank_lock:
+            self.rerank_cache[key] = [hashes[i] for i in order]
+        if self.rerank_cache_file is not None:
+            self.rerank_cache_file.append(key, self.rerank_cache[key])
+        return [indices[i] for i in order]
+
+    def retrieve_relevant_documents(self, query: str, top_k: int = 3, candidates: np.ndarray = None,
+                                    scores: Optional[np.ndarray] = None) -> List[Dict[str, Any]]:
+        """
+        Retrieve the most relevant documents for a query, reranking precomputed candidates if given.
+
+        With a rerank-skip policy and the candidates' dense scores, a decisive dense top-k is
+        returned as is, saving the rerank round trip.
+        """
+        if candidates is None:
+            candidates, scores = self.retrieve_candidates([query], top_k, return_scores=True)
+            candidates, scores = candidates[0], scores[0] if scores is not None else None
+        valid = [i for i, idx in enumerate(candidates) if idx >= 0]
+        top_indices = [int(candidates[i]) for i in valid]
+        if self.retriever == "bm25":
+            # Zero-network retrieval: keep the BM25 order
+            return [self.context_documents[idx] for idx in top_indices]
+        
+        if self.llm.provider in EMBEDDING_PROVIDERS:
+            if self.skips_rerank() and scores is not None and self.dense_is_decisive(np.asarray(scores)[valid], top_k):
+                with self._rerank_lock:
+                    self.rerank_stats["skipped"] += 1
+                return [self.context_documents[idx] for idx in top_indices[:top_k]]
 
-            # Compute similarity scores
-            scores = np.dot(query_embedding, np.transpose(self.context_embeddings))[0]
-            top_indices = np.argsort(-scores)[:top_k]
-            
             # Rerank the documents
-            rerank_response = self.llm.client.rerank(
-                model=self.rerank_model,
-                query=query,
-                documents=[self.context_documents[idx]["data"]["text"] for idx in top_indices],
-                top_n=top_k
-            )
-            
-            # Return reranked documents
-            return [self.context_documents[top_indices[result.index]] for result in rerank_response.results]
+            return [self.context_documents[idx] for idx in self.rerank(query, top_indices, top_k)]
         else:
             raise NotImplementedError("Retrieval not implemented for this provider")
 
-    def evaluate_question(self, question: Dict[str, Any]) -> Dict[str, Any]:
-        """Evaluate a single question using RAG"""
+    def build_prompt(self, question: Dict[str, Any], candidates: np.ndarray = None,
+                     scores: Optional[np.ndarray] = None, answer_only: bool = False) -> Tuple[str, Dict[str, Any]]:
+        """
+        Retrieve context for a question and build the RAG prompt; returns (prompt, {"context_used": [...]}).
+        With answer_only the prompt asks for the letter alone, as structured output (fast mode).
+        """
         # Retrieve relevant documents
-        relevant_docs = self.retrieve_relevant_documents(question["question"])
+        relevant_docs = self.retrieve_relevant_documents(question["question"], candidates=candidates, scores=scores)
         
         # Create prompt with context
         context = "\n".join([doc["data"]["text"] for doc in relevant_docs])
+        options = chr(10).join([f"{k}) {v}" for k, v in question['options'].items() if v])
+        if answer_only:
+            prompt = f"""{ANSWER_ONLY_INSTRUCTIONS}
+
+Contexto:
+{context}
+
+Pregunta: {question['question']}
+
+Opciones:
+{options}
+"""
+            return prompt, {"context_used": [doc["data"]["text"] for doc in relevant_docs]}
+
         prompt = f"""Responda la siguiente pregunta de opción múltiple. Primero proporcione su razonamiento, luego escriba la respuesta final (a, b, c o d).
 Proporcione su razonamiento y respuesta en el siguiente formato:
 Razonamiento: [su razonamiento aquí]
@@ -106,73 +272,138 @@ Contexto:
 Pregunta: {question['question']}
 
 Opciones:
-{chr(10).join([f"{k}) {v}" for k, v in question['options'].items() if v])}
+{options}
 
 """
+        return prompt, {"context_used": [doc["data"]["text"] for doc in relevant_docs]}
+
+    def evaluate_question(self, question: Dict[str, Any], candidates: np.ndarray = None, answer_only: bool = False) -> Dict[str, Any]:
+        """Evaluate a single question using RAG (answer_only: structured letter only, see build_prompt)"""
+        prompt, extra = self.build_prompt(question, candidates=candidates, answer_only=answer_only)
         
         # Get LLM response
-        response = self.llm.query_llm(prompt)
-        
-        # Extract answer
-        answer = None
-        for line in response.split('\n'):
-            if line.lower().startswith('respuesta:'):
-                answer = line.split(':')[1].strip().lower()
-                break
+        if answer_only:
+            response = self.llm.query_structured_llm(prompt, max_tokens=FAST_MAX_TOKENS,
+                                                     response_format=self.llm.json_schema_format("answer", ANSWER_SCHEMA))
+        else:
+            response = self.llm.query_llm(prompt)
         
         return {
             "question": question["question"],
             "correct_answer": question["correct_answer"],
-            "predicted_answer": answer,
-            "context_used": [doc["data"]["text"] for doc in relevant_docs],
+            "predicted_answer": extract_structured_answer(response) if answer_only else extract_answer(response),
+            **extra,
             "llm_response": response
         }
 
-    def evaluate_questions(self, questions_file: str, context_file: str) -> Dict[str, Any]:
-        """Evaluate all questions using RAG"""
+    def evaluate_models(self, questions_file: str, context_file: str, llms: List[LLM] = None,
+                        records_path: str = None, concurrency: int = 4, batch: bool = False, fast: bool = False,
+                        reasoning_sample: float = 0.0) -> Dict[str, Dict[str, Any]]:
+        """
+        Evaluate all questions with one or more LLMs through the shared evaluation runner.
+
+        Retrieval runs once per question (batched for every pending question) and the same
+        prompt is sent to each model. Per-question records are streamed to records_path and
+        questions already recorded there are skipped. With batch=True each model's prompts go
+        out as one provider batch job. With fast=True models only return the answer letter as
+        structured output, except for a reasoning_sample share of the questions.
+
+        Returns:
+            Dict[str, Dict[str, Any]]: Summary and results per model, keyed by "provider:model"
+        """
         # Load questions
         with open(questions_file, 'r', encoding='utf-8') as f:
             questions = json.load(f)
+        llms = llms or [self.llm]
+        key_extra = (self.retriever, self.embed_model, self.rerank_model)
+        if self.skips_rerank():
+            # Results with a skip policy are not interchangeable with always-reranked ones
+            key_extra += (f"skip:{self.rerank_skip_margin}:{self.rerank_skip_zscore}:{self.rerank_pool}",)
         
-        # Load and embed context
-        self.load_context(context_file)
-        
-        # Evaluate each question
-        results = []
-        total_questions = len(questions)
-        correct_answers = 0
-        
-        for question in tqdm(questions):
-            result = self.evaluate_question(question)
-            results.append(result)
-            if result["predicted_answer"] == result["correct_answer"]:
-                correct_answers += 1
+        # Load and embed context (only needed if some questions are left)
+        completed = {}
+        if records_path:
+            records = JsonlCheckpoint(records_path)
+            completed = records.load()
+            records.close()
+        # The same keys run_evaluation uses, so candidates are retrieved for exactly the questions it will run
+        pending = pending_questions(questions, llms, completed, key_extra, fast, reasoning_sample)
+        candidates = {}
+        scores = {}
+        if pending:
+            self.load_context(context_file)
+            # Dense retrieval for every pending question at once
+            pending_candidates, pending_scores = self.retrieve_candidates([questions[i]["question"] for i in pending], return_scores=True)
+            candidates = dict(zip(pending, pending_candidates))
+            if pending_scores is not None:
+                scores = dict(zip(pending, pending_scores))
         
-        # Calculate accuracy
-        accuracy = (correct_answers / total_questions) * 100
-        
-        return {
-            "accuracy": accuracy,
-            "total_questions": total_questions,
-            "correct_answers": correct_answers,
-            "results": results
-        }
+        try:
+            return run_evaluation(
+                questions,
+                llms,
+                lambda index, question, answer_only: self.build_prompt(question, candidates=candidates[index], scores=scores.get(index),
+                                                                       answer_only=answer_only),
+                records_path=records_path,
+                concurrency=concurrency,
+                key_extra=key_extra,
+                batch=batch,
+                fast=fast,
+                reasoning_sample=reasoning_sample
+            )
+        finally:
+            if self.rerank_cache_file is not None:
+                self.rerank_cache_file.close()
+
+    def evaluate_questions(self, questions_file: str, context_file: str, checkpoint_path: str = None,
+                           concurrency: int = 4) -> Dict[str, Any]:
+        """Evaluate all questions with self.llm, resuming from a JSONL checkpoint if one is given"""
+        summaries = self.evaluate_models(questions_file, context_file, records_path=checkpoint_path, concurrency=concurrency)
+        return summaries[model_label(self.llm)]
 
 def main():
     parser = argparse.ArgumentParser(description='Evaluate RAG system performance')
     parser.add_argument('questions_file', help='Path to the questions JSON file')
     parser.add_argument('context_file', help='Path to the context JSON file')
+    parser.add_argument('--provider', default='cohere',
+                       help='Provider of the main model, embeddings and rerank: cohere, or mock for offline runs (default: cohere)')
     parser.add_argument('--model', default='command-r-08-2024', 
                        help='Main model to use for generation (default: command-r-plus)')
+    parser.add_argument('--models', nargs='+', type=model_spec, default=None,
+                       help='Evaluate several generation models as provider:model (overrides --model)')
+    parser.add_argument('--concurrency', type=int, default=4,
+                       help='Questions evaluated at the same time (default: 4)')
+    parser.add_argument('--batch', action='store_true',
+                       help='Send each model\'s prompts as a provider batch job (cheaper, slower) instead of synchronous calls')
+    parser.add_argument('--fast', action='store_true',
+                       help='Answer-only mode: structured {"answer": letter} output with a few completion tokens, no reasoning')
+    parser.add_argument('--reasoning-sample', type=float, default=0.0,
+                       help='With --fast, share of questions (0-1) that still get full reasoning for spot checks (default: 0)')
     parser.add_argument('--embed-model', default='embed-multilingual-v3.0',
                        help='Model to use for embeddings (default: embed-multilingual-v3.0)')
     parser.add_argument('--rerank-model', default='rerank-multilingual-v3.0',
                        help='Model to use for reranking (default: rerank-multilingual-v3.0)')
+    parser.add_argument('--retriever', choices=['bm25', 'dense', 'hybrid'], default='dense',
+                       help='Retriever: local BM25, Cohere dense + rerank, or RRF hybrid of both (default: dense)')
+    parser.add_argument('--ann', choices=['ivf', 'ivf-int8'], default=None,
+                       help='Use an approximate IVF index (optionally int8-compressed) instead of exact dense search')
+    parser.add_argument('--nprobe', type=int, default=8,
+                       help='Clusters scanned per query with --ann (default: 8)')
+    parser.add_argument('--rerank-skip-margin', type=float, default=None,
+                       help='Skip the rerank call when the dense score gap between rank k and k+1 is at least this (default: always rerank)')
+    parser.add_argument('--rerank-skip-zscore', type=float, default=None,
+                       help='Skip the rerank call when rank k scores this many standard deviations above the rest of the pool')
+    parser.add_argument('--rerank-pool', type=int, default=None,
+                       help='Dense candidates per question with a skip policy; reranking picks the top k among them (default: k + 1)')
+    parser.add_argument('--embedding-cache', default=None,
+                       help='Directory for persisted context embeddings (default: <context_file>_embeddings)')
+    parser.add_argument('--output', default='rag_evaluation_results.json',
+                       help='Where to save detailed results; per-question records are streamed to a .jsonl next to it (default: rag_evaluation_results.json)')
     
     args = parser.parse_args()
     
     # Initialize LLM with specified models
-    llm = LLM(provider="cohere", model_name=args.model)
+    llm = LLM(provider=args.provider, model_name=args.model, stage="evaluate_rag")
     
     # Initialize evaluator
     evaluator = RAGEvaluator(llm)
@@ -180,20 +411,37 @@ def main():
     # Set model parameters
     evaluator.embed_model = args.embed_model
     evaluator.rerank_model = args.rerank_model
+    evaluator.embedding_cache_dir = args.embedding_cache
+    evaluator.retriever = args.retriever
+    evaluator.ann = args.ann
+    evaluator.ann_nprobe = args.nprobe
+    evaluator.rerank_skip_margin = args.rerank_skip_margin
+    evaluator.rerank_skip_zscore = args.rerank_skip_zscore
+    evaluator.rerank_pool = args.rerank_pool
     
-    # Evaluate questions
-    results = evaluator.evaluate_questions(args.questions_file, args.context_file)
+    # Evaluate questions, streaming records next to the output file so an interrupted run can resume
+    output_file = args.output
+    records_path = os.path.splitext(output_file)[0] + ".jsonl"
+    llms = [LLM(provider=spec.split(':', 1)[0], model_name=spec.split(':', 1)[1], stage="evaluate_rag") for spec in args.models] if args.models else [llm]
+    summaries = evaluator.evaluate_models(args.questions_file, args.context_file, llms=llms,
+                                          records_path=records_path, concurrency=args.concurrency, batch=args.batch,
+                                          fast=args.fast, reasoning_sample=args.reasoning_sample)
     
     # Print results
-    print(f"\nAccuracy: {results['accuracy']:.2f}%")
-    print(f"Total Questions: {results['total_questions']}")
-    print(f"Correct Answers: {results['correct_answers']}")
+    print_summary(summaries)
+    stats = evaluator.rerank_stats
+    if evaluator.retriever != "bm25":
+        print(f"Rerank: {stats['calls']} calls, {stats['skipped']} skipped by the dense margin, {stats['cached']} served from the cache")
     
-    # Save detailed results
-    output_file = "rag_evaluation_results.json"
+    # Save detailed results (single model: same shape as before)
+    results = next(iter(summaries.values())) if len(summaries) == 1 else summaries
     with open(output_file, 'w', encoding='utf-8') as f:
         json.dump(results, f, ensure_ascii=False, indent=2)
     print(f"\nDetailed results saved to {output_file}")
+    # Records are merged now; they are kept only while failed batch requests are left to retry
+    total = len(load_questions(args.questions_file))
+    if all(summary["total_questions"] == total for summary in summaries.values()):
+        JsonlCheckpoint(records_path).remove()
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
@@ -1,10 +1,21 @@
 import os
-from typing import List, Dict
+from typing import List, Dict, Optional
 import json
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from tqdm import tqdm
 from llm import LLM
 import re
 
+# The id must not run into more digits ("2.500 euros" wrapped to a line start is not question 2)
+QUESTION_START_PATTERN = re.compile(r"^\s*(?:\*\*)?(\d{1,3})\s*(?:\*\*)?\s*[.)](?!\d)-?\s*(?:\*\*)?\s*(.*)$")
+OPTION_START_PATTERN = re.compile(r"^\s*(?:[-*]\s+)?(?:\*\*)?([a-dA-D])\s*(?:\*\*)?\s*[).]\s*(?:\*\*)?\s*(.*)$")
+ANSWER_KEY_PATTERN = re.compile(r"^\s*(?:\d+\s*[-.)]?\s*[a-dA-D]\b\s*){2,}$")
+OPTION_LETTERS = ['a', 'b', 'c', 'd']
+# "12) " / "b) " inside a paragraph, as parse_pdf writes questions (one paragraph per page)
+INLINE_MARKER_PATTERN = re.compile(r"(?<=\s)(\d{1,3}\)|[a-dA-D]\))\s+")
+TRAILING_PAGE_NUMBER_PATTERN = re.compile(r"\s+(\d{1,4})\s*$")
+
 def split_text_into_chunks(text: str, chunk_size: int = 3000, window_size: int = 200) -> List[str]:
     """
     Split text into chunks with windows to avoid splitting questions in half.
@@ -36,18 +47,120 @@ def split_text_into_chunks(text: str, chunk_size: int = 3000, window_size: int =
     
     return chunks
 
-def parse_question_chunk(chunk: str, llm: LLM) -> Dict[str, Dict]:
+_tokenizer = None
+
+def count_tokens(text: str) -> int:
     """
-    Parse a chunk of text containing questions into a dictionary with question_id as key.
+    Count tokens with the Mistral tokenizer (mistral-common), falling back to a
+    4-characters-per-token estimate when it is not installed.
+    
+    Args:
+        text (str): The text to measure
+    
+    Returns:
+        int: Number of tokens
+    """
+    global _tokenizer
+    if _tokenizer is None:
+        try:
+            from mistral_common.tokens.tokenizers.mistral import MistralTokenizer
+            _tokenizer = MistralTokenizer.v3(is_tekken=True).instruct_tokenizer.tokenizer
+        except ImportError:
+            _tokenizer = False
+    if _tokenizer is False:
+        return max(1, len(text) // 4)
+    return len(_tokenizer.encode(text, bos=False, eos=False))
+
+def split_oversized(segment: str, max_tokens: int) -> List[str]:
+    """
+    Cut a segment longer than the token budget into pieces that fit: at line breaks where
+    possible, and at word boundaries inside lines that are too long on their own.
+    """
+    tokens = count_tokens(segment)
+    if tokens <= max_tokens:
+        return [segment]
+    lines = segment.split('\n')
+    if len(lines) > 1:
+        pieces = []
+        for line in lines:
+            pieces.extend(split_oversized(line, max_tokens))
+        return pack_segments(pieces, max_tokens)
+    words = segment.split(' ')
+    # Characters per token of this text, to size the pieces before measuring them
+    target = max(1, int(len(segment) * max_tokens / tokens * 0.9))
+    pieces = []
+    current = ''
+    for word in words:
+        if current and len(current) + 1 + len(word) > target:
+            pieces.append(current)
+            current = word
+        else:
+            current = f"{current} {word}" if current else word
+    if current:
+        pieces.append(current)
+    return pieces
+
+def pack_segments(segments: List[str], max_tokens: int) -> List[str]:
+    """Greedily join consecutive segments (with line breaks) into chunks within the token budget."""
+    chunks = []
+    current = []
+    current_tokens = 0
+    for segment in segments:
+        segment_tokens = count_tokens(segment)
+        # +1 for the line break joining it to the chunk
+        if current and current_tokens + 1 + segment_tokens > max_tokens:
+            chunks.append('\n'.join(current))
+            current = []
+            current_tokens = 0
+        current_tokens += segment_tokens + (1 if current else 0)
+        current.append(segment)
+    if current:
+        chunks.append('\n'.join(current))
+    return chunks
+
+def split_text_at_questions(text: str, max_tokens: int = 1000) -> List[str]:
+    """
+    Split text only at detected question starts and pack whole questions into chunks
+    of at most `max_tokens` tokens, so no question is cut in half and no overlap is needed.
+
+    Paragraph text (as parse_pdf writes it) is first split at its inline question and option
+    markers. Question starts count only when their ids go up, so a stray number does not
+    split a question. A segment still longer than the budget (a run of text without
+    recognizable questions) is cut at line breaks, then word boundaries.
+    
+    Args:
+        text (str): The text to split
+        max_tokens (int): Token budget for each chunk
+    
+    Returns:
+        List[str]: List of non-overlapping text chunks
+    """
+    lines = split_inline_questions(text).split('\n')
+    starts = []
+    last_id = 0
+    for i, line in enumerate(lines):
+        match = QUESTION_START_PATTERN.match(line)
+        if match and int(match.group(1)) > last_id:
+            starts.append(i)
+            last_id = int(match.group(1))
+    if not starts or starts[0] != 0:
+        starts.insert(0, 0)
+    segments = ['\n'.join(lines[start:end]) for start, end in zip(starts, starts[1:] + [len(lines)])]
+    segments = [piece for segment in segments for piece in split_oversized(segment, max_tokens)]
+
+    return [chunk for chunk in pack_segments(segments, max_tokens) if chunk.strip()]
+
+def build_parse_prompt(chunk: str) -> str:
+    """
+    Build the prompt used by parse_question_chunk for a chunk of text.
     
     Args:
         chunk (str): The text chunk containing questions
-        llm (LLM): The LLM instance to use for parsing
     
     Returns:
-        Dict[str, Dict]: Dictionary of questions with question_id as key
+        str: The prompt
     """
-    prompt = f"""Please format the following text into a structured format where each question has:
+    return f"""Please format the following text into a structured format where each question has:
 1. A question_id (number)
 2. The question text
 3. The choices (a, b, c, d)
@@ -66,6 +179,19 @@ choices
 Here's the text to format:
 {chunk}"""
 
+def parse_question_chunk(chunk: str, llm: LLM) -> Dict[str, Dict]:
+    """
+    Parse a chunk of text containing questions into a dictionary with question_id as key.
+    
+    Args:
+        chunk (str): The text chunk containing questions
+        llm (LLM): The LLM instance to use for parsing
+    
+    Returns:
+        Dict[str, Dict]: Dictionary of questions with question_id as key
+    """
+    prompt = build_parse_prompt(chunk)
+
     print("prompt: ", prompt)
     # Call the LLM
     response = llm.query_llm(
@@ -75,6 +201,20 @@ Here's the text to format:
     )
     
     print(response)
+    return parse_chunk_response(response)
+
+def parse_chunk_response(response: Optional[str]) -> Dict[str, Dict]:
+    """
+    Parse the LLM output for one chunk into a dictionary with question_id as key.
+    
+    Args:
+        response (str, optional): LLM output (None when a batch request failed)
+    
+    Returns:
+        Dict[str, Dict]: Dictionary of questions with question_id as key
+    """
+    if response is None:
+        return {}
     # Split into questions by double newline
     questions = {}
     for question_text in response.split('\n\n'):
@@ -120,13 +260,193 @@ def parse_answer(answers: str) -> Dict[str, str]:
     # Create dictionary from pairs
     return {int(question_id): answer.lower() for question_id, answer in pairs}
 
-def clean_text(input_file: str, output_file: str) -> None:
+def find_boilerplate_lines(lines: List[str], min_repeats: int = 3) -> set:
+    """
+    Find page headers/footers: non-question lines repeated across pages (ignoring page
+    numbers inside them) and bare page numbers.
+
+    Args:
+        lines (List[str]): Lines of the text
+        min_repeats (int): Minimum number of occurrences for a line to count as a header/footer
+
+    Returns:
+        set: Indices of the lines to ignore while parsing
+    """
+    normalized = [re.sub(r"\d+", "#", line.strip()) for line in lines]
+    counts = {}
+    for line in normalized:
+        if line:
+            counts[line] = counts.get(line, 0) + 1
+
+    boilerplate = set()
+    for i, line in enumerate(lines):
+        stripped = line.strip()
+        if not stripped:
+            continue
+        if stripped.isdigit():
+            boilerplate.add(i)
+        elif counts[normalized[i]] >= min_repeats and not QUESTION_START_PATTERN.match(stripped) and not OPTION_START_PATTERN.match(stripped):
+            boilerplate.add(i)
+    return boilerplate
+
+def split_inline_questions(text: str) -> str:
+    """
+    Put every question and option of paragraph text on a line of its own.
+
+    parse_pdf writes each page as one paragraph ending with its page number. Trailing numbers
+    that count up from line to line are dropped as page numbers, and a line break is inserted
+    before each inline "N)" and "a)" to "d)" marker. Text that is already laid out one
+    question/option per line is left as it is.
+
+    Args:
+        text (str): The exam text
+
+    Returns:
+        str: The text with one question or option start per line
+    """
+    lines = text.split('\n')
+    numbers = [TRAILING_PAGE_NUMBER_PATTERN.search(line) for line in lines]
+    consecutive = sum(1 for previous, current in zip(numbers, numbers[1:])
+                      if previous and current and int(current.group(1)) == int(previous.group(1)) + 1)
+    if consecutive >= 2 and consecutive + 1 >= len([line for line in lines if line.strip()]) // 2:
+        lines = [line[:match.start()] if match else line for line, match in zip(lines, numbers)]
+    return '\n'.join(INLINE_MARKER_PATTERN.sub(lambda match: '\n' + match.group(1) + ' ', line) for line in lines)
+
+def parse_questions_locally(text: str) -> tuple:
+    """
+    Parse well-formed questions ("N) question a) ... b) ... c) ... d) ...") without calling the LLM.
+
+    Paragraph text is first split at inline question/option markers (split_inline_questions).
+    A small state machine then walks the lines; a question is accepted only if it has an id, a
+    non-empty stem and exactly the options a, b, c and d in order. Everything it cannot
+    validate is returned as raw text spans for the LLM; if nothing validates, the whole text is.
+
+    Args:
+        text (str): The exam text (without the answers line)
+
+    Returns:
+        tuple: (Dict[int, Dict] of validated questions keyed by question_id, List[str] of unresolved text spans)
+    """
+    lines = split_inline_questions(text).split('\n')
+    boilerplate = find_boilerplate_lines(lines)
+
+    # Group lines into blocks that each start at a question id
+    blocks = []
+    current = None
+    for i, line in enumerate(lines):
+        if i in boilerplate or not line.strip():
+            if current is not None:
+                current['end'] = i + 1
+            continue
+
+        question_match = QUESTION_START_PATTERN.match(line)
+        option_match = OPTION_START_PATTERN.match(line)
+        if question_match and (current is None or current['question_id'] is None
+                               or current['letters'] == OPTION_LETTERS
+                               or int(question_match.group(1)) == current['question_id'] + 1):
+            current = {
+                'question_id': int(question_match.group(1)),
+                'stem': [question_match.group(2).strip()],
+                'options': {},
+                'letters': [],
+                'start': i,
+                'end': i + 1,
+            }
+            blocks.append(current)
+            continue
+
+        if current is None or ANSWER_KEY_PATTERN.match(line):
+            # Preamble before the first question, or an answer key after the last one
+            blocks.append({'question_id': None, 'stem': [], 'options': {}, 'letters': [], 'start': i, 'end': i + 1})
+            current = blocks[-1]
+            continue
+
+        expected_letter = OPTION_LETTERS[len(current['letters'])] if len(current['letters']) < 4 else None
+        if option_match and option_match.group(1).lower() == expected_letter and current['question_id'] is not None:
+            current['letters'].append(expected_letter)
+            current['options'][expected_letter] = [option_match.group(2).strip()]
+        elif current['letters']:
+            current['options'][current['letters'][-1]].append(line.strip())
+        else:
+            current['stem'].append(line.strip())
+        current['end'] = i + 1
+
+    # Ids seen more than once are ambiguous and left to the LLM
+    id_counts = {}
+    for block in blocks:
+        if block['question_id'] is not None:
+            id_counts[block['question_id']] = id_counts.get(block['question_id'], 0) + 1
+
+    questions = {}
+    unresolved = []
+    for block in blocks:
+        stem = ' '.join(part for part in block['stem'] if part)
+        options = {letter: ' '.join(part for part in parts if part) for letter, parts in block['options'].items()}
+        if (block['question_id'] is not None and id_counts[block['question_id']] == 1 and stem
+                and block['letters'] == OPTION_LETTERS and all(options.values())):
+            questions[block['question_id']] = {
+                'question': stem,
+                'options': options,
+                'correct_answer': None
+            }
+        else:
+            span = '\n'.join(lines[block['start']:block['end']])
+            # Merge with the previous unresolved span if they are contiguous
+            if unresolved and unresolved[-1][1] == block['start']:
+                unresolved[-1] = (unresolved[-1][0], block['end'], unresolved[-1][2] + '\n' + span)
+            else:
+                unresolved.append((block['start'], block['end'], span))
+
+    if not questions:
+        # Nothing in a shape the parser knows: let the LLM read the original text
+        return questions, [text] if text.strip() else []
+    # Every unresolved span with a question or option start goes to the LLM; a bare preamble
+    # (title, instructions) or answer key does not
+    spans = [span for _, _, span in unresolved
+             if any(QUESTION_START_PATTERN.match(line) or OPTION_START_PATTERN.match(line) for line in span.split('\n'))]
+    return questions, spans
+
+def parse_chunks(chunks: List[str], llm: LLM, workers: int = 1, desc: str = None, batch: bool = False) -> List[Dict[str, Dict]]:
+    """
+    Parse chunks concurrently with a thread pool, returning results in chunk order.
+    
+    Args:
+        chunks (List[str]): Text chunks to parse
+        llm (LLM): The LLM instance to use for parsing
+        workers (int): Number of chunks parsed at the same time
+        desc (str, optional): Label for the progress bar
+        batch (bool): Send all chunks as one provider batch job instead of synchronous calls
+    
+    Returns:
+        List[Dict[str, Dict]]: Parsed questions for each chunk, in the same order as `chunks`
+    """
+    if batch:
+        responses = llm.query_llm_many([build_parse_prompt(chunk) for chunk in chunks], max_tokens=10000, temperature=0.0, batch=True)
+        return [parse_chunk_response(response) for response in responses]
+
+    if workers <= 1:
+        return [parse_question_chunk(chunk, llm) for chunk in tqdm(chunks, desc=desc)]
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(parse_question_chunk, chunk, llm) for chunk in chunks]
+        for _ in tqdm(as_completed(futures), total=len(futures), desc=desc):
+            pass
+        return [future.result() for future in futures]
+
+def clean_text(input_file: str, output_file: str, workers: int = 1, provider: str = "mistral", model_name: str = "mistral-large-latest", desc: str = None, fast_path: bool = True, chunk_tokens: int = 1000, batch: bool = False) -> None:
     """
     Cleans and formats text from an input file using an LLM and saves the result to an output file.
     
     Args:
         input_file (str): Path to the input text file
         output_file (str): Path where the cleaned text will be saved
+        workers (int): Number of chunks sent to the LLM concurrently (default: 1)
+        provider (str): LLM provider to use (default: "mistral")
+        model_name (str): Model name to use (default: "mistral-large-latest")
+        desc (str, optional): Label for the progress bar
+        fast_path (bool): Parse well-formed questions locally and only send the rest to the LLM (default: True)
+        chunk_tokens (int): Token budget of each chunk sent to the LLM (default: 1000)
+        batch (bool): Parse the chunks with a provider batch job (default: False)
     """
     # Read the input file
     with open(input_file, 'r', encoding='utf-8') as f:
@@ -139,19 +459,34 @@ def clean_text(input_file: str, output_file: str) -> None:
     text = '\n'.join(text.split('\n')[:-1])
 
 
-    # Initialize LLM client
-    llm = LLM(provider="mistral", model_name="mistral-large-latest")
-    
-    # Split text into chunks
-    chunks = split_text_into_chunks(text)
-    
-    # Parse each chunk
-    all_questions = {}
-    for chunk in tqdm(chunks):
-        questions = parse_question_chunk(chunk, llm)
+    # Resolve the well-formed questions without the LLM
+    if fast_path:
+        all_questions, spans = parse_questions_locally(text)
+    else:
+        all_questions, spans = {}, [text]
+    local_count = len(all_questions)
+
+    # Split the remaining text into whole-question chunks
+    chunks = [chunk for span in spans for chunk in split_text_at_questions(span, max_tokens=chunk_tokens)]
+
+    # Parse the chunks (possibly concurrently) and merge them in chunk order,
+    # so the first chunk containing a question_id still wins
+    if chunks:
+        llm = LLM(provider=provider, model_name=model_name, stage="format")
+        chunk_results = parse_chunks(chunks, llm, workers=workers, desc=desc, batch=batch)
+    else:
+        chunk_results = []
+    for questions in chunk_results:
         questions = {question_id: questions[question_id] for question_id in questions if question_id not in all_questions}
         all_questions.update(questions)
 
+    if not all_questions and text.strip():
+        # Fail the stage instead of handing an empty file to categorization and partitioning
+        raise ValueError(f"No questions found in {input_file}")
+    if all_questions:
+        print(f"Resolved locally: {local_count}/{len(all_questions)} questions "
+              f"({local_count / len(all_questions) * 100:.1f}%), {len(chunks)} chunks sent to the LLM")
+
     # add answers to all_questions
     for question_id in all_questions:
         try:
@@ -163,7 +498,7 @@ def clean_text(input_file: str, output_file: str) -> None:
     
     # reformat all_questions to be a list of questions to be like {question_id, question, options, correct_answer}
     final_questions = []
-    for question_id, question in all_questions.items():
+    for question_id, question in sorted(all_questions.items()):
         final_questions.append({
             "question_id": question_id,
             "question": question['question'],
@@ -175,10 +510,28 @@ def clean_text(input_file: str, output_file: str) -> None:
     with open(output_file, 'w', encoding='utf-8') as f:
         json.dump(final_questions, f, ensure_ascii=False, indent=2)
 
-if __name__ == "__main__":
-    # Example usage
-    years = [2023, 2024]
-    for year in years: 
+def main():
+    parser = argparse.ArgumentParser(description='Format parsed exam text into structured questions')
+    parser.add_argument('--years', type=int, nargs='+', default=[2023, 2024],
+                        help='Exam years to process from data/parsing/{year}/text.txt (default: 2023 2024)')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='Number of chunks sent to the LLM concurrently (default: 4)')
+    parser.add_argument('--no-fast-path', action='store_true',
+                        help='Send the whole text to the LLM instead of parsing well-formed questions locally')
+    parser.add_argument('--chunk-tokens', type=int, default=1000,
+                        help='Token budget of each chunk sent to the LLM (default: 1000)')
+    parser.add_argument('--batch', action='store_true',
+                        help='Send the chunks as a provider batch job (cheaper, slower) instead of synchronous calls')
+    parser.add_argument('--provider', default='mistral', help='LLM provider to use (default: mistral)')
+    parser.add_argument('--model', default='mistral-large-latest', help='Model to use (default: mistral-large-latest)')
+
+    args = parser.parse_args()
+    for year in args.years:
         input_file = f"data/parsing/{year}/text.txt"
         output_file = f"data/parsing/{year}/questions.json"
-        clean_text(input_file, output_file) 
\ No newline at end of file
+        clean_text(input_file, output_file, workers=args.workers, provider=args.provider,
+                   model_name=args.model, desc=str(year), fast_path=not args.no_fast_path, chunk_tokens=args.chunk_tokens,
+                   batch=args.batch)
+
+if __name__ == "__main__":
+    main()
@@ -1,60 +1,225 @@
+import json
 import os
-from mistralai import Mistral
-from cohere import ClientV2
+import random
+import time
+from typing import Dict, List, Optional, Tuple
+from adaptive_concurrency import get_limiter, get_retry_after, get_status_code, is_throttled
+from llm_cache import ResponseCache, get_default_cache
+from llm_providers import PROVIDERS, get_adapter, get_client
+from llm_telemetry import Telemetry, get_default_telemetry
 
-class LLM: 
-    def __init__(self, provider: str, model_name: str):
+# Providers with a batch-job API (cheaper, higher throughput, results within hours)
+BATCH_PROVIDERS = tuple(name for name, adapter in PROVIDERS.items() if adapter.batch)
+BATCH_ACTIVE_STATUSES = ("QUEUED", "RUNNING")
+# Providers whose client also serves embed and rerank (the offline mock mimics Cohere's)
+EMBEDDING_PROVIDERS = tuple(name for name, adapter in PROVIDERS.items() if adapter.embeddings)
+
+class LLM:
+    def __init__(self, provider: str, model_name: str, cache: Optional[ResponseCache] = None, server_url: Optional[str] = None,
+                 stage: str = "default", telemetry: Optional[Telemetry] = None, max_retries: int = 5,
+                 backoff_base: float = 1.0, backoff_max: float = 60.0, gateway_url: Optional[str] = None):
         self.provider = provider
         self.model_name = model_name
-
-        if self.provider == "mistral":
-            self.client = Mistral(api_key=os.getenv("MISTRAL_API_KEY"))
-        elif self.provider == "cohere":
-            self.client = ClientV2(api_key=os.getenv("COHERE_API_KEY"))
+        # Provider adapter from the llm_providers registry; raises ValueError for unknown providers
+        self.adapter = get_adapter(provider)
+        # Opt-in response cache; falls back to the one configured via LLM_CACHE_PATH
+        self.cache = cache if cache is not None else get_default_cache()
+        # Every call is recorded under this stage label (trace file set via LLM_TRACE_PATH)
+        self.stage = stage
+        self.telemetry = telemetry if telemetry is not None else get_default_telemetry()
+        # Throttled calls (429/5xx/timeouts) are retried with jittered backoff
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        # Alternative API endpoint (e.g. a local stand-in server), also read from <PROVIDER>_SERVER_URL
+        self.server_url = server_url or os.getenv(f"{provider.upper()}_SERVER_URL")
+        # Completions go through a local gateway (llm_gateway.py) when one is configured, also via LLM_GATEWAY_URL
+        gateway_url = gateway_url or os.getenv("LLM_GATEWAY_URL")
+        self.gateway = None
+        if gateway_url:
+            from llm_gateway import get_gateway_client
+            self.gateway = get_gateway_client(gateway_url)
+            # The gateway already retries upstream with backoff; retrying here too would multiply the attempts
+            self.max_retries = 0
+        # In-flight requests are capped by an AIMD window shared by every LLM of this provider/model in the
+        # process; behind a gateway it only paces this process, the gateway keeps the provider's window
+        if self.gateway is None:
+            self.limiter = get_limiter(provider, model_name)
         else:
-            raise ValueError(f"Provider {self.provider} not supported")
+            self.limiter = get_limiter("gateway", f"{provider}:{model_name}")
 
-    def query_llm(self, prompt: str, max_tokens: int = 1000, temperature: float = 0.0) -> str:
-        if self.provider == "mistral":
-            response = self.client.chat.complete(
-                model=self.model_name,
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=max_tokens,
-                temperature=temperature,
-            )
-            return response.choices[0].message.content
-        elif self.provider == "cohere":
-            response = self.client.chat(
-                model=self.model_name,
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=max_tokens,
-                temperature=temperature,
-            )
-            return response.message.content[0].text
+    @property
+    def client(self):
+        """
+        SDK client shared by every LLM of this provider/API key in the process, created on first use,
+        so completions through a gateway never build one (batch jobs, embed and rerank still use it).
+        """
+        return get_client(self.provider, self.server_url)
 
-        else:
-            raise ValueError(f"Provider {self.provider} not supported")
-        
+    def query_llm(self, prompt: str, max_tokens: int = 1000, temperature: float = 0.0) -> str:
+        return self._cached_complete(prompt, max_tokens, temperature)
 
     def query_structured_llm(self, prompt: str, max_tokens: int = 1000, temperature: float = 0.0, response_format: dict = None) -> str:
-        if self.provider == "mistral":
-            response = self.client.chat.complete(
-                model=self.model_name,
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=max_tokens,
-                temperature=temperature,
-                response_format=response_format
-            )
-            return response.choices[0].message.content
-        elif self.provider == "cohere":
-            response = self.client.chat(
-                model=self.model_name,
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=max_tokens,
-                temperature=temperature,
-                response_format=response_format
-            )
-            return response.message.content[0].text
+        return self._cached_complete(prompt, max_tokens, temperature, response_format)
 
-        else:
-            raise ValueError(f"Provider {self.provider} not supported")
\ No newline at end of file
+    def query_llm_many(self, prompts: List[str], max_tokens: int = 1000, temperature: float = 0.0, response_format: dict = None,
+                       batch: bool = False, poll_interval: float = 10.0) -> List[Optional[str]]:
+        """
+        Answer several prompts, either with one synchronous call each or as a single provider batch job.
+
+        Both paths share the response cache, so prompts answered by one are not sent again by the other.
+
+        Args:
+            prompts (List[str]): Prompts to answer
+            max_tokens (int): Maximum tokens per response
+            temperature (float): Sampling temperature
+            response_format (dict, optional): Structured-output format (see json_schema_format)
+            batch (bool): Submit the uncached prompts as a batch job and wait for it; providers
+                without a batch API fall back to synchronous calls
+            poll_interval (float): Seconds between batch job status checks
+
+        Returns:
+            List[Optional[str]]: Responses in prompt order; None for requests that failed inside a batch job
+        """
+        if not batch or not self.adapter.batch:
+            if batch:
+                print(f"Batch mode not supported for provider {self.provider}, using synchronous calls")
+            return [self._cached_complete(prompt, max_tokens, temperature, response_format) for prompt in prompts]
+
+        keys = [ResponseCache.make_key(self.provider, self.model_name, prompt, max_tokens, temperature, response_format) for prompt in prompts]
+        responses = {}
+        if self.cache is not None:
+            for key in keys:
+                start = time.perf_counter()
+                cached = self.cache.get(key)
+                if cached is not None:
+                    responses[key] = cached
+                    self._record("cache", time.perf_counter() - start)
+
+        # Identical prompts share a custom_id and are only sent once
+        missing = {key: prompt for key, prompt in zip(keys, prompts) if key not in responses}
+        if missing:
+            for key, response in self._batch_complete(missing, max_tokens, temperature, response_format, poll_interval).items():
+                responses[key] = response
+                if response is not None and self.cache is not None:
+                    self.cache.set(key, response)
+        return [responses.get(key) for key in keys]
+
+    def json_schema_format(self, name: str, schema: dict) -> dict:
+        """Build the provider-specific response_format that constrains output to a JSON schema."""
+        return self.adapter.json_schema_format(name, schema)
+
+    def _record(self, mode: str, latency: float, usage: Tuple[Optional[int], Optional[int]] = (None, None), error: Optional[str] = None,
+                queue_wait: float = 0.0, retries: int = 0) -> None:
+        self.telemetry.record(self.stage, self.provider, self.model_name, mode, latency=latency, queue_wait=queue_wait,
+                              prompt_tokens=usage[0], completion_tokens=usage[1], retries=retries, error=error,
+                              window=self.limiter.window)
+
+    def _cached_complete(self, prompt: str, max_tokens: int, temperature: float, response_format: dict = None) -> str:
+        key = None
+        if self.cache is not None:
+            key = ResponseCache.make_key(self.provider, self.model_name, prompt, max_tokens, temperature, response_format)
+            start = time.perf_counter()
+            cached = self.cache.get(key)
+            if cached is not None:
+                self._record("cache", time.perf_counter() - start)
+                return cached
+
+        response = self._complete_with_retries(prompt, max_tokens, temperature, response_format)
+        if self.cache is not None and response is not None:
+            self.cache.set(key, response)
+        return response
+
+    def _complete_with_retries(self, prompt: str, max_tokens: int, temperature: float, response_format: dict = None) -> str:
+        attempt = 0
+        queue_wait = 0.0
+        while True:
+            queue_wait += self.limiter.acquire()
+            start = time.perf_counter()
+            try:
+                response, usage = self._complete(prompt, max_tokens, temperature, response_format)
+            except Exception as e:
+                latency = time.perf_counter() - start
+                throttled = is_throttled(e)
+                retry_after = get_retry_after(e) if throttled else None
+                self.limiter.release(latency, throttled=throttled, retry_after=retry_after, failed=not throttled)
+                if not throttled or attempt >= self.max_retries:
+                    self._record("sync", latency, error=str(get_status_code(e) or type(e).__name__), queue_wait=queue_wait, retries=attempt)
+                    raise
+                # Full jitter keeps concurrent retries from synchronizing; never earlier than Retry-After
+                delay = max(retry_after or 0.0, random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt)))
+                attempt += 1
+                time.sleep(delay)
+                continue
+            latency = time.perf_counter() - start
+            self.limiter.release(latency)
+            self._record("sync", latency, usage, queue_wait=queue_wait, retries=attempt)
+            return response
+
+    def _complete(self, prompt: str, max_tokens: int, temperature: float, response_format: dict = None) -> Tuple[str, Tuple[Optional[int], Optional[int]]]:
+        """Returns the response text and its (prompt, completion) token usage, None where the provider omits it."""
+        if self.gateway is not None:
+            # Token usage is recorded by the gateway's own telemetry
+            return self.gateway.complete(self.provider, self.model_name, prompt, max_tokens, temperature, response_format), (None, None)
+        return self.adapter.complete(self.client, self.model_name, prompt, max_tokens, temperature, response_format)
+
+    def _batch_complete(self, prompts: Dict[str, str], max_tokens: int, temperature: float, response_format: dict, poll_interval: float) -> Dict[str, Optional[str]]:
+        """Run one batch job over {custom_id: prompt} and return {custom_id: response or None}."""
+        if not self.adapter.batch:
+            raise ValueError(f"Batch mode not supported for provider {self.provider}")
+
+        lines = []
+        for custom_id, prompt in prompts.items():
+            body = {
+                "messages": [{"role": "user", "content": prompt}],
+                "max_tokens": max_tokens,
+                "temperature": temperature
+            }
+            if response_format is not None:
+                body["response_format"] = response_format
+            lines.append(json.dumps({"custom_id": custom_id, "body": body}, ensure_ascii=False))
+
+        batch_file = self.client.files.upload(
+            file={
+                "file_name": f"batch_{int(time.time())}.jsonl",
+                "content": ("\n".join(lines) + "\n").encode("utf-8"),
+            },
+            purpose="batch",
+        )
+        start = time.perf_counter()
+        job = self.client.batch.jobs.create(
+            input_files=[batch_file.id],
+            model=self.model_name,
+            endpoint="/v1/chat/completions",
+            metadata={"job_type": "llm_batch"}
+        )
+        print(f"Batch job {job.id} created with {len(prompts)} requests")
+
+        while job.status in BATCH_ACTIVE_STATUSES:
+            time.sleep(poll_interval)
+            job = self.client.batch.jobs.get(job_id=job.id)
+            print(f"Batch job {job.id}: {job.status} "
+                  f"({job.succeeded_requests + job.failed_requests}/{job.total_requests} requests done)")
+
+        if not job.output_file:
+            raise RuntimeError(f"Batch job {job.id} ended with status {job.status} and no output")
+
+        # Map each output line back to its request; anything missing or failed stays None
+        results = {custom_id: None for custom_id in prompts}
+        output = self.client.files.download(file_id=job.output_file)
+        for line in output.read().decode("utf-8").splitlines():
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            response = entry.get("response") or {}
+            if entry.get("custom_id") not in results or response.get("status_code") != 200:
+                print("batch request failed: ", entry.get("custom_id"), entry.get("error"))
+                self._record("batch", time.perf_counter() - start, error=str(response.get("status_code") or "missing"))
+                continue
+            results[entry["custom_id"]] = response["body"]["choices"][0]["message"]["content"]
+            # Latency of a batch request is the wall time of the whole job
+            usage = response["body"].get("usage") or {}
+            self._record("batch", time.perf_counter() - start, (usage.get("prompt_tokens"), usage.get("completion_tokens")))
+        if job.failed_requests:
+            print(f"Batch job {job.id}: {job.failed_requests} requests failed")
+        return results
@@ -0,0 +1,240 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+
+class CacheMissError(KeyError):
+    """Raised in replay mode when a prompt has no stored response."""
+
+
+class ResponseCache:
+    """
+    Content-addressed on-disk cache of LLM responses backed by SQLite.
+
+    Responses are keyed on everything that determines the completion (provider,
+    model, prompt, max_tokens, temperature and response_format), so a rerun of any
+    stage only pays for prompts that actually changed.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_entries: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        max_age_seconds: Optional[float] = None,
+        replay: bool = False,
+    ):
+        """
+        Args:
+            path (str): Path to the SQLite database file (created if missing)
+            max_entries (int, optional): Keep at most this many responses (least recently used are evicted)
+            max_bytes (int, optional): Keep at most this many bytes of response text
+            max_age_seconds (float, optional): Drop responses older than this
+            replay (bool): Read-only mode; misses raise CacheMissError instead of calling the provider
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.replay = replay
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        cache_dir = os.path.dirname(path)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )"""
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(
+        provider: str,
+        model_name: str,
+        prompt: str,
+        max_tokens: int,
+        temperature: float,
+        response_format: Optional[dict] = None,
+    ) -> str:
+        """
+        Build the cache key for a request.
+
+        Returns:
+            str: Hex SHA-256 digest of the canonical JSON encoding of the request
+        """
+        payload = json.dumps(
+            {
+                "provider": provider,
+                "model": model_name,
+                "prompt": prompt,
+                "max_tokens": max_tokens,
+                "temperature": temperature,
+                "response_format": response_format,
+            },
+            sort_keys=True,
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Look up a stored response.
+
+        Args:
+            key (str): Key returned by make_key
+
+        Returns:
+            Optional[str]: The stored response, or None on a miss (outside replay mode)
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and self.max_age_seconds is not None and now - row[1] > self.max_age_seconds:
+                row = None
+            if row is None:
+                self.misses += 1
+                if self.replay:
+                    raise CacheMissError(key)
+                return None
+            self.hits += 1
+            if not self.replay:
+                self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+                self._conn.commit()
+            return row[0]
+
+    def set(self, key: str, response: str) -> None:
+        """
+        Store a response and apply the eviction limits. No-op in replay mode.
+
+        Args:
+            key (str): Key returned by make_key
+            response (str): Response text to store
+        """
+        if self.replay:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, size, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, response, len(response.encode("utf-8")), now, now),
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def evict(self) -> None:
+        """Apply the age, entry and size limits immediately."""
+        if self.replay:
+            return
+        with self._lock:
+            self._evict(time.time())
+            self._conn.commit()
+
+    def _evict(self, now: float) -> None:
+        if self.max_age_seconds is not None:
+            self._conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.max_age_seconds,))
+        if self.max_entries is not None:
+            self._conn.execute(
+                """DELETE FROM responses WHERE key IN (
+                    SELECT key FROM responses ORDER BY last_access DESC LIMIT -1 OFFSET ?
+                )""",
+                (self.max_entries,),
+            )
+        if self.max_bytes is not None:
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total > self.max_bytes:
+                # Walk from least recently used and drop until we are under the limit
+                to_delete = []
+                for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY last_access ASC"):
+                    if total <= self.max_bytes:
+                        break
+                    to_delete.append((key,))
+                    total -= size
+                self._conn.executemany("DELETE FROM responses WHERE key = ?", to_delete)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns:
+            Dict[str, Any]: Hit/miss counters for this process and the size of the store
+        """
+        with self._lock:
+            entries, total_bytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "bytes": total_bytes,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_default_cache: Optional[ResponseCache] = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache() -> Optional[ResponseCache]:
+    """
+    Return the process-wide cache configured through environment variables, if any.
+
+    LLM_CACHE_PATH enables the cache, LLM_CACHE_REPLAY=1 turns on replay mode and
+    LLM_CACHE_MAX_AGE_DAYS / LLM_CACHE_MAX_MB set the eviction limits.
+    """
+    global _default_cache
+    path = os.getenv("LLM_CACHE_PATH")
+    if not path:
+        return None
+    with _default_cache_lock:
+        if _default_cache is None:
+            max_age_days = os.getenv("LLM_CACHE_MAX_AGE_DAYS")
+            max_mb = os.getenv("LLM_CACHE_MAX_MB")
+            _default_cache = ResponseCache(
+                path,
+                max_bytes=int(float(max_mb) * 1024 * 1024) if max_mb else None,
+                max_age_seconds=float(max_age_days) * 86400 if max_age_days else None,
+                replay=os.getenv("LLM_CACHE_REPLAY") == "1",
+            )
+        return _default_cache
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Inspect or prune the LLM response cache')
+    parser.add_argument('path', help='Path to the SQLite cache file')
+    parser.add_argument('--max_entries', type=int, help='Evict least recently used responses beyond this count')
+    parser.add_argument('--max_mb', type=float, help='Evict least recently used responses beyond this size')
+    parser.add_argument('--max_age_days', type=float, help='Evict responses older than this')
+
+    args = parser.parse_args()
+    cache = ResponseCache(
+        args.path,
+        max_entries=args.max_entries,
+        max_bytes=int(args.max_mb * 1024 * 1024) if args.max_mb else None,
+        max_age_seconds=args.max_age_days * 86400 if args.max_age_days else None,
+    )
+    cache.evict()
+    stats = cache.stats()
+    print(f"Entries: {stats['entries']}")
+    print(f"Size: {stats['bytes'] / (1024 * 1024):.2f} MB")
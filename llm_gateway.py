@@ -0,0 +1,243 @@
+import argparse
+import http.client
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+from adaptive_concurrency import get_retry_after, get_status_code, limiter_stats
+from llm import LLM
+from llm_cache import ResponseCache
+from llm_providers import get_adapter
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8766
+
+
+class GatewayError(Exception):
+    """Failed gateway request; carries the upstream status code and Retry-After like the SDK exceptions do."""
+
+    def __init__(self, status_code: int, message: str, headers: Optional[Dict[str, str]] = None):
+        super().__init__(f"{status_code}: {message}")
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class Gateway:
+    """
+    Shared front for the LLM calls of every pipeline process on the machine.
+
+    Requests are sent upstream through one `LLM` per provider/model, so all processes share
+    its pooled SDK client (keep-alive connections) and its AIMD concurrency window, and
+    identical requests in flight at the same time are collapsed into a single upstream call.
+    """
+
+    def __init__(self, **llm_kwargs):
+        """
+        Args:
+            **llm_kwargs: Extra `LLM` arguments for the upstream calls (max_retries, backoff_base, telemetry, ...)
+        """
+        self.llm_kwargs = llm_kwargs
+        self._llms: Dict[Tuple[str, str], LLM] = {}
+        self._in_flight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.upstream_calls = 0
+        self.deduplicated = 0
+
+    def _llm(self, provider: str, model_name: str) -> LLM:
+        with self._lock:
+            key = (provider, model_name)
+            if key not in self._llms:
+                self._llms[key] = LLM(provider, model_name, stage="gateway", **self.llm_kwargs)
+            return self._llms[key]
+
+    def complete(self, provider: str, model_name: str, prompt: str, max_tokens: int = 1000, temperature: float = 0.0,
+                 response_format: Optional[dict] = None) -> str:
+        """Answer a request, joining an identical one already in flight instead of calling the provider again."""
+        key = ResponseCache.make_key(provider, model_name, prompt, max_tokens, temperature, response_format)
+        with self._lock:
+            self.requests += 1
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self._in_flight[key] = Future()
+                self.upstream_calls += 1
+            else:
+                self.deduplicated += 1
+        if not leader:
+            return future.result()
+
+        try:
+            response = self._llm(provider, model_name).query_structured_llm(prompt, max_tokens, temperature, response_format)
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(response)
+            return response
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = {"requests": self.requests, "upstream_calls": self.upstream_calls, "deduplicated": self.deduplicated}
+        stats["limiters"] = limiter_stats()
+        return stats
+
+
+class GatewayHandler(BaseHTTPRequestHandler):
+    # Keep-alive, so each client thread reuses one connection
+    protocol_version = "HTTP/1.1"
+
+    def _send(self, status: int, body: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> None:
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/stats":
+            self._send(200, self.server.gateway.stats())
+        else:
+            self._send(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path != "/v1/complete":
+            self._send(404, {"error": "not found"})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            get_adapter(request["provider"])
+            args = (request["provider"], request["model"], request["prompt"], request.get("max_tokens", 1000),
+                    request.get("temperature", 0.0), request.get("response_format"))
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            # Not worth retrying: the same request would fail the same way
+            self._send(400, {"error": f"malformed request: {type(e).__name__}: {e}"})
+            return
+        try:
+            text = self.server.gateway.complete(*args)
+        except Exception as e:
+            # Pass the upstream status on, so the caller's own limiter and retries see a 429 as a 429
+            status = get_status_code(e) or 502
+            retry_after = get_retry_after(e)
+            headers = {"Retry-After": str(retry_after)} if retry_after is not None else None
+            self._send(status, {"error": f"{type(e).__name__}: {e}"}, headers)
+            return
+        self._send(200, {"text": text})
+
+    def log_message(self, format, *args):
+        pass
+
+
+class GatewayClient:
+    """
+    Client of a running gateway, used by `LLM` when LLM_GATEWAY_URL (or `gateway_url`) is set.
+
+    Each thread keeps its own keep-alive connection to the gateway.
+    """
+
+    def __init__(self, url: str, timeout: float = 600.0):
+        parts = urlsplit(url)
+        self.host = parts.hostname or DEFAULT_HOST
+        self.port = parts.port or DEFAULT_PORT
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _request(self, method: str, path: str, body: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8") if body is not None else None
+        headers = {"Content-Type": "application/json"} if data is not None else {}
+        # One retry on a fresh connection in case the kept-alive one was closed by the server
+        for attempt in range(2):
+            connection = getattr(self._local, "connection", None)
+            if connection is None:
+                connection = self._local.connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            try:
+                connection.request(method, path, body=data, headers=headers)
+                response = connection.getresponse()
+                payload = json.loads(response.read() or b"{}")
+                break
+            except (ConnectionError, http.client.HTTPException):
+                connection.close()
+                self._local.connection = None
+                if attempt:
+                    raise
+        if response.status != 200:
+            raise GatewayError(response.status, payload.get("error", ""), {"retry-after": response.getheader("Retry-After")}
+                               if response.getheader("Retry-After") else None)
+        return payload
+
+    def complete(self, provider: str, model_name: str, prompt: str, max_tokens: int, temperature: float,
+                 response_format: Optional[dict] = None) -> str:
+        return self._request("POST", "/v1/complete", {
+            "provider": provider,
+            "model": model_name,
+            "prompt": prompt,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "response_format": response_format,
+        })["text"]
+
+    def stats(self) -> Dict[str, Any]:
+        return self._request("GET", "/stats")
+
+
+_clients: Dict[str, GatewayClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_gateway_client(url: str) -> GatewayClient:
+    """Process-wide client of the gateway at `url`, so every LLM instance reuses its connections."""
+    with _clients_lock:
+        if url not in _clients:
+            _clients[url] = GatewayClient(url)
+        return _clients[url]
+
+
+def serve(host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, **llm_kwargs) -> ThreadingHTTPServer:
+    """Create the gateway server (call serve_forever() on it, or run it in a thread); see Gateway for llm_kwargs."""
+    # The gateway talks to the providers itself
+    os.environ.pop("LLM_GATEWAY_URL", None)
+    server = ThreadingHTTPServer((host, port), GatewayHandler)
+    server.daemon_threads = True
+    server.gateway = Gateway(**llm_kwargs)
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local LLM gateway shared by every pipeline process '
+                                                 '(point them at it with LLM_GATEWAY_URL=http://host:port)')
+    parser.add_argument('--host', default=DEFAULT_HOST, help=f'Interface to listen on (default: {DEFAULT_HOST})')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f'Port to listen on (default: {DEFAULT_PORT})')
+    parser.add_argument('--stats-interval', type=float, default=60.0,
+                        help='Seconds between printed request/deduplication stats; 0 disables them (default: 60)')
+
+    args = parser.parse_args()
+    server = serve(args.host, args.port)
+    print(f"LLM gateway listening on http://{args.host}:{args.port}")
+
+    def report():
+        while True:
+            time.sleep(args.stats_interval)
+            print(json.dumps(server.gateway.stats()), flush=True)
+
+    if args.stats_interval > 0:
+        threading.Thread(target=report, daemon=True).start()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
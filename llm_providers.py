@@ -0,0 +1,240 @@
+import argparse
+import asyncio
+import os
+import threading
+import weakref
+from typing import Any, Dict, Optional, Tuple
+
+Usage = Tuple[Optional[int], Optional[int]]
+
+
+class ProviderAdapter:
+    """
+    How `LLM` and `AsyncLLM` talk to one provider: building its SDK clients, sending a chat
+    completion and shaping a JSON-schema response format.
+
+    SDKs are imported inside `create_client`, so a provider's SDK is only loaded by processes
+    that use it.
+    """
+
+    name = ""
+    # Environment variable holding the API key
+    api_key_env: Optional[str] = None
+    # Whether the client has a batch-job API (see LLM.query_llm_many)
+    batch = False
+    # Whether the client also serves embed and rerank (see evaluate_rag.py)
+    embeddings = False
+
+    def api_key(self) -> Optional[str]:
+        return os.getenv(self.api_key_env) if self.api_key_env else None
+
+    def create_client(self, api_key: Optional[str], server_url: Optional[str]) -> Any:
+        raise NotImplementedError
+
+    def create_async_client(self, api_key: Optional[str], server_url: Optional[str]) -> Any:
+        """Client used by `acomplete`; the sync client unless the SDK has a separate async one."""
+        return self.create_client(api_key, server_url)
+
+    def complete(self, client: Any, model_name: str, prompt: str, max_tokens: int, temperature: float,
+                 response_format: Optional[dict] = None) -> Tuple[str, Usage]:
+        """Returns the response text and its (prompt, completion) token usage, None where the provider omits it."""
+        raise NotImplementedError
+
+    async def acomplete(self, client: Any, model_name: str, prompt: str, max_tokens: int, temperature: float,
+                        response_format: Optional[dict] = None) -> Tuple[str, Usage]:
+        """Asyncio version of `complete`; by default the sync call runs in a worker thread."""
+        return await asyncio.to_thread(self.complete, client, model_name, prompt, max_tokens, temperature, response_format)
+
+    def json_schema_format(self, name: str, schema: dict) -> dict:
+        """The response_format that constrains output to a JSON schema."""
+        return {"type": "json_schema", "json_schema": {"name": name, "schema": schema, "strict": True}}
+
+
+class MistralAdapter(ProviderAdapter):
+    name = "mistral"
+    api_key_env = "MISTRAL_API_KEY"
+    batch = True
+
+    def create_client(self, api_key: Optional[str], server_url: Optional[str]) -> Any:
+        from mistralai import Mistral
+        return Mistral(api_key=api_key, server_url=server_url)
+
+    def complete(self, client, model_name, prompt, max_tokens, temperature, response_format=None):
+        kwargs = {"response_format": response_format} if response_format is not None else {}
+        response = client.chat.complete(
+            model=model_name,
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=max_tokens,
+            temperature=temperature,
+            **kwargs
+        )
+        return self._result(response)
+
+    async def acomplete(self, client, model_name, prompt, max_tokens, temperature, response_format=None):
+        kwargs = {"response_format": response_format} if response_format is not None else {}
+        response = await client.chat.complete_async(
+            model=model_name,
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=max_tokens,
+            temperature=temperature,
+            **kwargs
+        )
+        return self._result(response)
+
+    @staticmethod
+    def _result(response) -> Tuple[str, Usage]:
+        usage = getattr(response, "usage", None)
+        return response.choices[0].message.content, (getattr(usage, "prompt_tokens", None), getattr(usage, "completion_tokens", None))
+
+
+class CohereAdapter(ProviderAdapter):
+    name = "cohere"
+    api_key_env = "COHERE_API_KEY"
+    embeddings = True
+
+    def create_client(self, api_key: Optional[str], server_url: Optional[str]) -> Any:
+        from cohere import ClientV2
+        return ClientV2(api_key=api_key, base_url=server_url)
+
+    def create_async_client(self, api_key: Optional[str], server_url: Optional[str]) -> Any:
+        from cohere import AsyncClientV2
+        return AsyncClientV2(api_key=api_key, base_url=server_url)
+
+    def complete(self, client, model_name, prompt, max_tokens, temperature, response_format=None):
+        kwargs = {"response_format": response_format} if response_format is not None else {}
+        response = client.chat(
+            model=model_name,
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=max_tokens,
+            temperature=temperature,
+            **kwargs
+        )
+        return self._result(response)
+
+    async def acomplete(self, client, model_name, prompt, max_tokens, temperature, response_format=None):
+        kwargs = {"response_format": response_format} if response_format is not None else {}
+        response = await client.chat(
+            model=model_name,
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=max_tokens,
+            temperature=temperature,
+            **kwargs
+        )
+        return self._result(response)
+
+    @staticmethod
+    def _result(response) -> Tuple[str, Usage]:
+        tokens = getattr(getattr(response, "usage", None), "tokens", None)
+        return response.message.content[0].text, (getattr(tokens, "input_tokens", None), getattr(tokens, "output_tokens", None))
+
+    def json_schema_format(self, name: str, schema: dict) -> dict:
+        return {"type": "json_object", "json_schema": schema}
+
+
+class MockAdapter(CohereAdapter):
+    """Offline provider for benchmarks and tests (mock_provider.py), with the Cohere client surface."""
+
+    name = "mock"
+    api_key_env = None
+
+    def api_key(self) -> Optional[str]:
+        # Not a secret: the mock settings, so a changed MOCK_LLM_CONFIG gets its own client
+        return os.getenv("MOCK_LLM_CONFIG")
+
+    def create_client(self, api_key: Optional[str], server_url: Optional[str]) -> Any:
+        from mock_provider import MockClient
+        return MockClient.from_env()
+
+    def create_async_client(self, api_key: Optional[str], server_url: Optional[str]) -> Any:
+        return self.create_client(api_key, server_url)
+
+    async def acomplete(self, client, model_name, prompt, max_tokens, temperature, response_format=None):
+        # The mock client is synchronous (its latency is a sleep)
+        return await ProviderAdapter.acomplete(self, client, model_name, prompt, max_tokens, temperature, response_format)
+
+    def json_schema_format(self, name: str, schema: dict) -> dict:
+        # The mock reads the schema from the Mistral-style format
+        return ProviderAdapter.json_schema_format(self, name, schema)
+
+
+PROVIDERS: Dict[str, ProviderAdapter] = {}
+
+
+def register_provider(adapter: ProviderAdapter) -> None:
+    """Make a provider available to `LLM` under `adapter.name`."""
+    PROVIDERS[adapter.name] = adapter
+
+
+for _adapter in (MistralAdapter(), CohereAdapter(), MockAdapter()):
+    register_provider(_adapter)
+
+
+def get_adapter(provider: str) -> ProviderAdapter:
+    if provider not in PROVIDERS:
+        raise ValueError(f"Provider {provider} not supported")
+    return PROVIDERS[provider]
+
+
+def model_spec(value: str) -> str:
+    """argparse type for a provider:model argument, so a malformed spec is a usage error."""
+    provider, _, model_name = value.partition(':')
+    if not provider or not model_name:
+        raise argparse.ArgumentTypeError(f"expected provider:model, got '{value}'")
+    if provider not in PROVIDERS:
+        raise argparse.ArgumentTypeError(f"unknown provider '{provider}' (available: {', '.join(sorted(PROVIDERS))})")
+    return value
+
+
+_clients: Dict[Tuple[str, Optional[str], Optional[str]], Any] = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(provider: str, server_url: Optional[str] = None) -> Any:
+    """
+    Return the process-wide SDK client of a provider, creating it on first use.
+
+    Clients are pooled by provider, API key and endpoint, so every `LLM` of the process
+    (every stage, every year) reuses the same HTTP connection pool and keep-alive connections.
+
+    Args:
+        provider (str): Registered provider name
+        server_url (str, optional): Alternative API endpoint (e.g. a local stand-in server)
+
+    Returns:
+        Any: The provider's SDK client
+    """
+    adapter = get_adapter(provider)
+    api_key = adapter.api_key()
+    key = (provider, api_key, server_url)
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = adapter.create_client(api_key, server_url)
+        return _clients[key]
+
+
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Tuple[str, Optional[str], Optional[str]], Any]]" = weakref.WeakKeyDictionary()
+
+
+def get_async_client(provider: str, server_url: Optional[str] = None) -> Any:
+    """
+    Return the async SDK client of a provider for the running event loop, creating it on first use.
+
+    Like `get_client`, clients are pooled by provider, API key and endpoint, but per event loop:
+    async connections belong to the loop that opened them.
+
+    Args:
+        provider (str): Registered provider name
+        server_url (str, optional): Alternative API endpoint (e.g. a local stand-in server)
+
+    Returns:
+        Any: The provider's async SDK client
+    """
+    adapter = get_adapter(provider)
+    api_key = adapter.api_key()
+    key = (provider, api_key, server_url)
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        clients = _async_clients.setdefault(loop, {})
+        if key not in clients:
+            clients[key] = adapter.create_async_client(api_key, server_url)
+        return clients[key]
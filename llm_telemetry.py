@@ -0,0 +1,194 @@
+import atexit
+import json
+import math
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+# Estimated list prices in USD per million (prompt, completion) tokens, used for cost estimates only
+PRICES_PER_MILLION = {
+    "mistral-small-latest": (0.1, 0.3),
+    "mistral-large-latest": (2.0, 6.0),
+    "command-r-08-2024": (0.15, 0.6),
+    "command-r-plus-08-2024": (2.5, 10.0),
+}
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile of a list of values (0 for an empty list)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(q / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def estimate_cost(model_name: str, prompt_tokens: int, completion_tokens: int) -> Optional[float]:
+    """Estimated USD cost of the tokens, or None for models without a known price."""
+    prices = PRICES_PER_MILLION.get(model_name)
+    if prices is None:
+        return None
+    return (prompt_tokens * prices[0] + completion_tokens * prices[1]) / 1e6
+
+
+class Telemetry:
+    """
+    Per-call LLM telemetry: every call is kept in memory for the run summary and, when a
+    trace path is given, appended to a JSONL trace as it finishes.
+
+    Each record holds the stage label, provider/model, mode ("sync", "batch" or "cache"),
+    queue wait and network latency in seconds, prompt/completion tokens, retries, error and the
+    adaptive concurrency window at the time of the call.
+    """
+
+    def __init__(self, trace_path: Optional[str] = None):
+        self.trace_path = trace_path
+        self.records: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._trace = None
+        if trace_path:
+            trace_dir = os.path.dirname(trace_path)
+            if trace_dir:
+                os.makedirs(trace_dir, exist_ok=True)
+            self._trace = open(trace_path, "a", encoding="utf-8")
+
+    def record(self, stage: str, provider: str, model: str, mode: str, latency: float = 0.0, queue_wait: float = 0.0,
+               prompt_tokens: Optional[int] = None, completion_tokens: Optional[int] = None, retries: int = 0,
+               error: Optional[str] = None, window: Optional[float] = None) -> None:
+        entry = {
+            "time": time.time(),
+            "stage": stage,
+            "provider": provider,
+            "model": model,
+            "mode": mode,
+            "queue_wait": round(queue_wait, 4),
+            "latency": round(latency, 4),
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "retries": retries,
+            "error": error,
+            "window": round(window, 2) if window is not None else None,
+        }
+        with self._lock:
+            self.records.append(entry)
+            if self._trace is not None:
+                self._trace.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                self._trace.flush()
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Aggregate the records per stage and model.
+
+        Returns:
+            Dict[str, Dict[str, Any]]: {"stage provider:model": {calls, cache_hits, errors, retries,
+            latency/queue-wait percentiles, tokens, completion tokens/s and estimated cost}}
+        """
+        with self._lock:
+            records = list(self.records)
+        groups: Dict[Tuple[str, str, str], List[Dict[str, Any]]] = {}
+        for entry in records:
+            groups.setdefault((entry["stage"], entry["provider"], entry["model"]), []).append(entry)
+
+        summary = {}
+        for (stage, provider, model), entries in sorted(groups.items()):
+            # Latency percentiles only describe requests that went over the network one by one
+            calls = [entry for entry in entries if entry["mode"] == "sync" and entry["error"] is None]
+            latencies = [entry["latency"] for entry in calls]
+            prompt_tokens = sum(entry["prompt_tokens"] or 0 for entry in entries if entry["mode"] != "cache")
+            completion_tokens = sum(entry["completion_tokens"] or 0 for entry in entries if entry["mode"] != "cache")
+            network_time = sum(latencies)
+            windows = [entry.get("window") for entry in entries if entry.get("window") is not None]
+            summary[f"{stage} {provider}:{model}"] = {
+                "calls": len(entries),
+                "cache_hits": sum(entry["mode"] == "cache" for entry in entries),
+                "batch_requests": sum(entry["mode"] == "batch" for entry in entries),
+                "errors": sum(entry["error"] is not None for entry in entries),
+                "retries": sum(entry["retries"] for entry in entries),
+                "latency_p50": percentile(latencies, 50) if calls else None,
+                "latency_p95": percentile(latencies, 95) if calls else None,
+                "latency_p99": percentile(latencies, 99) if calls else None,
+                "queue_wait_p95": percentile([entry["queue_wait"] for entry in calls], 95) if calls else None,
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "completion_tokens_per_s": sum(entry["completion_tokens"] or 0 for entry in calls) / network_time if network_time else None,
+                "estimated_cost": estimate_cost(model, prompt_tokens, completion_tokens),
+                "window": windows[-1] if windows else None,
+                "peak_window": max(windows) if windows else None,
+            }
+        return summary
+
+    def print_summary(self) -> None:
+        summary = self.summary()
+        if not summary:
+            return
+        print("\nLLM calls:")
+        total_cost = 0.0
+        for label, stats in summary.items():
+            latency = "n/a" if stats["latency_p50"] is None else \
+                f"p50 {stats['latency_p50']:.2f}s p95 {stats['latency_p95']:.2f}s p99 {stats['latency_p99']:.2f}s"
+            speed = "" if stats["completion_tokens_per_s"] is None else f", {stats['completion_tokens_per_s']:.0f} tok/s"
+            cost = "" if stats["estimated_cost"] is None else f", ~${stats['estimated_cost']:.4f}"
+            window = "" if stats["window"] is None else f", window {stats['window']:.1f} (peak {stats['peak_window']:.1f})"
+            total_cost += stats["estimated_cost"] or 0.0
+            print(f"  {label}: {stats['calls']} calls ({stats['cache_hits']} cached, {stats['batch_requests']} batched, "
+                  f"{stats['errors']} errors, {stats['retries']} retries), {latency}, "
+                  f"{stats['prompt_tokens']}+{stats['completion_tokens']} tokens{speed}{cost}{window}")
+        print(f"  Estimated cost: ~${total_cost:.4f}")
+
+    def close(self) -> None:
+        """Write the summary next to the trace (<trace>.summary.json) and close it."""
+        with self._lock:
+            trace, self._trace = self._trace, None
+        if trace is None:
+            return
+        trace.close()
+        with open(os.path.splitext(self.trace_path)[0] + ".summary.json", "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, ensure_ascii=False, indent=2)
+
+
+_default_telemetry: Optional[Telemetry] = None
+_default_telemetry_lock = threading.Lock()
+
+
+def _finish_run() -> None:
+    if _default_telemetry is not None:
+        _default_telemetry.print_summary()
+        _default_telemetry.close()
+
+
+def get_default_telemetry() -> Telemetry:
+    """
+    Return the process-wide telemetry shared by every LLM instance.
+
+    LLM_TRACE_PATH sets the JSONL trace file; the summary is printed when the process exits
+    (LLM_TELEMETRY_SUMMARY=0 silences it) and saved next to the trace.
+    """
+    global _default_telemetry
+    with _default_telemetry_lock:
+        if _default_telemetry is None:
+            _default_telemetry = Telemetry(os.getenv("LLM_TRACE_PATH") or None)
+            if os.getenv("LLM_TELEMETRY_SUMMARY", "1") != "0":
+                atexit.register(_finish_run)
+            else:
+                atexit.register(_default_telemetry.close)
+        return _default_telemetry
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Summarize one or more LLM telemetry traces')
+    parser.add_argument('traces', nargs='+', help='JSONL trace files written with LLM_TRACE_PATH')
+    parser.add_argument('--stage', default=None, help='Only include calls of this stage')
+
+    args = parser.parse_args()
+    telemetry = Telemetry()
+    for path in args.traces:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    if args.stage is None or entry["stage"] == args.stage:
+                        telemetry.records.append(entry)
+    telemetry.print_summary()
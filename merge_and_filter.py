@@ -1,62 +1,268 @@
 import json
 import os
-from pathlib import Path
-from typing import List, Dict, Any
+import re
+import textwrap
+import unicodedata
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from dedup import NearDuplicateFilter
+
+QUESTION_FILES = ('categorized_questions.json', 'categorized_questions.jsonl')
+
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+def iter_json_array(file_path: str, chunk_size: int = 1 << 16) -> Iterator[Any]:
+    """
+    Incrementally parse a JSON array file, yielding one element at a time.
+
+    Only one read chunk plus the element being decoded are held in memory.
+
+    Args:
+        file_path (str): Path to a file containing a JSON array
+        chunk_size (int): Characters read at a time
+
+    Yields:
+        Any: Each element of the array, in order
+    """
+    decoder = json.JSONDecoder()
+    with open(file_path, 'r', encoding='utf-8') as f:
+        buffer = ""
+        pos = 0
+        started = False
+        eof = False
+        while True:
+            pos = WHITESPACE.match(buffer, pos).end()
+            if pos < len(buffer):
+                char = buffer[pos]
+                if not started:
+                    if char != '[':
+                        raise ValueError(f"{file_path} does not contain a JSON array")
+                    started = True
+                    pos += 1
+                    continue
+                if char == ']':
+                    return
+                if char == ',':
+                    pos += 1
+                    continue
+                try:
+                    item, end = decoder.raw_decode(buffer, pos)
+                    # A scalar ending exactly at the buffer end may continue in the next chunk
+                    if end < len(buffer) or eof:
+                        yield item
+                        pos = end
+                        continue
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+            elif eof:
+                raise ValueError(f"Unexpected end of {file_path}")
+
+            # Need more data: drop what was consumed and read the next chunk
+            chunk = f.read(chunk_size)
+            if not chunk:
+                eof = True
+            buffer = buffer[pos:] + chunk
+            pos = 0
+
+def iter_questions(file_path: str) -> Iterator[Dict[str, Any]]:
+    """Stream the questions of a .jsonl file (one per line) or a .json array file."""
+    if file_path.endswith('.jsonl'):
+        with open(file_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    else:
+        yield from iter_json_array(file_path)
+
+def iter_question_files(input_dir: str) -> Iterator[Tuple[str, str]]:
+    """
+    Find the categorized question files under input_dir, in a stable order.
+
+    Yields:
+        Tuple[str, str]: (file path, name of the folder holding it, e.g. the exam year)
+    """
+    for root, dirs, files in os.walk(input_dir):
+        dirs.sort()
+        for name in QUESTION_FILES:
+            if name in files:
+                yield os.path.join(root, name), os.path.basename(root)
+
+def iter_corpus(input_dir: str, provenance: bool = False) -> Iterator[Dict[str, Any]]:
+    """
+    Stream every question under input_dir.
+
+    Args:
+        input_dir (str): Directory containing subfolders with categorized question files
+        provenance (bool): Add 'year' (folder name, when numeric) and 'source' (file path relative
+            to input_dir) to questions that do not already have them
+
+    Yields:
+        Dict[str, Any]: Questions, file by file
+    """
+    for file_path, folder in iter_question_files(input_dir):
+        try:
+            for question in iter_questions(file_path):
+                if provenance:
+                    if folder.isdigit():
+                        question.setdefault('year', int(folder))
+                    question.setdefault('source', os.path.relpath(file_path, input_dir))
+                yield question
+        except (json.JSONDecodeError, ValueError) as e:
+            print(f"Error reading {file_path}: {e}")
+
+class QuestionWriter:
+    """
+    Stream questions to a .jsonl file or to a .json array laid out like json.dump(..., indent=2).
+
+    The file is written under a temporary name and moved into place on close.
+    """
+
+    def __init__(self, output_path: str):
+        output_dir = os.path.dirname(output_path)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        self.output_path = output_path
+        self.tmp_path = output_path + ".tmp"
+        self.jsonl = output_path.endswith('.jsonl')
+        self.count = 0
+        self.file = open(self.tmp_path, 'w', encoding='utf-8')
+
+    def write(self, question: Dict[str, Any]) -> None:
+        if self.jsonl:
+            self.file.write(json.dumps(question, ensure_ascii=False) + "\n")
+        else:
+            self.file.write("[\n" if self.count == 0 else ",\n")
+            self.file.write(textwrap.indent(json.dumps(question, indent=2, ensure_ascii=False), "  "))
+        self.count += 1
+
+    def close(self) -> None:
+        if not self.jsonl:
+            self.file.write("[]" if self.count == 0 else "\n]")
+        self.file.close()
+        os.replace(self.tmp_path, self.output_path)
+
+def category_filename(category: str, extension: str = ".json") -> str:
+    """File name for a category's dataset, e.g. "Teoría del Derecho" -> "teoria_del_derecho.json"."""
+    folded = "".join(char for char in unicodedata.normalize("NFKD", category.lower()) if not unicodedata.combining(char))
+    return re.sub(r"[^a-z0-9]+", "_", folded).strip("_") + extension
 
 def merge_and_filter_questions(
     input_dir: str,
     category: str,
-    output_path: str
+    output_path: str,
+    provenance: bool = False,
+    dedup_threshold: Optional[float] = None
 ) -> None:
     """
-    Merge questions from categorized_questions.json files in subfolders and filter by category.
-    
+    Merge questions from categorized_questions.json(l) files in subfolders and filter by category.
+
+    Questions are streamed from disk and written as they are read, so memory use does not
+    grow with the corpus.
+
     Args:
         input_dir (str): Path to the directory containing subfolders with categorized_questions.json files
         category (str): Category to filter questions by
-        output_path (str): Path where to save the filtered questions
-    """
-    all_questions: List[Dict[str, Any]] = []
-    
-    # Walk through all subdirectories
-    for root, _, files in os.walk(input_dir):
-        if 'categorized_questions.json' in files:
-            file_path = os.path.join(root, 'categorized_questions.json')
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    questions = json.load(f)
-                    all_questions.extend(questions)
-            except json.JSONDecodeError as e:
-                print(f"Error reading {file_path}: {e}")
-            except Exception as e:
-                print(f"Unexpected error reading {file_path}: {e}")
-    
-    # Filter questions by category
-    filtered_questions = [
-        q for q in all_questions
-        if q.get('category', '').lower() == category.lower()
-    ]
-    
-    # Create output directory if it doesn't exist
-    output_dir = os.path.dirname(output_path)
-    if output_dir:
-        os.makedirs(output_dir, exist_ok=True)
-    
-    # Save filtered questions
-    with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump(filtered_questions, f, indent=2, ensure_ascii=False)
-    
-    print(f"Found {len(all_questions)} total questions")
-    print(f"Filtered to {len(filtered_questions)} questions in category '{category}'")
+        output_path (str): Path where to save the filtered questions (.json or .jsonl)
+        provenance (bool): Add year/source fields to each question (see iter_corpus)
+        dedup_threshold (float, optional): Drop questions that are near-duplicates of an earlier one
+            at this similarity (see dedup.py)
+    """
+    total = 0
+    duplicates = 0
+    seen = NearDuplicateFilter(dedup_threshold) if dedup_threshold else None
+    writer = QuestionWriter(output_path)
+    try:
+        for question in iter_corpus(input_dir, provenance=provenance):
+            total += 1
+            if question.get('category', '').lower() == category.lower():
+                if seen and seen.is_duplicate(question):
+                    duplicates += 1
+                    continue
+                writer.write(question)
+    finally:
+        writer.close()
+
+    print(f"Found {total} total questions" + (f" ({duplicates} near-duplicates dropped)" if seen else ""))
+    print(f"Filtered to {writer.count} questions in category '{category}'")
     print(f"Results saved to {output_path}")
 
+def partition_questions(
+    input_dir: str,
+    output_dir: str,
+    categories: Optional[List[str]] = None,
+    extension: str = ".json",
+    provenance: bool = False,
+    dedup_threshold: Optional[float] = None
+) -> Dict[str, int]:
+    """
+    Split every question into per-category files in a single pass over the corpus.
+
+    Args:
+        input_dir (str): Path to the directory containing subfolders with categorized_questions.json files
+        output_dir (str): Directory for the per-category files (e.g. dataset/constitucional.json)
+        categories (List[str], optional): Categories to keep (default: every category found)
+        extension (str): ".json" for JSON arrays or ".jsonl" for one question per line
+        provenance (bool): Add year/source fields to each question (see iter_corpus)
+        dedup_threshold (float, optional): Drop questions that are near-duplicates of an earlier one
+            at this similarity (see dedup.py)
+
+    Returns:
+        Dict[str, int]: Number of questions written per category
+    """
+    wanted = {category.lower() for category in categories} if categories else None
+    writers: Dict[str, QuestionWriter] = {}
+    total = 0
+    uncategorized = 0
+    duplicates = 0
+    seen = NearDuplicateFilter(dedup_threshold) if dedup_threshold else None
+    try:
+        for question in iter_corpus(input_dir, provenance=provenance):
+            total += 1
+            category = question.get('category', '').lower()
+            if not category:
+                uncategorized += 1
+                continue
+            if wanted is not None and category not in wanted:
+                continue
+            if seen and seen.is_duplicate(question):
+                duplicates += 1
+                continue
+            if category not in writers:
+                writers[category] = QuestionWriter(os.path.join(output_dir, category_filename(category, extension)))
+            writers[category].write(question)
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+    counts = {category: writer.count for category, writer in sorted(writers.items())}
+    print(f"Found {total} total questions ({uncategorized} without a category"
+          + (f", {duplicates} near-duplicates dropped)" if seen else ")"))
+    for category, count in counts.items():
+        print(f"  {category}: {count} -> {writers[category].output_path}")
+    return counts
+
 if __name__ == "__main__":
     import argparse
-    
+
     parser = argparse.ArgumentParser(description='Merge and filter questions from multiple JSON files')
     parser.add_argument('--input_dir', help='Directory containing subfolders with categorized_questions.json files')
     parser.add_argument('--category', help='Category to filter questions by')
     parser.add_argument('--output_path', help='Path where to save the filtered questions')
-    
+    parser.add_argument('--all', action='store_true',
+                        help='Write every category to its own file in --output_dir in a single pass')
+    parser.add_argument('--output_dir', default='dataset',
+                        help='Directory for the per-category files with --all (default: dataset)')
+    parser.add_argument('--format', choices=['json', 'jsonl'], default='json',
+                        help='Output format of the per-category files with --all (default: json)')
+    parser.add_argument('--provenance', action='store_true',
+                        help='Add year (folder name) and source (file path) fields to each question')
+    parser.add_argument('--dedup', type=float, default=None, metavar='THRESHOLD',
+                        help='Drop near-duplicates of earlier questions at this similarity (e.g. 0.7, see dedup.py)')
+
     args = parser.parse_args()
-    merge_and_filter_questions(args.input_dir, args.category, args.output_path) 
\ No newline at end of file
+    if args.all:
+        partition_questions(args.input_dir, args.output_dir, extension=f".{args.format}", provenance=args.provenance,
+                            dedup_threshold=args.dedup)
+    else:
+        merge_and_filter_questions(args.input_dir, args.category, args.output_path, provenance=args.provenance,
+                                   dedup_threshold=args.dedup)
@@ -0,0 +1,199 @@
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+import zlib
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+from bm25 import tokenize
+
+# Per-operation defaults: median latency in seconds, lognormal spread and share of failed calls
+DEFAULT_CONFIG = {
+    "chat": {"latency": 0.05, "sigma": 0.5, "error_rate": 0.0},
+    "embed": {"latency": 0.02, "sigma": 0.3, "error_rate": 0.0},
+    "rerank": {"latency": 0.02, "sigma": 0.3, "error_rate": 0.0},
+    "error_status": 429,
+    # Simulated provider rate limit: requests beyond this many in flight get a 429 (None = unlimited)
+    "concurrency_limit": None,
+    # Retry-After seconds sent with the 429s (None = no header)
+    "retry_after": None,
+    "embed_dim": 256,
+    "seed": 0,
+    # Canned outputs: [{"pattern": <regex searched in the prompt>, "response": <text>}], first match wins
+    "responses": [],
+}
+
+QUESTION_LINE = re.compile(r"^\s*(\d{1,3})\s*[.)]-?\s*(.*)$")
+OPTION_LINE = re.compile(r"^\s*([a-dA-D])\s*[).]\s*(.*)$")
+INLINE_MARKER = re.compile(r"(?<=\s)(\d{1,3}\)|[a-dA-D]\))\s+")
+
+
+class MockAPIError(Exception):
+    """Injected failure; carries an HTTP status code like the SDK exceptions do."""
+
+    def __init__(self, status_code: int, message: str = "mock provider error", retry_after: Optional[float] = None):
+        super().__init__(f"{status_code}: {message}")
+        self.status_code = status_code
+        self.headers = {"retry-after": str(retry_after)} if retry_after is not None else {}
+
+
+def stable_choice(text: str, options: List[Any]) -> Any:
+    """Pick an option deterministically from the text, so reruns give identical outputs."""
+    return options[zlib.crc32(text.encode("utf-8")) % len(options)]
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def format_questions(chunk: str) -> str:
+    """Answer a format_text parse prompt: every question with four options, in its output format."""
+    blocks = []
+    current = None
+    # Like a model, read questions written inline in paragraphs (as parse_pdf writes them) too
+    chunk = INLINE_MARKER.sub(lambda match: "\n" + match.group(1) + " ", chunk)
+    for line in chunk.split("\n"):
+        question_match = QUESTION_LINE.match(line)
+        option_match = OPTION_LINE.match(line)
+        if option_match and current is not None:
+            current["options"].append(f"{option_match.group(1).lower()}) {option_match.group(2).strip()}")
+        elif question_match:
+            current = {"id": question_match.group(1), "question": question_match.group(2).strip(), "options": []}
+            blocks.append(current)
+        elif current is not None and line.strip():
+            if current["options"]:
+                current["options"][-1] += " " + line.strip()
+            else:
+                current["question"] += " " + line.strip()
+    return "\n\n".join("\n".join([block["id"], block["question"]] + block["options"][:4])
+                       for block in blocks if len(block["options"]) >= 4)
+
+
+def schema_instance(schema: Dict[str, Any], prompt: str, path: str = "") -> Any:
+    """
+    Build a value that satisfies a JSON schema. Enums are picked from the prompt, and an array
+    of objects with an "index" property gets one item per "[n]" marker in the prompt.
+    """
+    if "enum" in schema:
+        return stable_choice(prompt + path, schema["enum"])
+    kind = schema.get("type")
+    if kind == "object":
+        return {name: schema_instance(sub, prompt, f"{path}.{name}") for name, sub in schema.get("properties", {}).items()}
+    if kind == "array":
+        items = schema.get("items", {})
+        indices = [int(n) for n in re.findall(r"^\[(\d+)\]", prompt, re.MULTILINE)]
+        if items.get("type") == "object" and "index" in items.get("properties", {}) and indices:
+            return [dict(schema_instance(items, prompt, f"{path}[{index}]"), index=index) for index in indices]
+        return [schema_instance(items, prompt, f"{path}[0]")]
+    if kind == "integer":
+        return 0
+    if kind == "number":
+        return 0.0
+    if kind == "boolean":
+        return False
+    return "mock"
+
+
+class MockClient:
+    """
+    Offline stand-in for the provider SDKs with the Cohere V2 surface (chat, embed, rerank).
+
+    Latency is drawn from a lognormal distribution around a configurable median, a configurable
+    share of calls fails with `error_status`, calls beyond `concurrency_limit` in flight get a 429
+    (optionally with Retry-After), and outputs are deterministic: canned responses
+    matched by regex first, then answers shaped for this repository's prompts (question
+    formatting, categories, "Respuesta: x" evaluations) or any JSON schema. Embeddings are
+    hashed bags of words, so retrieval quality is meaningful; rerank scores token overlap.
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        self.config = json.loads(json.dumps(DEFAULT_CONFIG))
+        for key, value in (config or {}).items():
+            if isinstance(value, dict) and isinstance(self.config.get(key), dict):
+                self.config[key].update(value)
+            else:
+                self.config[key] = value
+        self.responses = [(re.compile(rule["pattern"]), rule["response"]) for rule in self.config["responses"]]
+        self._random = random.Random(self.config["seed"])
+        self._lock = threading.Lock()
+        self.in_flight = 0
+
+    @classmethod
+    def from_env(cls) -> "MockClient":
+        """Configure from MOCK_LLM_CONFIG (a JSON string or the path of a JSON file), if set."""
+        config = os.getenv("MOCK_LLM_CONFIG")
+        if config and os.path.exists(config):
+            with open(config, "r", encoding="utf-8") as f:
+                return cls(json.load(f))
+        return cls(json.loads(config) if config else None)
+
+    def _simulate(self, operation: str) -> None:
+        settings = self.config[operation]
+        limit = self.config["concurrency_limit"]
+        with self._lock:
+            delay = settings["latency"] * self._random.lognormvariate(0, settings["sigma"]) if settings["latency"] else 0.0
+            failed = self._random.random() < settings["error_rate"]
+            if limit is not None and self.in_flight >= limit:
+                raise MockAPIError(429, "rate limit exceeded", retry_after=self.config["retry_after"])
+            self.in_flight += 1
+        try:
+            time.sleep(delay)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+        if failed:
+            raise MockAPIError(self.config["error_status"], retry_after=self.config["retry_after"] if self.config["error_status"] == 429 else None)
+
+    def _respond(self, prompt: str, response_format: Optional[dict]) -> str:
+        for pattern, response in self.responses:
+            if pattern.search(prompt):
+                return response
+        if response_format is not None:
+            json_schema = response_format.get("json_schema") or {}
+            schema = json_schema.get("schema", json_schema)
+            return json.dumps(schema_instance(schema, prompt), ensure_ascii=False)
+        if "Here's the text to format:" in prompt:
+            return format_questions(prompt.split("Here's the text to format:", 1)[1])
+        if "Devuelve únicamente el nombre de la categoría" in prompt:
+            categories = prompt.split("categorías:", 1)[1].strip().split("\n", 1)[0]
+            return stable_choice(prompt, [category.strip() for category in categories.split(",")])
+        if "Respuesta:" in prompt:
+            return f"Razonamiento: Respuesta simulada.\nRespuesta: {stable_choice(prompt, ['a', 'b', 'c', 'd'])}"
+        return "mock response"
+
+    def chat(self, model: str, messages: List[Dict[str, str]], max_tokens: int = 1000, temperature: float = 0.0,
+             response_format: Optional[dict] = None, **kwargs) -> SimpleNamespace:
+        self._simulate("chat")
+        prompt = messages[-1]["content"]
+        text = self._respond(prompt, response_format)
+        # Like a real model, stop at max_tokens (about 4 characters per token)
+        text = text[:max_tokens * 4]
+        tokens = SimpleNamespace(input_tokens=estimate_tokens(prompt), output_tokens=estimate_tokens(text))
+        return SimpleNamespace(message=SimpleNamespace(content=[SimpleNamespace(text=text)]),
+                               usage=SimpleNamespace(tokens=tokens))
+
+    def _embed_text(self, text: str) -> List[float]:
+        vector = [0.0] * self.config["embed_dim"]
+        for token in tokenize(text):
+            digest = hashlib.md5(token.encode("utf-8")).digest()
+            vector[int.from_bytes(digest[:4], "little") % len(vector)] += 1.0 if digest[4] & 1 else -1.0
+        return vector
+
+    def embed(self, model: str, texts: List[str], input_type: str = None, embedding_types: List[str] = None, **kwargs) -> SimpleNamespace:
+        self._simulate("embed")
+        return SimpleNamespace(embeddings=SimpleNamespace(float=[self._embed_text(text) for text in texts]))
+
+    def rerank(self, model: str, query: str, documents: List[str], top_n: Optional[int] = None, **kwargs) -> SimpleNamespace:
+        self._simulate("rerank")
+        query_tokens = set(tokenize(query))
+        scores = []
+        for index, document in enumerate(documents):
+            document_tokens = set(tokenize(document))
+            union = query_tokens | document_tokens
+            scores.append((len(query_tokens & document_tokens) / len(union) if union else 0.0, index))
+        scores.sort(key=lambda item: (-item[0], item[1]))
+        return SimpleNamespace(results=[SimpleNamespace(index=index, relevance_score=score)
+                                        for score, index in scores[:top_n or len(scores)]])
@@ -0,0 +1,292 @@
+import contextlib
+import json
+import os
+from multiprocessing import Pool, cpu_count
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+import pdfplumber
+
+# Set in each worker process by _open_worker_pdf
+_worker_pdf = None
+
+
+def group_paragraphs(words: List[Dict]) -> List[str]:
+    """
+    Group positioned words into lines (by vertical position) and lines into paragraphs.
+
+    Args:
+        words (List[Dict]): Words as returned by pdfplumber's extract_words
+
+    Returns:
+        List[str]: Paragraph texts
+    """
+    # Group words into lines and paragraphs
+    lines = []
+    current_line = []
+    current_y = None
+
+    for word in words:
+        if current_y is None:
+            current_y = word['top']
+
+        if abs(word['top'] - current_y) > 5:  # New line
+            if current_line:
+                lines.append(current_line)
+            current_line = [word]
+            current_y = word['top']
+        else:
+            current_line.append(word)
+
+    if current_line:
+        lines.append(current_line)
+
+    # Process lines into paragraphs
+    paragraphs = []
+    current_paragraph = []
+
+    for line in lines:
+        line_text = ' '.join(word['text'] for word in line)
+        if line_text.strip():  # Non-empty line
+            current_paragraph.append(line_text)
+        elif current_paragraph:  # Empty line after paragraph
+            paragraphs.append(' '.join(current_paragraph))
+            current_paragraph = []
+
+    if current_paragraph:
+        paragraphs.append(' '.join(current_paragraph))
+
+    return paragraphs
+
+
+def extract_page(page, tables: bool = False, words: bool = False) -> Dict:
+    """
+    Extract the paragraphs of one pdfplumber page, plus its tables and word positions if requested.
+    """
+    # Extract words with their positions and formatting
+    page_words = page.extract_words(
+        x_tolerance=3,
+        y_tolerance=3,
+        keep_blank_chars=False,
+        use_text_flow=True,
+        horizontal_ltr=True,
+        vertical_ttb=True,
+        extra_attrs=['fontname', 'size']
+    )
+    content = {
+        "page_number": page.page_number,
+        "paragraphs": group_paragraphs(page_words),
+        "tables": page.extract_tables() if tables else [],
+    }
+    if words:
+        content["words"] = page_words
+    return content
+
+
+def _open_worker_pdf(pdf_path: str) -> None:
+    global _worker_pdf
+    _worker_pdf = pdfplumber.open(pdf_path)
+
+
+def _extract_page_range(task: Tuple[int, int, bool, bool]) -> List[Dict]:
+    start, end, tables, words = task
+    pages = []
+    for page_index in range(start, end):
+        page = _worker_pdf.pages[page_index]
+        pages.append(extract_page(page, tables=tables, words=words))
+        # Drop pdfplumber's per-page object cache so memory stays flat over long documents
+        page.close()
+    return pages
+
+
+def iter_pages(pdf_path: str, workers: Optional[int] = None, pages_per_task: int = 8,
+               tables: bool = False, words: bool = False) -> Iterator[Dict]:
+    """
+    Extract the pages of a PDF with a process pool, yielding them in page order.
+
+    Page ranges of `pages_per_task` pages are distributed to the workers; each worker opens
+    the PDF itself once, so nothing but the extracted content crosses process boundaries.
+
+    Args:
+        pdf_path (str): Path to the PDF file
+        workers (int, optional): Worker processes (default: number of CPUs); 1 runs in-process
+        pages_per_task (int): Pages extracted per task
+        tables (bool): Also extract tables
+        words (bool): Also return word positions
+
+    Yields:
+        Dict: {"page_number", "paragraphs", "tables"[, "words"]} for each page, in order
+    """
+    with pdfplumber.open(pdf_path) as pdf:
+        n_pages = len(pdf.pages)
+    workers = min(workers or cpu_count(), max(1, -(-n_pages // pages_per_task)))
+    tasks = [(start, min(start + pages_per_task, n_pages), tables, words) for start in range(0, n_pages, pages_per_task)]
+
+    if workers <= 1:
+        _open_worker_pdf(str(pdf_path))
+        try:
+            for task in tasks:
+                yield from _extract_page_range(task)
+        finally:
+            _worker_pdf.close()
+        return
+
+    with Pool(workers, initializer=_open_worker_pdf, initargs=(str(pdf_path),)) as pool:
+        # imap keeps task order while later ranges are already being extracted
+        for pages in pool.imap(_extract_page_range, tasks):
+            yield from pages
+
+
+def extract_text_with_layout(pdf_path: str, workers: Optional[int] = None, tables: bool = True, words: bool = True) -> List[Dict]:
+    """
+    Extract text with layout information from PDF using pdfplumber.
+    """
+    return list(iter_pages(pdf_path, workers=workers, tables=tables, words=words))
+
+
+def table_to_markdown(table: List[List]) -> str:
+    # Header
+    table_md = ["| " + " | ".join(str(cell) for cell in table[0]) + " |"]
+    # Separator
+    table_md.append("| " + " | ".join("---" for _ in table[0]) + " |")
+    # Rows
+    for row in table[1:]:
+        table_md.append("| " + " | ".join(str(cell) for cell in row) + " |")
+    return "\n".join(table_md) + "\n\n"
+
+
+def page_markdown(page: Dict) -> str:
+    # Add page header
+    page_md = [f"## Page {page['page_number']}\n\n"]
+
+    # Process paragraphs
+    for paragraph in page['paragraphs']:
+        page_md.append(f"{paragraph}\n\n")
+
+    # Process tables if any
+    if page['tables']:
+        page_md.append("### Tables\n\n")
+        for table in page['tables']:
+            if table:
+                page_md.append(table_to_markdown(table))
+    return "".join(page_md)
+
+
+def extract_images_from_pdf(pdf_path: str, images_dir: Path) -> List[str]:
+    """Save every embedded image with PyMuPDF as images_dir/page_<n>_img_<i>.<ext>."""
+    import fitz  # PyMuPDF, only needed for image extraction
+
+    images_dir.mkdir(exist_ok=True)
+    doc = fitz.open(pdf_path)
+    image_paths = []
+    for page_num, page in enumerate(doc):
+        for img_index, img in enumerate(page.get_images(full=True)):
+            base_image = doc.extract_image(img[0])
+            image_path = images_dir / f"page_{page_num + 1}_img_{img_index + 1}.{base_image['ext']}"
+            with open(image_path, "wb") as img_file:
+                img_file.write(base_image["image"])
+            image_paths.append(str(image_path))
+    doc.close()
+    return image_paths
+
+
+def parse_pdf(pdf_path: str, output_dir: Optional[str] = None, extract_images: bool = False,
+              workers: Optional[int] = None, tables: bool = False, words: bool = False, pages_per_task: int = 8) -> dict:
+    """
+    Parse a PDF file using pdfplumber and extract text and images.
+
+    Pages are extracted in parallel and appended to the output files in page order as they
+    arrive, so memory does not grow with the document.
+
+    Args:
+        pdf_path (str): Path to the PDF file
+        output_dir (str, optional): Directory to save outputs. If None, uses PDF filename as directory.
+        extract_images (bool, optional): Whether to extract images from the PDF. Defaults to False.
+        workers (int, optional): Worker processes (default: number of CPUs)
+        tables (bool): Extract tables into the markdown file. Defaults to False.
+        words (bool): Save word positions to words.jsonl (one line per page). Defaults to False.
+        pages_per_task (int): Pages handed to a worker at a time
+
+    Returns:
+        dict: Dictionary containing paths to the generated files
+    """
+    # Create output directory if not specified
+    if output_dir is None:
+        output_dir = os.path.splitext(pdf_path)[0]
+
+    # Create necessary directories
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    text_path = output_dir / "text.txt"
+    md_path = output_dir / "markdown.md"
+    words_path = output_dir / "words.jsonl"
+    images_dir = output_dir / "images"
+    result = {
+        "text_file": str(text_path),
+        "markdown_file": str(md_path)
+    }
+
+    # Skip what already exists
+    done = text_path.exists() and md_path.exists() and (not words or words_path.exists())
+    if done and extract_images and images_dir.exists() and any(images_dir.iterdir()):
+        result.update({
+            "images_dir": str(images_dir),
+            "image_paths": [str(f) for f in images_dir.glob("*") if f.is_file()]
+        })
+        return result
+    if done and not extract_images:
+        return result
+
+    if not done:
+        # Written under temporary names so an interrupted run never looks finished
+        tmp_paths = [Path(f"{path}.tmp") for path in (text_path, md_path, words_path)]
+        try:
+            with open(tmp_paths[0], "w", encoding="utf-8") as text_file, \
+                    open(tmp_paths[1], "w", encoding="utf-8") as md_file, \
+                    (open(tmp_paths[2], "w", encoding="utf-8") if words else contextlib.nullcontext()) as words_file:
+                for page in iter_pages(pdf_path, workers=workers, pages_per_task=pages_per_task, tables=tables, words=words):
+                    if page['page_number'] > 1:
+                        text_file.write("\n")
+                    text_file.write("\n\n".join(page['paragraphs']))
+                    md_file.write(page_markdown(page))
+                    if words:
+                        words_file.write(json.dumps({"page_number": page['page_number'], "words": page['words']}, ensure_ascii=False) + "\n")
+        except Exception as e:
+            print(f"Error extracting text with layout from {pdf_path}: {e}")
+            with open("parsing_errors.log", "a") as f:
+                f.write(f"{pdf_path}: {e}\n")
+            return
+        os.replace(tmp_paths[0], text_path)
+        os.replace(tmp_paths[1], md_path)
+        if words:
+            os.replace(tmp_paths[2], words_path)
+            result["words_file"] = str(words_path)
+
+    # Only process images if requested
+    if extract_images:
+        result.update({
+            "images_dir": str(images_dir),
+            "image_paths": extract_images_from_pdf(pdf_path, images_dir)
+        })
+
+    return result
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description='Extract text (and optionally tables, word positions and images) from a PDF')
+    parser.add_argument('pdf_file', help='Path to the PDF file')
+    parser.add_argument('output_dir', nargs='?', default=None, help='Output directory (default: PDF path without extension)')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: number of CPUs)')
+    parser.add_argument('--pages-per-task', type=int, default=8, help='Pages handed to a worker at a time (default: 8)')
+    parser.add_argument('--tables', action='store_true', help='Extract tables into markdown.md')
+    parser.add_argument('--words', action='store_true', help='Save word positions to words.jsonl')
+    parser.add_argument('--images', action='store_true', help='Extract embedded images (requires PyMuPDF)')
+
+    args = parser.parse_args()
+    start = time.perf_counter()
+    result = parse_pdf(args.pdf_file, args.output_dir, extract_images=args.images, workers=args.workers,
+                       tables=args.tables, words=args.words, pages_per_task=args.pages_per_task)
+    print(f"Parsed {args.pdf_file} in {time.perf_counter() - start:.1f}s: {result}")
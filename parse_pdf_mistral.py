@@ -0,0 +1,337 @@
+import base64
+import hashlib
+import json
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+from pydantic import BaseModel
+from mistralai import Mistral
+from mistralai import DocumentURLChunk
+from mistralai.models import OCRResponse
+
+OCR_MODEL = "mistral-ocr-latest"
+# Written last in each output directory; records which PDF content the results belong to
+MANIFEST_NAME = "ocr_manifest.json"
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_manifest(output_dir: Path) -> Optional[dict]:
+    manifest_path = output_dir / MANIFEST_NAME
+    if not manifest_path.exists():
+        return None
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def find_cached_results(output_root: Path) -> Dict[str, Path]:
+    """Map the SHA-256 of every PDF already OCRed under output_root to its output directory."""
+    cached = {}
+    for manifest_path in output_root.glob(f"**/{MANIFEST_NAME}"):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("model") == OCR_MODEL:
+            cached.setdefault(manifest["sha256"], manifest_path.parent)
+    return cached
+
+
+def _as_dict(obj: Union[BaseModel, dict], exclude: str) -> dict:
+    """An OCR page or image, SDK model or JSON dict, as a dict without one (large) field."""
+    if isinstance(obj, dict):
+        return {key: value for key, value in obj.items() if key != exclude}
+    return obj.model_dump(exclude={exclude})
+
+
+def save_ocr_result(response: Union[OCRResponse, dict], output_dir: Path, sha256: str, source: str) -> None:
+    """
+    Save an OCR response page by page: each image is decoded and written when it is reached, and
+    the page is dropped from the response once saved, so no full copy of the base64 is ever made
+    and response.json only references the images (images/<id>).
+
+    Args:
+        response (Union[OCRResponse, dict]): The SDK's OCR response, or its JSON dict (batch output)
+        output_dir (Path): Directory for text.txt, response.json, images/ and the manifest
+        sha256 (str): Hash of the source PDF
+        source (str): Path of the source PDF
+    """
+    output_dir.mkdir(parents=True, exist_ok=True)
+    # An older manifest must not vouch for a half-written result
+    if (output_dir / MANIFEST_NAME).exists():
+        os.remove(output_dir / MANIFEST_NAME)
+
+    pages = response["pages"] if isinstance(response, dict) else response.pages
+    saved = _as_dict(response, exclude="pages")
+    saved["pages"] = []
+
+    # Save images to PNG files
+    images_dir = output_dir / "images"
+    images_dir.mkdir(exist_ok=True)
+    n_images = 0
+    with open(output_dir / "text.txt", "w", encoding="utf-8") as text_file:
+        for index in range(len(pages)):
+            page, pages[index] = pages[index], None
+            images = page["images"] if isinstance(page, dict) else page.images
+            page_record = _as_dict(page, exclude="images")
+            page_record["images"] = []
+            for img in images or []:
+                image_record = _as_dict(img, exclude="image_base64")
+                image_base64 = img["image_base64"] if isinstance(img, dict) else img.image_base64
+                if image_base64:
+                    # Base64 data after the data-URI comma, or the whole string if there is no prefix
+                    with open(images_dir / image_record["id"], "wb") as f:
+                        f.write(base64.b64decode(image_base64.split(',', 1)[-1]))
+                    image_record["image_file"] = f"images/{image_record['id']}"
+                    n_images += 1
+                image_record["image_base64"] = None
+                page_record["images"].append(image_record)
+            # Save raw text
+            text_file.write(page_record["markdown"])  # Use markdown instead of text attribute
+            saved["pages"].append(page_record)
+            del page, images
+
+    with open(output_dir / "response.json", "w") as f:
+        json.dump(saved, f)
+    with open(output_dir / MANIFEST_NAME, "w", encoding="utf-8") as f:
+        json.dump({"sha256": sha256, "source": source, "model": OCR_MODEL,
+                   "pages": len(saved["pages"]), "images": n_images}, f)
+
+
+def copy_ocr_result(cached_dir: Path, output_dir: Path, source: str) -> None:
+    """Reuse the results of an identical PDF OCRed under another name."""
+    manifest = load_manifest(cached_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    for name in ("text.txt", "response.json"):
+        shutil.copy2(cached_dir / name, output_dir / name)
+    shutil.copytree(cached_dir / "images", output_dir / "images", dirs_exist_ok=True)
+    with open(output_dir / MANIFEST_NAME, "w", encoding="utf-8") as f:
+        json.dump(dict(manifest, source=source), f)
+
+
+def upload_for_ocr(pdf_file: Path, client: Mistral) -> str:
+    """Upload a PDF to Mistral's OCR service and return a signed URL for it."""
+    uploaded_file = client.files.upload(
+        file={
+            "file_name": pdf_file.name,
+            "content": pdf_file.read_bytes(),
+        },
+        purpose="ocr",
+    )
+    return client.files.get_signed_url(file_id=uploaded_file.id, expiry=1).url
+
+
+def process_pdf(pdf_file: Path, output_dir: Path, client: Mistral, sha256: Optional[str] = None):
+    """Process a single PDF file and save results to output directory.
+
+    Args:
+        pdf_file: Path to the PDF file to process
+        output_dir: Directory where results will be saved
+        client: Mistral client instance
+        sha256: Hash of the PDF, if already computed
+    """
+    print(f"Processing {pdf_file}...")
+
+    # Process PDF with OCR, including embedded images
+    pdf_response = client.ocr.process(
+        document=DocumentURLChunk(document_url=upload_for_ocr(pdf_file, client)),
+        model=OCR_MODEL,
+        include_image_base64=True
+    )
+    # Saved straight from the SDK objects: model_dump() would copy every page's base64 images at once
+    save_ocr_result(pdf_response, output_dir, sha256 or file_sha256(pdf_file), str(pdf_file))
+
+
+def plan_ocr(jobs: List[Tuple[Path, Path]], output_root: Path, force: bool = False,
+             workers: int = 4) -> Tuple[List[Tuple[Path, Path, str]], List[Tuple[Path, Path, Path]]]:
+    """
+    Hash the PDFs and settle the ones that already have results.
+
+    PDFs whose output directory holds a result for the same SHA-256 are skipped, and PDFs
+    whose content was OCRed elsewhere under output_root are copied from there. Identical
+    PDFs within the run are OCRed once.
+
+    Args:
+        jobs (List[Tuple[Path, Path]]): (pdf file, output directory) pairs
+        output_root (Path): Directory searched for existing results
+        force (bool): OCR everything again
+        workers (int): Files hashed at the same time
+
+    Returns:
+        Tuple: (pdf file, output directory, sha256) still to OCR, and (pdf file, output directory,
+        directory of the identical pending PDF) to copy once that one is done
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        hashes = list(executor.map(lambda job: file_sha256(job[0]), jobs))
+
+    cached = find_cached_results(output_root) if output_root.exists() and not force else {}
+    pending = []
+    duplicates = []
+    pending_dirs = {}
+    skipped = copied = 0
+    for (pdf_file, output_dir), sha in zip(jobs, hashes):
+        manifest = load_manifest(output_dir)
+        if not force and manifest and manifest["sha256"] == sha and manifest.get("model") == OCR_MODEL:
+            skipped += 1
+        elif sha in cached:
+            copy_ocr_result(cached[sha], output_dir, str(pdf_file))
+            copied += 1
+        elif sha in pending_dirs:
+            duplicates.append((pdf_file, output_dir, pending_dirs[sha]))
+        else:
+            pending.append((pdf_file, output_dir, sha))
+            pending_dirs[sha] = output_dir
+    print(f"{len(jobs)} PDFs: {skipped} unchanged, {copied + len(duplicates)} reused from identical files, {len(pending)} to OCR")
+    return pending, duplicates
+
+
+def copy_duplicates(duplicates: List[Tuple[Path, Path, Path]]) -> None:
+    """Copy the results of PDFs OCRed in this run to their identical copies."""
+    for pdf_file, output_dir, source_dir in duplicates:
+        if load_manifest(source_dir):
+            copy_ocr_result(source_dir, output_dir, str(pdf_file))
+
+
+def process_pdfs(jobs: List[Tuple[Path, Path]], output_root: Path, client: Mistral, workers: int = 4, force: bool = False):
+    """OCR several PDFs with synchronous calls, `workers` at a time, skipping unchanged ones."""
+    pending, duplicates = plan_ocr(jobs, output_root, force=force, workers=workers)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # list() re-raises the first error
+        list(executor.map(lambda job: process_pdf(job[0], job[1], client, sha256=job[2]), pending))
+    copy_duplicates(duplicates)
+
+
+def process_pdf_batch(input_folder: Path, output_folder: Path, client: Mistral, workers: int = 4, force: bool = False):
+    """Process all PDFs in a folder using Mistral's batch OCR processing.
+
+    PDFs already OCRed (same SHA-256) are skipped, the rest are uploaded concurrently, and the
+    job output is read one document at a time.
+
+    Args:
+        input_folder: Directory containing PDF files
+        output_folder: Directory to save the processed output
+        client: Mistral client instance
+        workers: Concurrent uploads
+        force: OCR every PDF again
+    """
+    # Get all PDF files in input folder
+    pdf_files = sorted(input_folder.glob("**/*.pdf"))
+    if not pdf_files:
+        print(f"No PDF files found in {input_folder}")
+        return
+
+    # Use the PDF filename as the identifier
+    pending, duplicates = plan_ocr([(pdf_file, output_folder / pdf_file.stem) for pdf_file in pdf_files], output_folder, force=force, workers=workers)
+    if not pending:
+        return
+    pending_by_id = {pdf_file.stem: (pdf_file, output_dir, sha) for pdf_file, output_dir, sha in pending}
+
+    # Create intermediate processing directory
+    intermediate_dir = output_folder / "_processing"
+    intermediate_dir.mkdir(parents=True, exist_ok=True)
+
+    # Upload PDFs to Mistral concurrently
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        signed_urls = list(executor.map(lambda job: upload_for_ocr(job[0], client), pending))
+
+    # Create batch file
+    batch_file = intermediate_dir / f"batch_{int(time.time())}.jsonl"
+    with open(batch_file, "w") as f:
+        for (pdf_file, _, _), signed_url in zip(pending, signed_urls):
+            entry = {
+                "custom_id": pdf_file.stem,
+                "body": {
+                    "document": {
+                        "type": "document_url",
+                        "document_url": signed_url,
+                    },
+                    "include_image_base64": True
+                }
+            }
+            f.write(json.dumps(entry) + "\n")
+
+    print(f"Created batch file with {len(pending)} PDFs")
+    print("Starting batch processing...")
+
+    # Upload batch file
+    with open(batch_file, "rb") as f:
+        batch_data = client.files.upload(
+            file={
+                "file_name": batch_file.name,
+                "content": f,
+            },
+            purpose="batch",
+        )
+
+    # Create and monitor job
+    created_job = client.batch.jobs.create(
+        input_files=[batch_data.id],
+        model=OCR_MODEL,
+        endpoint="/v1/ocr",
+        metadata={"job_type": "pdf_processing"}
+    )
+
+    print(f"Job created with ID: {created_job.id}")
+
+    # Monitor progress
+    retrieved_job = client.batch.jobs.get(job_id=created_job.id)
+    while retrieved_job.status in ["QUEUED", "RUNNING"]:
+        retrieved_job = client.batch.jobs.get(job_id=created_job.id)
+        print(f"Status: {retrieved_job.status}")
+        print(f"Progress: {retrieved_job.succeeded_requests + retrieved_job.failed_requests}/{retrieved_job.total_requests} "
+              f"({round((retrieved_job.succeeded_requests + retrieved_job.failed_requests) / max(retrieved_job.total_requests, 1) * 100, 1)}%)")
+        time.sleep(2)
+
+    if not retrieved_job.output_file:
+        raise RuntimeError(f"Batch job {retrieved_job.id} ended with status {retrieved_job.status} and no output")
+
+    # Download results to disk, then handle one document (line) at a time
+    print("Downloading results...")
+    downloaded_file = client.files.download(file_id=retrieved_job.output_file)
+    download_path = intermediate_dir / f"output_{int(time.time())}.jsonl"
+    with open(download_path, "wb") as f:
+        for chunk in downloaded_file.iter_bytes():
+            f.write(chunk)
+
+    with open(download_path, "r") as f:
+        for line in f:
+            response_dict = json.loads(line)
+            response = response_dict.get("response") or {}
+            if response_dict["custom_id"] not in pending_by_id or response.get("status_code") != 200:
+                print(f"Skipping result for {response_dict['custom_id']}: {response_dict.get('error')}")
+                continue
+            pdf_file, output_dir, sha = pending_by_id[response_dict["custom_id"]]
+            save_ocr_result(response["body"], output_dir, sha, str(pdf_file))
+            del response_dict
+    copy_duplicates(duplicates)
+
+    print(f"Processing complete. Results saved in {output_folder}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='OCR PDFs with Mistral, skipping files whose results are already stored')
+    parser.add_argument('input', help='PDF file or directory of PDFs')
+    parser.add_argument('output_dir', help='Output directory (one subfolder per PDF when input is a directory)')
+    parser.add_argument('--batch', action='store_true', help='Use the batch OCR API instead of synchronous calls')
+    parser.add_argument('--workers', type=int, default=4, help='Concurrent uploads / OCR calls (default: 4)')
+    parser.add_argument('--force', action='store_true', help='OCR every PDF again, even if unchanged')
+
+    args = parser.parse_args()
+    client = Mistral(api_key=os.getenv("MISTRAL_API_KEY"))
+    input_path, output_dir = Path(args.input), Path(args.output_dir)
+    if args.batch and input_path.is_dir():
+        process_pdf_batch(input_path, output_dir, client, workers=args.workers, force=args.force)
+    elif input_path.is_dir():
+        jobs = [(pdf_file, output_dir / pdf_file.stem) for pdf_file in sorted(input_path.glob("**/*.pdf"))]
+        process_pdfs(jobs, output_dir, client, workers=args.workers, force=args.force)
+    else:
+        process_pdfs([(input_path, output_dir)], output_dir, client, workers=args.workers, force=args.force)
@@ -0,0 +1,280 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+STAGES = ["parse", "format", "categorize", "partition", "evaluate"]
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class Task:
+    """
+    One step of the pipeline: an action that turns input files into output files.
+
+    `inputs` may be a callable so tasks whose inputs are produced by earlier tasks (e.g. the
+    categorized files of every year) resolve them only when they are about to run.
+    """
+
+    def __init__(self, name: str, stage: str, inputs, outputs: List[str], params: Dict[str, Any], action: Callable[[], None]):
+        self.name = name
+        self.stage = stage
+        self._inputs = inputs
+        self.outputs = outputs
+        self.params = params
+        self.action = action
+
+    @property
+    def inputs(self) -> List[str]:
+        return sorted(self._inputs() if callable(self._inputs) else self._inputs)
+
+
+class Pipeline:
+    """
+    Incremental task runner.
+
+    For every task it records, in a JSON state file, the SHA-256 of each input, the
+    parameters (including models) and the hashes of the outputs it produced. A task only
+    runs again when an output is missing, an input changed or its parameters changed.
+    """
+
+    def __init__(self, state_path: str, force: bool = False, dry_run: bool = False):
+        self.state_path = state_path
+        self.force = force
+        self.dry_run = dry_run
+        self.lock = threading.Lock()
+        self.hashes: Dict[str, tuple] = {}
+        self.state: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(state_path):
+            with open(state_path, "r", encoding="utf-8") as f:
+                self.state = json.load(f)
+
+    def hash_file(self, path: str) -> str:
+        # Memoized on (size, mtime) so unchanged files are hashed once per run
+        stat = os.stat(path)
+        with self.lock:
+            cached = self.hashes.get(path)
+        if cached and cached[:2] == (stat.st_size, stat.st_mtime_ns):
+            return cached[2]
+        digest = file_sha256(path)
+        with self.lock:
+            self.hashes[path] = (stat.st_size, stat.st_mtime_ns, digest)
+        return digest
+
+    def stale_reason(self, task: Task) -> Optional[str]:
+        """Why the task has to run, or None if its outputs are up to date."""
+        if self.force:
+            return "forced"
+        missing = [path for path in task.outputs if not os.path.exists(path)]
+        if missing:
+            return f"missing {missing[0]}"
+        record = self.state.get(task.name)
+        if record is None:
+            return "no record"
+        if record["params"] != task.params:
+            return "parameters changed"
+        inputs = {path: self.hash_file(path) for path in task.inputs if os.path.exists(path)}
+        if record["inputs"] != inputs:
+            return "inputs changed"
+        return None
+
+    def run(self, task: Task) -> bool:
+        """Run the task if it is stale. Returns True if it ran."""
+        reason = self.stale_reason(task)
+        if reason is None:
+            print(f"[{task.name}] up to date")
+            return False
+        print(f"[{task.name}] {'would run' if self.dry_run else 'running'} ({reason})")
+        if self.dry_run:
+            return True
+
+        inputs = {path: self.hash_file(path) for path in task.inputs if os.path.exists(path)}
+        # Stages skip outputs that already exist, so stale ones are removed first
+        for path in task.outputs:
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            elif os.path.exists(path):
+                os.remove(path)
+        start = time.perf_counter()
+        task.action()
+        elapsed = time.perf_counter() - start
+        missing = [path for path in task.outputs if not os.path.exists(path)]
+        if missing:
+            raise RuntimeError(f"[{task.name}] did not produce {missing[0]}")
+
+        record = {
+            "stage": task.stage,
+            "params": task.params,
+            "inputs": inputs,
+            "outputs": {path: self.hash_file(path) for path in task.outputs if os.path.isfile(path)},
+            "seconds": round(elapsed, 1),
+            "updated_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        with self.lock:
+            self.state[task.name] = record
+            self._save()
+        print(f"[{task.name}] done in {elapsed:.1f}s")
+        return True
+
+    def _save(self) -> None:
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.state_path)
+
+    def run_chains(self, chains: List[List[Task]], workers: int = 1) -> None:
+        """Run independent chains of tasks (e.g. one per year) in parallel, each chain in order."""
+        def run_chain(chain: List[Task]) -> None:
+            for task in chain:
+                self.run(task)
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            # list() re-raises the first error
+            list(executor.map(run_chain, chains))
+
+
+def year_tasks(year: int, args) -> List[Task]:
+    """parse -> format -> categorize tasks for one exam year."""
+    pdf_file = os.path.join(args.raw_dir, f"{year}.pdf")
+    year_dir = os.path.join(args.parsing_dir, str(year))
+    text_file = os.path.join(year_dir, "text.txt")
+    questions_file = os.path.join(year_dir, "questions.json")
+    categorized_file = os.path.join(year_dir, "categorized_questions.json")
+
+    def parse():
+        if args.parser == "mistral":
+            from parse_pdf_mistral import MANIFEST_NAME, process_pdfs
+            from mistralai import Mistral
+            # The manifest would vouch for the text file just removed; results for an identical
+            # PDF of another year are still copied instead of OCRed again
+            manifest = os.path.join(year_dir, MANIFEST_NAME)
+            if os.path.exists(manifest):
+                os.remove(manifest)
+            process_pdfs([(Path(pdf_file), Path(year_dir))], Path(args.parsing_dir), Mistral(api_key=os.getenv("MISTRAL_API_KEY")),
+                         force=args.force)
+        else:
+            from parse_pdf import parse_pdf
+            parse_pdf(pdf_file, year_dir, workers=args.pdf_workers)
+
+    def format_questions():
+        from format_text import clean_text
+        clean_text(text_file, questions_file, workers=args.llm_workers, provider=args.provider, model_name=args.format_model,
+                   desc=str(year), fast_path=not args.no_fast_path, chunk_tokens=args.chunk_tokens, batch=args.batch)
+
+    def categorize():
+        from add_categories import add_category_to_json
+        add_category_to_json(questions_file, categorized_file, provider=args.provider, model_name=args.category_model,
+                             batch_size=args.batch_size, batch_job=args.batch)
+
+    return [
+        Task(f"parse/{year}", "parse", [pdf_file], [text_file], {"parser": args.parser}, parse),
+        Task(f"format/{year}", "format", [text_file], [questions_file],
+             {"provider": args.provider, "model": args.format_model, "chunk_tokens": args.chunk_tokens,
+              "fast_path": not args.no_fast_path, "batch": args.batch}, format_questions),
+        Task(f"categorize/{year}", "categorize", [questions_file], [categorized_file],
+             {"provider": args.provider, "model": args.category_model, "batch_size": args.batch_size, "batch_job": args.batch},
+             categorize),
+    ]
+
+
+def corpus_tasks(args) -> List[Task]:
+    """partition (and optionally evaluate) tasks over every categorized year."""
+    def categorized_files():
+        return [str(path) for path in Path(args.parsing_dir).glob("*/categorized_questions.json")]
+
+    def partition():
+        from merge_and_filter import partition_questions
+        partition_questions(args.parsing_dir, args.dataset_dir, provenance=True, dedup_threshold=args.dedup)
+
+    tasks = [Task("partition", "partition", categorized_files, [args.dataset_dir],
+                  {"provenance": True, "dedup": args.dedup}, partition)]
+
+    for category in args.evaluate or []:
+        from merge_and_filter import category_filename
+        dataset_file = os.path.join(args.dataset_dir, category_filename(category))
+        output_file = os.path.join(args.results_dir, category_filename(category).replace(".json", "_evaluation.json"))
+
+        def evaluate(dataset_file=dataset_file, output_file=output_file):
+            from evaluate import evaluate_models
+            from llm import LLM
+            os.makedirs(args.results_dir, exist_ok=True)
+            llms = [LLM(provider=spec.split(':', 1)[0], model_name=spec.split(':', 1)[1], stage="evaluate") for spec in args.eval_models]
+            evaluate_models(dataset_file, llms, output_file=output_file, concurrency=args.llm_workers, batch=args.batch,
+                            fast=args.fast_eval, reasoning_sample=args.reasoning_sample)
+
+        tasks.append(Task(f"evaluate/{category_filename(category, '')}", "evaluate", [dataset_file], [output_file],
+                          {"models": args.eval_models, "fast": args.fast_eval, "reasoning_sample": args.reasoning_sample}, evaluate))
+    return tasks
+
+
+def discover_years(raw_dir: str) -> List[int]:
+    """Exam years with a PDF in raw_dir (files named <year>.pdf)."""
+    if not os.path.isdir(raw_dir):
+        return []
+    return sorted(int(name[:-4]) for name in os.listdir(raw_dir) if re.fullmatch(r"\d{4}\.pdf", name))
+
+
+def main():
+    import argparse
+    from llm_providers import model_spec
+
+    parser = argparse.ArgumentParser(description='Run the pipeline incrementally: parse -> format -> categorize per year, then partition and evaluate')
+    parser.add_argument('--years', type=int, nargs='+', default=None,
+                        help='Exam years to process (default: every <year>.pdf in --raw-dir)')
+    parser.add_argument('--until', choices=STAGES, default=None,
+                        help='Last stage to run (default: evaluate with --evaluate, partition otherwise)')
+    parser.add_argument('--workers', type=int, default=2, help='Years processed in parallel (default: 2)')
+    parser.add_argument('--llm-workers', type=int, default=4, help='Concurrent LLM calls within a stage (default: 4)')
+    parser.add_argument('--pdf-workers', type=int, default=None, help='Processes per PDF for pdfplumber parsing (default: number of CPUs)')
+    parser.add_argument('--raw-dir', default='data/raw', help='Directory with <year>.pdf files (default: data/raw)')
+    parser.add_argument('--parsing-dir', default='data/parsing', help='Per-year working directory (default: data/parsing)')
+    parser.add_argument('--dataset-dir', default='dataset', help='Per-category datasets (default: dataset)')
+    parser.add_argument('--results-dir', default='results', help='Evaluation results (default: results)')
+    parser.add_argument('--parser', choices=['pdfplumber', 'mistral'], default='pdfplumber', help='PDF text extraction (default: pdfplumber)')
+    parser.add_argument('--provider', default='mistral', help='LLM provider for formatting and categorization (default: mistral)')
+    parser.add_argument('--format-model', default='mistral-large-latest', help='Model for question formatting (default: mistral-large-latest)')
+    parser.add_argument('--category-model', default='mistral-small-latest', help='Model for categorization (default: mistral-small-latest)')
+    parser.add_argument('--no-fast-path', action='store_true',
+                        help='Send the whole text to the LLM instead of parsing well-formed questions locally')
+    parser.add_argument('--chunk-tokens', type=int, default=1000, help='Token budget of each chunk sent to the LLM (default: 1000)')
+    parser.add_argument('--batch-size', type=int, default=20, help='Questions categorized per LLM call (default: 20)')
+    parser.add_argument('--batch', action='store_true', help='Use provider batch jobs for the LLM stages')
+    parser.add_argument('--dedup', type=float, default=None, metavar='THRESHOLD', help='Drop near-duplicates when partitioning')
+    parser.add_argument('--evaluate', nargs='+', default=None, metavar='CATEGORY', help='Categories to evaluate')
+    parser.add_argument('--eval-models', nargs='+', type=model_spec, default=['cohere:command-r-08-2024'],
+                        help='Models to evaluate as provider:model (default: cohere:command-r-08-2024)')
+    parser.add_argument('--fast-eval', action='store_true',
+                        help='Answer-only evaluation: structured letter output, no reasoning (see evaluate.py --fast)')
+    parser.add_argument('--reasoning-sample', type=float, default=0.0,
+                        help='With --fast-eval, share of questions that still get full reasoning (default: 0)')
+    parser.add_argument('--state', default='data/pipeline_state.json', help='Where artifact records are kept (default: data/pipeline_state.json)')
+    parser.add_argument('--force', action='store_true', help='Rebuild every selected artifact')
+    parser.add_argument('--dry-run', action='store_true', help='Only report which artifacts are stale')
+
+    args = parser.parse_args()
+    years = args.years or discover_years(args.raw_dir)
+    last = STAGES.index(args.until or ('evaluate' if args.evaluate else 'partition'))
+    os.makedirs(os.path.dirname(args.state) or ".", exist_ok=True)
+    pipeline = Pipeline(args.state, force=args.force, dry_run=args.dry_run)
+
+    chains = [[task for task in year_tasks(year, args) if STAGES.index(task.stage) <= last] for year in years]
+    pipeline.run_chains(chains, workers=args.workers)
+    for task in corpus_tasks(args):
+        if STAGES.index(task.stage) <= last:
+            pipeline.run(task)
+
+
+if __name__ == "__main__":
+    main()
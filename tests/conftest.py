@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("LLM_TELEMETRY_SUMMARY", "0")
+os.environ.pop("LLM_CACHE_PATH", None)
+os.environ.pop("LLM_GATEWAY_URL", None)
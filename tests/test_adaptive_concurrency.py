@@ -0,0 +1,40 @@
+import email.utils
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from adaptive_concurrency import AdaptiveLimiter, get_retry_after
+
+
+def error_with(retry_after):
+    return SimpleNamespace(status_code=429, headers={"retry-after": retry_after})
+
+
+@pytest.mark.parametrize("value", ["garbage", "", "Wed, 99 Foo 2015 99:99:99 GMT"])
+def test_malformed_retry_after_is_ignored(value):
+    assert get_retry_after(error_with(value)) is None
+
+
+def test_retry_after_seconds_and_dates():
+    assert get_retry_after(error_with("7")) == 7
+    in_a_minute = time.time() + 60
+    gmt = email.utils.formatdate(in_a_minute, usegmt=True)
+    assert 55 < get_retry_after(error_with(gmt)) <= 60
+    # Without a zone the date is taken as GMT, not local time
+    naive = gmt.replace(" GMT", "")
+    assert 55 < get_retry_after(error_with(naive)) <= 60
+
+
+def test_only_successes_grow_the_window():
+    limiter = AdaptiveLimiter(initial=4)
+    for _ in range(3):
+        limiter.acquire()
+        limiter.release(0.1, failed=True)
+    assert limiter.window == 4
+    assert limiter.latency_ewma is None
+
+    limiter.acquire()
+    limiter.release(0.1)
+    assert limiter.window == 4.25
+    assert limiter.latency_ewma == 0.1
@@ -0,0 +1,21 @@
+import numpy as np
+
+from ann_index import IVFIndex, recall_report
+
+
+def test_recall_on_raw_vectors_rises_with_nprobe():
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(20, 32))
+    # Clustered vectors with very different norms, as in a raw .npy matrix
+    vectors = centers[rng.integers(0, 20, size=4000)] + rng.normal(scale=0.5, size=(4000, 32))
+    vectors = (vectors * rng.uniform(0.1, 10.0, size=(4000, 1))).astype(np.float32)
+    queries = vectors[rng.choice(4000, size=100, replace=False)] + rng.normal(scale=0.05, size=(100, 32)).astype(np.float32)
+    index = IVFIndex(n_lists=32).build(vectors)
+
+    rows = recall_report(index, queries, vectors, top_k=10, nprobes=[1, 4, 32])
+
+    recalls = [row["recall"] for row in rows[1:]]
+    assert recalls == sorted(recalls)
+    assert recalls[0] < recalls[-1]
+    # Scanning every cluster is an exact search, so it must agree with the exact baseline
+    assert recalls[-1] > 0.99
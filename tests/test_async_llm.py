@@ -0,0 +1,71 @@
+import asyncio
+import time
+
+from async_llm import AsyncLLM, TokenBucket
+from llm_telemetry import Telemetry
+from mock_provider import MockClient
+
+
+def numbered_client(count, **config):
+    """Mock client answering "prompt <i>" with "answer <i>", with lognormal latencies so calls finish out of order."""
+    responses = [{"pattern": f"^prompt {i}$", "response": f"answer {i}"} for i in range(count)]
+    return MockClient({"chat": {"latency": 0.01, "sigma": 1.0, "error_rate": 0.0}, "responses": responses, **config})
+
+
+def test_amap_returns_results_in_input_order():
+    telemetry = Telemetry()
+    llm = AsyncLLM("mock", "order", max_concurrency=8, requests_per_minute=6000, client=numbered_client(30), telemetry=telemetry)
+
+    responses = asyncio.run(llm.amap([f"prompt {i}" for i in range(30)]))
+
+    assert responses == [f"answer {i}" for i in range(30)]
+    assert len(telemetry.records) == 30
+
+
+def test_concurrency_cap_is_respected():
+    # The mock answers 429 beyond 2 calls in flight, so a single retry would show the cap was exceeded
+    telemetry = Telemetry()
+    llm = AsyncLLM("mock", "cap", max_concurrency=2, requests_per_minute=6000, backoff_base=0.001,
+                   client=numbered_client(12, concurrency_limit=2), telemetry=telemetry)
+
+    responses = asyncio.run(llm.amap([f"prompt {i}" for i in range(12)]))
+
+    assert responses == [f"answer {i}" for i in range(12)]
+    assert all(entry["retries"] == 0 and entry["error"] is None for entry in telemetry.records)
+
+
+def test_request_budget_spaces_out_calls():
+    # 600 requests per minute with a burst of 1: one call every 0.1s
+    llm = AsyncLLM("mock", "budget", max_concurrency=8, client=numbered_client(5), telemetry=Telemetry())
+    llm.request_bucket = TokenBucket(600, capacity=1)
+
+    start = time.monotonic()
+    responses = asyncio.run(llm.amap([f"prompt {i}" for i in range(5)]))
+
+    assert responses == [f"answer {i}" for i in range(5)]
+    assert time.monotonic() - start >= 0.35
+
+
+def test_token_bucket_waits_for_refill():
+    async def take(bucket, times):
+        for _ in range(times):
+            await bucket.acquire(1)
+
+    bucket = TokenBucket(1200, capacity=2)
+    start = time.monotonic()
+    asyncio.run(take(bucket, 6))
+    # 2 from the burst, 4 more at 20 per second
+    assert time.monotonic() - start >= 0.18
+
+
+def test_throttled_calls_are_retried():
+    telemetry = Telemetry()
+    llm = AsyncLLM("mock", "retry", max_concurrency=4, requests_per_minute=6000, backoff_base=0.001, max_retries=20,
+                   client=numbered_client(20, chat={"latency": 0.0, "sigma": 0.0, "error_rate": 0.3}, error_status=503),
+                   telemetry=telemetry)
+
+    responses = asyncio.run(llm.amap([f"prompt {i}" for i in range(20)]))
+
+    assert responses == [f"answer {i}" for i in range(20)]
+    assert sum(entry["retries"] for entry in telemetry.records) > 0
+    assert all(entry["error"] is None for entry in telemetry.records)
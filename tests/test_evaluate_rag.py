@@ -0,0 +1,72 @@
+import json
+from pathlib import Path
+
+import pytest
+
+import llm_providers
+from benchmark import build_context
+from eval_runner import print_summary, run_evaluation
+from evaluate_rag import RAGEvaluator
+from llm import LLM
+
+DATASET = Path(__file__).resolve().parent.parent / "dataset" / "constitucional.json"
+
+
+@pytest.fixture
+def rag_files(tmp_path, monkeypatch):
+    """A few dataset questions and their synthetic context, answered instantly by the mock provider."""
+    monkeypatch.setenv("MOCK_LLM_CONFIG", json.dumps({"chat": {"latency": 0}, "embed": {"latency": 0}, "rerank": {"latency": 0}}))
+    questions = json.loads(DATASET.read_text(encoding="utf-8"))[:6]
+    questions_file = tmp_path / "questions.json"
+    questions_file.write_text(json.dumps(questions, ensure_ascii=False), encoding="utf-8")
+    context_file = tmp_path / "context.json"
+    build_context(questions, str(context_file))
+    return str(questions_file), str(context_file), str(tmp_path / "results.jsonl")
+
+
+def evaluate(questions_file, context_file, records_path, **kwargs):
+    evaluator = RAGEvaluator(LLM(provider="mock", model_name="mock-small", stage="evaluate_rag"))
+    return next(iter(evaluator.evaluate_models(questions_file, context_file, records_path=records_path, **kwargs).values()))
+
+
+def test_fast_run_after_a_full_run_on_the_same_records(rag_files):
+    questions_file, context_file, records_path = rag_files
+    full = evaluate(questions_file, context_file, records_path)
+
+    # Full-mode records must not count as done for fast mode, nor leave its questions without candidates
+    fast = evaluate(questions_file, context_file, records_path, fast=True)
+
+    assert full["total_questions"] == fast["total_questions"] == 6
+    assert all(result["llm_response"].startswith("{") for result in fast["results"])
+    assert not any(result["llm_response"].startswith("{") for result in full["results"])
+
+
+def test_same_model_name_under_two_providers_keeps_separate_records(tmp_path, monkeypatch, capsys):
+    class OtherMockAdapter(llm_providers.MockAdapter):
+        name = "other"
+
+    monkeypatch.setitem(llm_providers.PROVIDERS, "other", OtherMockAdapter())
+    monkeypatch.setenv("MOCK_LLM_CONFIG", json.dumps({"chat": {"latency": 0}}))
+    questions = json.loads(DATASET.read_text(encoding="utf-8"))[:3]
+    first, second = LLM("mock", "shared"), LLM("other", "shared")
+
+    summaries = run_evaluation(questions, [first, second], lambda index, question, answer_only: (question["question"], {}),
+                               records_path=str(tmp_path / "records.jsonl"), batch=True)
+
+    assert [summary["total_questions"] for summary in summaries.values()] == [3, 3]
+    assert len((tmp_path / "records.jsonl").read_text(encoding="utf-8").splitlines()) == 6
+    # Batch runs record no latencies
+    assert summaries["mock:shared"]["latency_s"] == {"p50": None, "p90": None, "p99": None}
+    print_summary(summaries)
+    assert "Latency: p50 n/a, p90 n/a, p99 n/a" in capsys.readouterr().out
+
+
+def test_resumed_fast_run_with_another_reasoning_sample_is_not_reused(rag_files):
+    questions_file, context_file, records_path = rag_files
+    answer_only = evaluate(questions_file, context_file, records_path, fast=True)
+
+    sampled = evaluate(questions_file, context_file, records_path, fast=True, reasoning_sample=1.0)
+
+    assert all(result["llm_response"].startswith("{") for result in answer_only["results"])
+    # Every question is sampled for reasoning now, so none of the answer-only records may be reused
+    assert not any(result["llm_response"].startswith("{") for result in sampled["results"])
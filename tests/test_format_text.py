@@ -0,0 +1,85 @@
+import json
+from pathlib import Path
+
+import pytest
+
+import format_text
+from llm_telemetry import get_default_telemetry
+
+SAMPLE_PDF = Path(__file__).resolve().parent.parent / "data" / "raw_small" / "2003.pdf"
+
+
+@pytest.fixture(scope="module")
+def parsed_text(tmp_path_factory):
+    """text.txt exactly as the pipeline's parse stage writes it."""
+    pytest.importorskip("pdfplumber")
+    if not SAMPLE_PDF.exists():
+        pytest.skip("sample PDF not available")
+    from parse_pdf import parse_pdf
+    output_dir = tmp_path_factory.mktemp("parsed")
+    return Path(parse_pdf(str(SAMPLE_PDF), str(output_dir), workers=1)["text_file"])
+
+
+def format_calls():
+    return sum(1 for entry in get_default_telemetry().records if entry["stage"] == "format")
+
+
+def test_local_parser_reads_parse_pdf_paragraphs(parsed_text):
+    text = "\n".join(parsed_text.read_text(encoding="utf-8").split("\n")[:-1])
+    questions, spans = format_text.parse_questions_locally(text)
+    assert len(questions) == 100
+    assert spans == []
+    # Page numbers at the end of each page are not glued to the last option
+    assert not any(option.rstrip(".").split()[-1].isdigit() for question in questions.values()
+                   for option in question["options"].values())
+
+
+@pytest.mark.parametrize("fast_path", [True, False])
+def test_clean_text_formats_parse_pdf_output(parsed_text, tmp_path, fast_path):
+    output = tmp_path / "questions.json"
+    calls = format_calls()
+    format_text.clean_text(str(parsed_text), str(output), provider="mock", model_name="mock-large", fast_path=fast_path)
+    questions = json.loads(output.read_text(encoding="utf-8"))
+    assert len(questions) >= 95
+    assert all(question["correct_answer"] in "abcd" for question in questions)
+    if fast_path:
+        assert format_calls() == calls
+    else:
+        assert format_calls() > calls
+
+
+def test_unrecognized_text_goes_to_the_llm():
+    questions, spans = format_text.parse_questions_locally("Texto sin preguntas numeradas")
+    assert questions == {}
+    assert spans == ["Texto sin preguntas numeradas"]
+
+
+def test_clean_text_fails_when_nothing_is_found(tmp_path):
+    source = tmp_path / "text.txt"
+    source.write_text("Texto sin preguntas numeradas\n1 a 2 b", encoding="utf-8")
+    with pytest.raises(ValueError):
+        format_text.clean_text(str(source), str(tmp_path / "questions.json"), provider="mock", model_name="mock-large")
+
+
+def test_chunks_of_parse_pdf_text_fit_the_budget(parsed_text):
+    text = "\n".join(parsed_text.read_text(encoding="utf-8").split("\n")[:-1])
+    chunks = format_text.split_text_at_questions(text, max_tokens=1000)
+    assert len(chunks) > 1
+    assert max(format_text.count_tokens(chunk) for chunk in chunks) <= 1000
+    # Whole questions: every question starts in exactly one chunk
+    ids = [int(match.group(1)) for chunk in chunks
+           for match in map(format_text.QUESTION_START_PATTERN.match, chunk.split("\n")) if match]
+    assert sorted(ids) == list(range(1, 101))
+
+
+def test_text_without_questions_is_cut_to_the_budget():
+    chunks = format_text.split_text_at_questions("palabra " * 5000, max_tokens=500)
+    assert len(chunks) > 1
+    assert max(format_text.count_tokens(chunk) for chunk in chunks) <= 500
+
+
+def test_numbers_inside_a_question_do_not_split_it():
+    text = "1) La cuantía de\n2.500 euros se refiere a:\na) Uno.\nb) Dos.\nc) Tres.\nd) Cuatro.\n2) Otra pregunta:\na) A.\nb) B.\nc) C.\nd) D."
+    chunks = format_text.split_text_at_questions(text, max_tokens=30)
+    assert chunks[0].startswith("1) La cuantía de\n2.500 euros")
+    assert not any(chunk.startswith("2.500") for chunk in chunks)
@@ -0,0 +1,113 @@
+import email
+import json
+import re
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from llm import LLM
+from llm_telemetry import Telemetry
+
+pytest.importorskip("mistralai")
+
+
+class BatchHandler(BaseHTTPRequestHandler):
+    """
+    Stand-in for Mistral's files and batch-job endpoints: jobs finish on the second poll, output
+    lines come back in reverse order, and prompts containing FAIL get a failed line.
+    """
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, body=None, raw=None):
+        data = raw if raw is not None else json.dumps(body).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream" if raw is not None else "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _job(self, job_id):
+        job = self.server.jobs[job_id]
+        done = job["polls"] >= 2
+        return {
+            "id": job_id, "object": "batch", "input_files": job["input_files"], "endpoint": "/v1/chat/completions",
+            "model": job["model"], "errors": [], "status": "SUCCESS" if done else "RUNNING", "created_at": 0,
+            "total_requests": job["total"], "completed_requests": job["total"] if done else 0,
+            "succeeded_requests": job["total"] - job["failed"] if done else 0,
+            "failed_requests": job["failed"] if done else 0,
+            "output_file": job["output_file"] if done else None, "metadata": {},
+        }
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path == "/v1/files":
+            message = email.message_from_bytes(b"Content-Type: " + self.headers["Content-Type"].encode() + b"\r\n\r\n" + body)
+            content = next(part for part in message.get_payload() if part.get_filename()).get_payload(decode=True)
+            file_id = str(uuid.uuid4())
+            self.server.files[file_id] = content
+            self._send({"id": file_id, "object": "file", "bytes": len(content), "created_at": 0, "filename": "batch.jsonl",
+                        "purpose": "batch", "sample_type": "batch_request", "source": "upload"})
+        elif self.path == "/v1/batch/jobs":
+            request = json.loads(body)
+            lines = [json.loads(line) for line in self.server.files[request["input_files"][0]].decode("utf-8").splitlines() if line]
+            self.server.submitted.extend(lines)
+            output = []
+            for line in reversed(lines):
+                prompt = line["body"]["messages"][0]["content"]
+                if "FAIL" in prompt:
+                    output.append({"custom_id": line["custom_id"], "response": {"status_code": 400, "body": {}}, "error": {"message": "bad"}})
+                else:
+                    output.append({"custom_id": line["custom_id"], "error": None, "response": {
+                        "status_code": 200, "body": {"choices": [{"message": {"content": f"answer to {prompt}"}}]}}})
+            output_file = str(uuid.uuid4())
+            self.server.files[output_file] = "".join(json.dumps(entry) + "\n" for entry in output).encode("utf-8")
+            job_id = str(uuid.uuid4())
+            self.server.jobs[job_id] = {"polls": 0, "input_files": request["input_files"], "model": request.get("model"),
+                                        "total": len(lines), "failed": sum("FAIL" in json.dumps(line) for line in lines),
+                                        "output_file": output_file}
+            self._send(self._job(job_id))
+        else:
+            self.send_response(404)
+            self.end_headers()
+
+    def do_GET(self):
+        match = re.match(r"/v1/batch/jobs/([^/?]+)", self.path)
+        if match:
+            self.server.jobs[match.group(1)]["polls"] += 1
+            return self._send(self._job(match.group(1)))
+        match = re.match(r"/v1/files/([^/?]+)/content", self.path)
+        if match:
+            return self._send(raw=self.server.files[match.group(1)])
+        self.send_response(404)
+        self.end_headers()
+
+
+@pytest.fixture
+def batch_server(monkeypatch):
+    monkeypatch.setenv("MISTRAL_API_KEY", "test-key")
+    server = ThreadingHTTPServer(("127.0.0.1", 0), BatchHandler)
+    server.files, server.jobs, server.submitted = {}, {}, []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address
+    yield server, f"http://{host}:{port}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_batch_results_are_mapped_back_by_custom_id(batch_server):
+    server, url = batch_server
+    telemetry = Telemetry()
+    llm = LLM("mistral", "mistral-small-latest", server_url=url, telemetry=telemetry)
+    prompts = ["uno", "dos", "FAIL tres", "dos", "cuatro"]
+
+    responses = llm.query_llm_many(prompts, batch=True, poll_interval=0)
+
+    assert responses == ["answer to uno", "answer to dos", None, "answer to dos", "answer to cuatro"]
+    # The repeated prompt shares one custom_id and is only sent once
+    assert sorted(line["body"]["messages"][0]["content"] for line in server.submitted) == ["FAIL tres", "cuatro", "dos", "uno"]
+    assert len({line["custom_id"] for line in server.submitted}) == 4
+    assert sum(entry["mode"] == "batch" and entry["error"] is not None for entry in telemetry.records) == 1
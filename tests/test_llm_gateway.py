@@ -0,0 +1,101 @@
+import http.client
+import json
+import threading
+
+import pytest
+
+import llm_gateway
+from adaptive_concurrency import get_retry_after, is_throttled
+from llm import LLM
+from llm_telemetry import Telemetry
+
+
+@pytest.fixture
+def gateway(monkeypatch):
+    """Gateway on a free local port, answering with the mock provider; yields (server, url, upstream telemetry)."""
+    def start(mock_config, **llm_kwargs):
+        monkeypatch.setenv("MOCK_LLM_CONFIG", json.dumps(mock_config))
+        telemetry = Telemetry()
+        server = llm_gateway.serve(port=0, telemetry=telemetry, backoff_base=0.001, **llm_kwargs)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        host, port = server.server_address
+        return server, f"http://{host}:{port}", telemetry
+
+    servers = []
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def post(url, body):
+    host, port = url.rsplit("/", 1)[-1].split(":")
+    connection = http.client.HTTPConnection(host, int(port), timeout=10)
+    connection.request("POST", "/v1/complete", body=body, headers={"Content-Type": "application/json"})
+    response = connection.getresponse()
+    return response.status, json.loads(response.read())
+
+
+def test_failing_requests_are_retried_by_the_gateway_only(gateway):
+    server, url, upstream = gateway({"chat": {"latency": 0, "error_rate": 1.0}, "error_status": 503}, max_retries=2)
+    client_telemetry = Telemetry()
+    llm = LLM("mock", "mock-small", gateway_url=url, telemetry=client_telemetry, backoff_base=0.001)
+
+    with pytest.raises(llm_gateway.GatewayError) as error:
+        llm.query_llm("¿Cuál es la capital de España?")
+
+    assert error.value.status_code == 503
+    # 1 + max_retries upstream attempts, and the client does not repeat them
+    assert [entry["retries"] for entry in upstream.records] == [2]
+    assert [entry["retries"] for entry in client_telemetry.records] == [0]
+    assert server.gateway.upstream_calls == 1
+
+
+@pytest.mark.parametrize("body", [
+    b"not json",
+    json.dumps({"model": "mock-small", "prompt": "hola"}).encode(),
+    json.dumps({"provider": "unknown", "model": "x", "prompt": "hola"}).encode(),
+    json.dumps(["mock", "mock-small", "hola"]).encode(),
+])
+def test_malformed_requests_are_rejected_with_400(gateway, body):
+    server, url, upstream = gateway({"chat": {"latency": 0}})
+
+    status, payload = post(url, body)
+
+    assert status == 400
+    assert payload["error"].startswith("malformed request")
+    assert server.gateway.upstream_calls == 0
+
+
+def test_identical_requests_in_flight_are_sent_upstream_once(gateway):
+    server, url, upstream = gateway({"chat": {"latency": 0.3, "sigma": 0.0}})
+    client = llm_gateway.get_gateway_client(url)
+    results = []
+
+    def ask():
+        results.append(client.complete("mock", "mock-dedup", "¿Qué artículo regula la Corona?", 100, 0.0))
+
+    threads = [threading.Thread(target=ask) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(results) == 5 and len(set(results)) == 1
+    assert server.gateway.upstream_calls == 1
+    assert server.gateway.deduplicated == 4
+    assert len(upstream.records) == 1
+
+
+def test_upstream_status_and_retry_after_are_passed_through(gateway):
+    server, url, upstream = gateway({"chat": {"latency": 0, "error_rate": 1.0}, "error_status": 429, "retry_after": 7},
+                                    max_retries=0)
+    client = llm_gateway.get_gateway_client(url)
+
+    with pytest.raises(llm_gateway.GatewayError) as error:
+        client.complete("mock", "mock-throttled", "hola", 100, 0.0)
+
+    assert error.value.status_code == 429
+    assert get_retry_after(error.value) == 7
+    assert is_throttled(error.value)